@@ -2,199 +2,607 @@
 """
 Flask API for EduSoft Grade Scraper
 Lightweight API to retrieve grades from EduSoft portal
+
+Routes live on the `api` blueprint; create_app() builds an app around it
+(see gunicorn.conf.py for serving with --preload) and `app` is the default
+instance for `python app.py`, `gunicorn app:app` and asgi.py.
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify
 from flask_cors import CORS
+import gc
+import importlib
 import sys
 import os
+import hmac
 import logging
-import re
+import math
+import time
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import the scraper class from script.py
-from script import EdusoftScraper
+# Import the scraper session pool (wraps EdusoftScraper from script.py)
+from session_pool import SessionPool, credential_key
+from script import GRADES, EdusoftScraper
+from result_cache import ResultCache, MemoryCacheBackend, SQLiteCacheBackend, SharedCacheBackend, cache_info
+from shared_store import default_shared_store
+from http_cache import IDENTITY, Representation, RepresentationCache, negotiate_encoding, not_modified, stamp_datetime
+from batch import ItemTimeout, run_batch
+from singleflight import SingleFlight
+from prefetch import (CHANGED, DEFAULT_EXAM_WINDOWS, LOGIN_FAILED, PORTAL_ERROR, SESSION_EXPIRED, UNCHANGED,
+                      CredentialVault, PrefetchScheduler, parse_exam_windows)
+from ratelimit import TokenBucket
+from projection import calculate_grade_projection, project_cohort
+from parse_pool import default_pool
+from parsers import EVENT_HEADERS, EVENT_ROW, EVENT_STUDENT_INFO, default_parser
+from changes import ChangeLog, diff_transcripts
+from transcript_store import COHORT_GROUPS, TranscriptStore
+from page_archive import SEGMENT_SIZE as ARCHIVE_SEGMENT_SIZE, PageArchive
+from upstream_guard import OPEN, UpstreamUnavailable, default_guard
+from login_form import default_login_form_cache
+import metrics
+from records import COLUMNAR_JSON_MIMETYPE, MSGPACK_MIMETYPE, Transcript, encode_msgpack, msgpack
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+api = Blueprint('api', __name__)
+
+# Serialized (and compressed) transcripts per cached result, for ETags and compressed responses
+representations = RepresentationCache(max_size=int(os.environ.get('RESULT_CACHE_SIZE', 1024)))
+
+# Cookie jars and parsed transcripts shared by all workers; set SHARED_STORE to enable
+shared_store = default_shared_store() if os.environ.get('SHARED_STORE') else None
+
+# Logged-in portal sessions reused across requests (per worker process,
+# resumable by the other workers through the shared store)
+session_pool = SessionPool(
+    max_size=int(os.environ.get('SESSION_POOL_SIZE', 256)),
+    ttl=float(os.environ.get('SESSION_POOL_TTL', 600)),
+    store=shared_store
+)
+
+# Parsed grades payloads, revalidated against the portal's last-updated stamp.
+# Set RESULT_CACHE_PATH to keep them in an SQLite file instead of memory;
+# otherwise they go to the shared store if there is one.
+_result_cache_size = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+_result_cache_path = os.environ.get('RESULT_CACHE_PATH')
+_result_cache_ttl = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+if _result_cache_path:
+    _result_cache_backend = SQLiteCacheBackend(_result_cache_path, max_size=_result_cache_size)
+elif shared_store is not None:
+    _result_cache_backend = SharedCacheBackend(shared_store, ttl=_result_cache_ttl)
+else:
+    _result_cache_backend = MemoryCacheBackend(max_size=_result_cache_size)
+result_cache = ResultCache(
+    backend=_result_cache_backend,
+    ttl=_result_cache_ttl,
+    fresh_for=float(os.environ.get('RESULT_CACHE_FRESH_FOR', 60))
+)
+
+# Persistent transcript store for analytics, written on every fresh parse.
+# Set TRANSCRIPT_STORE_PATH to enable it and TRANSCRIPT_STORE_TOKEN to open the /api/store queries.
+_transcript_store_path = os.environ.get('TRANSCRIPT_STORE_PATH')
+transcript_store = TranscriptStore(_transcript_store_path) if _transcript_store_path else None
+TRANSCRIPT_STORE_TOKEN = os.environ.get('TRANSCRIPT_STORE_TOKEN')
+
+# Raw portal pages, kept so they can be re-parsed later (see page_archive.py).
+# Set PAGE_ARCHIVE_DIR to enable it.
+_page_archive_dir = os.environ.get('PAGE_ARCHIVE_DIR')
+page_archive = PageArchive(
+    _page_archive_dir,
+    segment_size=int(os.environ.get('PAGE_ARCHIVE_SEGMENT_SIZE', ARCHIVE_SEGMENT_SIZE))
+) if _page_archive_dir else None
+
+# Concurrent /api/grades calls for the same credentials share one scrape
+grades_flight = SingleFlight()
+
+# Recent transcript deltas per student, for GET /api/grades/changes
+change_log = ChangeLog(
+    history=int(os.environ.get('GRADES_CHANGE_HISTORY', 50)),
+    max_students=_result_cache_size
+)
+# Server-Sent Events stream of deltas: portal poll interval, keep-alive, lifetime
+GRADES_STREAM_POLL = float(os.environ.get('GRADES_STREAM_POLL', 60))
+GRADES_STREAM_HEARTBEAT = float(os.environ.get('GRADES_STREAM_HEARTBEAT', 15))
+GRADES_STREAM_MAX_SECONDS = float(os.environ.get('GRADES_STREAM_MAX_SECONDS', 3600))
+
+# Limits for POST /api/grades/batch
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 100))
+BATCH_MAX_PARALLELISM = int(os.environ.get('BATCH_MAX_PARALLELISM', 8))
+BATCH_DEFAULT_TIMEOUT = float(os.environ.get('BATCH_DEFAULT_TIMEOUT', 60))
+BATCH_MAX_TIMEOUT = float(os.environ.get('BATCH_MAX_TIMEOUT', 300))
+
+# Pages POST /api/student/bundle can return
+BUNDLE_PAGES = tuple(EdusoftScraper.PAGES)
+
+# Maximum students per POST /api/projection request
+PROJECTION_MAX_SIZE = int(os.environ.get('PROJECTION_MAX_SIZE', 10000))
+
+metrics.register_gauge('itpm_session_pool_size', 'Logged-in portal sessions in the pool',
+                       lambda: session_pool.stats()['size'])
+metrics.register_counter('itpm_session_pool_hits_total', 'Requests served with a pooled portal session',
+                       lambda: session_pool.stats()['hits'])
+metrics.register_counter('itpm_session_pool_misses_total', 'Requests that had to log in to the portal',
+                       lambda: session_pool.stats()['misses'])
+metrics.register_counter('itpm_session_pool_shared_hits_total',
+                         'Requests that resumed a portal session shared by another worker',
+                         lambda: session_pool.stats()['shared_hits'])
+if shared_store is not None:
+    metrics.register_gauge('itpm_shared_store_bytes', 'Bytes of keys and values in the shared store',
+                           lambda: shared_store.stats()['bytes'])
+    metrics.register_gauge('itpm_shared_store_entries', 'Entries in the shared store',
+                           lambda: shared_store.stats()['entries'])
+    metrics.register_counter('itpm_shared_store_hits_total', 'Shared store lookups that found an entry',
+                             lambda: shared_store.hits)
+    metrics.register_counter('itpm_shared_store_misses_total', 'Shared store lookups that found nothing',
+                             lambda: shared_store.misses)
+metrics.register_counter('itpm_grades_representation_hits_total',
+                         'Grades responses that reused an already serialized transcript',
+                         lambda: representations.hits)
+metrics.register_gauge('itpm_grades_in_flight', 'Distinct accounts with a grades scrape in progress',
+                       grades_flight.in_flight)
+
+# Login form fields reused across logins, so most logins skip the login page GET
+login_form_cache = default_login_form_cache()
+metrics.register_counter('itpm_login_form_cache_hits_total', 'Logins that posted the cached login form',
+                         lambda: login_form_cache.hits)
+metrics.register_counter('itpm_login_form_cache_invalidations_total',
+                         'Cached login forms the portal rejected as stale', lambda: login_form_cache.invalidations)
+
+# Rate limit, adaptive concurrency limit and circuit breaker in front of the portal
+upstream_guard = default_guard()
+metrics.register_gauge('itpm_upstream_circuit_open', 'Whether the circuit breaker toward the portal is open',
+                       lambda: upstream_guard.is_open())
+metrics.register_gauge('itpm_upstream_concurrency_limit', 'Current adaptive limit on concurrent portal requests',
+                       lambda: int(upstream_guard.limit))
+metrics.register_gauge('itpm_upstream_in_flight', 'Portal requests in progress', upstream_guard.in_flight)
+metrics.register_counter('itpm_upstream_rejected_total', 'Portal requests refused by the upstream guard',
+                         lambda: upstream_guard.rejected)
+
+# Where grades pages are parsed (PARSE_EXECUTOR); process workers start in init_worker()
+parse_pool = default_pool()
+metrics.register_gauge('itpm_parse_in_flight', 'Grades page parses queued or running on the parse pool',
+                       parse_pool.in_flight)
+
+
+@api.before_app_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    g.profiler = metrics.start_profile()
+    metrics.start_request(request.headers.get('X-Request-Start'))
+
+
+@api.after_app_request
+def finish_request_timing(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    response.headers['Server-Timing'] = metrics.finish_request(
+        request.method, route, response.status_code, time.perf_counter() - started
+    )
+    metrics.finish_profile(g.pop('profiler', None), f'{request.method} {route}')
+    return response
+
+
+def attach_grade_projection(grades_data: dict):
+    """Calculate the grade projection and store it (or debug info) on grades_data"""
+    try:
+        with metrics.stage('projection'):
+            grade_projection = calculate_grade_projection(grades_data)
+        if grade_projection:
+            grades_data['grade_projection'] = grade_projection
+            logger.info(f"Grade projection calculated successfully: {grade_projection.get('current_classification')}")
+        else:
+            logger.warning("Grade projection calculation returned None - this may indicate extraction failed")
+            # Add a debug field to help troubleshoot
+            grades_data['grade_projection_debug'] = {
+                'message': 'Grade projection calculation failed',
+                'grades_count': len(grades_data.get('grades', [])),
+                'has_grades': bool(grades_data.get('grades'))
+            }
+    except Exception as e:
+        logger.error(f"Error in grade projection calculation: {str(e)}", exc_info=True)
+        grades_data['grade_projection_error'] = str(e)
 
-# Vietnamese university classification thresholds (4.0 scale)
-CLASSIFICATION_THRESHOLDS = {
-    'Xuất sắc': {'min': 3.6, 'max': 4.0, 'name_en': 'Excellent'},
-    'Giỏi': {'min': 3.2, 'max': 3.59, 'name_en': 'Very Good'},
-    'Khá': {'min': 2.5, 'max': 3.19, 'name_en': 'Good'},
-    'Trung bình': {'min': 2.0, 'max': 2.49, 'name_en': 'Average'},
-    'Yếu': {'min': 0.0, 'max': 1.99, 'name_en': 'Weak'}
-}
 
-def calculate_grade_projection(grades_data: dict) -> dict:
+def load_grades(username: str, password: str):
     """
-    Calculate grade projections based on current cGPA and credits.
+    Get parsed grades (with projection) for a student, using the result cache.
     
-    Args:
-        grades_data: Dictionary containing grades data with 'grades' list
+    Concurrent calls for the same credentials share one upstream scrape.
+    Returns a (grades_data, cache) tuple where grades_data is None if the
+    login failed and cache describes how the result was served.
+    """
+    key = credential_key(username, password)
+    entry = result_cache.get(key)
+    if entry is not None and (result_cache.is_fresh(entry) or prefetcher.covers(key, entry.checked_at)):
+        return entry.payload, cache_info('hit', entry)
     
-    Returns:
-        Dictionary with projection information including:
-        - current_classification: Current degree classification
-        - current_cgpa: Current cumulative GPA (4.0 scale)
-        - total_credits: Total credits accumulated
-        - projections: Projections for each classification level
+    (grades_data, cache), shared = grades_flight.do(key, refresh_grades, username, password, key, entry)
+    if shared:
+        cache = dict(cache, coalesced=True)
+    return grades_data, cache
+
+
+def refresh_grades(username: str, password: Optional[str], key: str, entry):
+    """
+    Fetch the grades page and parse it unless the cached entry is still current.
+    
+    Without a password only the session already pooled under key is used
+    (prefetch subscriptions that don't store credentials). While the upstream
+    guard refuses portal requests the cached entry is served as stale.
     """
     try:
-        grades = grades_data.get('grades', [])
-        
-        if not grades:
-            logger.warning("No grades found in grades_data")
-            return None
-        
-        # Extract current cGPA (latest "Điểm trung bình tích lũy (hệ 4)" value)
-        current_cgpa = None
-        total_credits = None
-        
-        # Iterate through grades to find the latest cumulative data
-        for grade in reversed(grades):
-            stt_value = grade.get('STT', '')
-            
-            # Extract cGPA from "Điểm trung bình tích lũy (hệ 4):X.XX"
-            if 'Điểm trung bình tích lũy (hệ 4)' in stt_value and current_cgpa is None:
-                # Match number after colon (handle both with and without space)
-                # Try multiple patterns to be robust
-                patterns = [
-                    r':\s*(\d+\.?\d*)',  # Standard pattern
-                    r':(\d+\.?\d*)',     # No space after colon
-                    r'(\d+\.?\d*)'       # Just the number
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, stt_value)
-                    if match:
-                        try:
-                            current_cgpa = float(match.group(1))
-                            logger.info(f"Extracted cGPA: {current_cgpa} from '{stt_value}'")
-                            break
-                        except ValueError:
-                            logger.error(f"Failed to convert cGPA to float: {match.group(1)}")
-            
-            # Extract total credits from "Số tín chỉ tích lũy:XXX"
-            if 'Số tín chỉ tích lũy' in stt_value and total_credits is None:
-                # Match number after colon (handle both with and without space)
-                # Try multiple patterns to be robust
-                patterns = [
-                    r':\s*(\d+)',        # Standard pattern
-                    r':(\d+)',           # No space after colon
-                    r'(\d+)'             # Just the number
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, stt_value)
-                    if match:
-                        try:
-                            total_credits = int(match.group(1))
-                            logger.info(f"Extracted total credits: {total_credits} from '{stt_value}'")
-                            break
-                        except ValueError:
-                            logger.error(f"Failed to convert credits to int: {match.group(1)}")
-            
-            # Break if we found both
-            if current_cgpa is not None and total_credits is not None:
-                break
-        
-        if current_cgpa is None or total_credits is None:
-            logger.warning(f"Failed to extract required data - cGPA: {current_cgpa}, total_credits: {total_credits}")
+        if password is None:
+            page = session_pool.get_pooled_grades_page(key)
+        else:
+            page = session_pool.get_grades_page(username, password)
+    except UpstreamUnavailable as e:
+        logger.warning(f"Portal request refused: {e}")
+        return unavailable_result(entry, e)
+    if page is None:
+        return None, cache_info('miss')
+    return grades_from_page(*page, username, key, entry)
+
+
+def grades_from_page(scraper, html: str, username: str, key: str, entry):
+    """refresh_grades() for a grades page already fetched: revalidate it against entry or parse and cache it"""
+    if not html:
+        # Portal error: fall back to the last known result if we have one
+        if entry is not None:
+            return entry.payload, cache_info('stale', entry, stale=True)
+        return {}, cache_info('miss')
+    
+    # Unchanged last-updated stamp: skip parsing and projection entirely
+    last_updated = scraper.get_last_updated(html)
+    if entry is not None and last_updated and last_updated == entry.last_updated:
+        result_cache.touch(key, entry)
+        return entry.payload, cache_info('revalidated', entry)
+    
+    archive_page(username, GRADES, html)
+    grades_data = scraper.parse_grades(html)
+    if grades_data.get('grades'):
+        attach_grade_projection(grades_data)
+    if grades_data.get('student_info') or grades_data.get('grades'):
+        entry = store_grades(key, entry, last_updated, grades_data)
+        return grades_data, cache_info('miss', entry)
+    return grades_data, cache_info('miss')
+
+
+def unavailable_result(entry, error: UpstreamUnavailable):
+    """load_grades result when the portal can't be asked: the stale entry if there is one"""
+    if entry is not None:
+        return entry.payload, cache_info('stale', entry, stale=True)
+    return {}, dict(cache_info('unavailable'), retry_after=max(1, round(error.retry_after)))
+
+
+def store_grades(key: str, previous, last_updated: str, grades_data: dict):
+    """Cache a freshly parsed payload and log what changed since the previous one"""
+    if previous is not None:
+        delta = diff_transcripts(previous.payload, grades_data)
+        if delta:
+            change_log.append(key, delta)
+    if transcript_store is not None:
+        try:
+            with metrics.stage('store'):
+                transcript_store.upsert(grades_data)
+        except Exception as e:
+            logger.error(f"Error writing transcript store: {str(e)}", exc_info=True)
+    return result_cache.set(key, last_updated, grades_data)
+
+
+def archive_page(username: str, page: str, html: str):
+    """Keep a fetched portal page in the page archive, if there is one"""
+    if page_archive is not None:
+        try:
+            with metrics.stage('archive'):
+                page_archive.put(username, page, html)
+        except Exception as e:
+            logger.error(f"Error writing page archive: {str(e)}", exc_info=True)
+
+
+def prefetch_grades(username: str, password: Optional[str], key: str) -> str:
+    """One background refresh for a prefetch subscription"""
+    (grades_data, cache), _ = grades_flight.do(
+        key, refresh_grades, username, password, key, result_cache.get(key)
+    )
+    if grades_data is None:
+        return LOGIN_FAILED if password is not None else SESSION_EXPIRED
+    if cache['status'] == 'revalidated':
+        return UNCHANGED
+    if cache['status'] == 'stale' or not grades_data:
+        return PORTAL_ERROR
+    return CHANGED
+
+
+# Background refresh of subscribed students, see POST /api/subscriptions.
+# Intervals stay below the result cache TTL so prefetched entries never expire.
+prefetcher = PrefetchScheduler(
+    refresh=prefetch_grades,
+    vault=CredentialVault(os.environ.get('PREFETCH_SECRET_KEY')),
+    limiter=TokenBucket(
+        rate=float(os.environ.get('PREFETCH_RATE', 1)),
+        burst=float(os.environ.get('PREFETCH_BURST', 5))
+    ),
+    workers=int(os.environ.get('PREFETCH_WORKERS', 4)),
+    interval=float(os.environ.get('PREFETCH_INTERVAL', 900)),
+    exam_interval=float(os.environ.get('PREFETCH_EXAM_INTERVAL', 120)),
+    max_interval=min(float(os.environ.get('PREFETCH_MAX_INTERVAL', 3600)), result_cache.ttl * 0.9),
+    exam_windows=parse_exam_windows(os.environ.get('PREFETCH_EXAM_WINDOWS', DEFAULT_EXAM_WINDOWS)),
+    session_ttl=session_pool.ttl,
+    max_subscriptions=int(os.environ.get('PREFETCH_MAX_SUBSCRIPTIONS', 1000))
+)
+metrics.register_gauge('itpm_prefetch_subscriptions', 'Students whose grades are prefetched in the background',
+                       lambda: prefetcher.stats()['subscriptions'])
+metrics.register_counter('itpm_prefetch_refreshes_total', 'Background grade refreshes completed',
+                         lambda: prefetcher.refreshes)
+
+
+def grades_response(grades_data, cache: dict):
+    """Build the /api/grades response body and status code for a load_grades result"""
+    if grades_data is None:
+        return {
+            'success': False,
+            'message': 'Login failed. Please check your credentials.'
+        }, 401
+    
+    # Log for debugging
+    logger.info(f"Grades data received: {bool(grades_data)}")
+    if grades_data:
+        logger.info(f"Student info keys: {list(grades_data.get('student_info', {}).keys())}")
+        logger.info(f"Number of grades: {len(grades_data.get('grades', []))}")
+    
+    if cache.get('status') == 'unavailable':
+        return {
+            'success': False,
+            'message': 'The EduSoft portal is unavailable right now. Please try again later.'
+        }, 503
+    
+    # Check if we got any data at all
+    if not grades_data:
+        return {
+            'success': False,
+            'message': 'Failed to retrieve grades data from the server'
+        }, 500
+    
+    # Check if we have student info but no grades (might be valid - student might not have grades yet)
+    if grades_data.get('student_info') and not grades_data.get('grades'):
+        return {
+            'success': True,
+            'data': grades_data,
+            'cache': cache,
+            'message': 'Student information retrieved, but no grades found. This might be normal if the student has no grades yet.'
+        }, 200
+    
+    # Check if we have neither student info nor grades
+    if not grades_data.get('student_info') and not grades_data.get('grades'):
+        return {
+            'success': False,
+            'data': grades_data,  # Return what we got for debugging
+            'message': 'Failed to parse student information and grades. The page structure might have changed.'
+        }, 500
+    
+    return {
+        'success': True,
+        'data': grades_data,
+        'cache': cache,
+        'message': 'Grades retrieved successfully'
+    }, 200
+
+
+# Wire formats for /api/grades: ?format= value -> mimetype
+GRADES_FORMATS = {
+    'json': 'application/json',
+    'columnar': COLUMNAR_JSON_MIMETYPE,
+    'msgpack': MSGPACK_MIMETYPE
+}
+# /api/grades?stream=1
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# How `"data": null` serializes per wire format, and the key part that stays
+# when the serialized transcript is spliced in its place
+ENVELOPE_DATA_MARKERS = {
+    'json': (b'"data":null', b'"data":'),
+    'columnar': (b'"data":null', b'"data":'),
+    'msgpack': (b'\xa4data\xc0', b'\xa4data')
+}
+
+
+def negotiate_grades_format():
+    """Pick the /api/grades wire format from ?format= or the Accept header; None if unavailable"""
+    requested = request.args.get('format')
+    if requested:
+        if requested not in GRADES_FORMATS or (requested == 'msgpack' and msgpack is None):
             return None
+        return requested
+    
+    offered = [GRADES_FORMATS['json'], GRADES_FORMATS['columnar']]
+    if msgpack is not None:
+        offered.append(GRADES_FORMATS['msgpack'])
+    best = request.accept_mimetypes.best_match(offered, default=GRADES_FORMATS['json'])
+    return next(name for name, mimetype in GRADES_FORMATS.items() if mimetype == best)
+
+
+def render_grades(body: dict, status: int, fmt: str, key: Optional[str] = None):
+    """
+    Serialize an /api/grades response body in the negotiated wire format.
+    Transcripts go through render_transcript(); key is their result cache key.
+    """
+    if body.get('success') and body.get('data'):
+        return render_transcript(body, status, fmt, key)
+    with metrics.stage('serialize'):
+        if fmt == 'json':
+            response = jsonify(body)
+        elif fmt == 'msgpack':
+            response = Response(encode_msgpack(body), mimetype=MSGPACK_MIMETYPE)
+        else:
+            response = Response(current_app.json.dumps(body), mimetype=COLUMNAR_JSON_MIMETYPE)
+    response.status_code = status
+    response.vary.add('Accept')
+    return response
+
+
+def render_transcript(body: dict, status: int, fmt: str, key: Optional[str]):
+    """
+    render_grades() for a body with a transcript: with ETag and Last-Modified
+    validators, a 304 if the request's validators match, and compressed as
+    Accept-Encoding allows (see http_cache.py). The serialized transcript is
+    reused while the result's last-updated stamp stays the same.
+    """
+    data = body['data']
+    stamp = data.get('last_updated') or ''
+    with metrics.stage('serialize'):
+        representation = representations.get(key, fmt, stamp) if key and stamp else None
+        if representation is None:
+            if fmt != 'json':
+                data = Transcript.from_payload(data).to_columnar()
+            representation = Representation(serialize_grades(data, fmt), fmt)
+            if key and stamp:
+                representations.set(key, fmt, stamp, representation)
         
-        # Determine current classification
-        current_classification = None
-        current_classification_en = None
-        for class_name, thresholds in CLASSIFICATION_THRESHOLDS.items():
-            if thresholds['min'] <= current_cgpa <= thresholds['max']:
-                current_classification = class_name
-                current_classification_en = thresholds['name_en']
-                break
-        
-        # Calculate projections for each classification
-        # Assume typical program has ~140 credits total
-        # Adjust based on actual program requirements if known
-        typical_total_credits = 140
-        remaining_credits = max(0, typical_total_credits - total_credits)
-        
-        total_grade_points = current_cgpa * total_credits
-        projections = {}
-        
-        for class_name, thresholds in CLASSIFICATION_THRESHOLDS.items():
-            target_gpa = thresholds['min']
-            target_name_en = thresholds['name_en']
-            
-            # Calculate required total grade points for target classification
-            if remaining_credits > 0:
-                required_total_points = target_gpa * (total_credits + remaining_credits)
-                additional_points_needed = required_total_points - total_grade_points
-                required_gpa_remaining = additional_points_needed / remaining_credits
-                
-                # Clamp to prevent negative values (but allow > 4.0 to show impossibility)
-                required_gpa_remaining = max(0.0, required_gpa_remaining)
-                
-                # Determine status
-                if class_name == current_classification:
-                    status = 'current'
-                elif target_gpa > current_cgpa:
-                    status = 'higher'
+        last_modified = stamp_datetime(stamp)
+        if not_modified(request, representation.etag, last_modified):
+            response = Response(status=304)
+        else:
+            marker, value_marker = ENVELOPE_DATA_MARKERS[fmt]
+            head, tail = serialize_grades(dict(body, data=None), fmt).split(marker, 1)
+            if fmt == 'json':
+                # jsonify() ends the body with a newline
+                tail += b'\n'
+            encoded, encoding = representation.body(head + value_marker, tail,
+                                                    negotiate_encoding(request.accept_encodings))
+            response = Response(encoded, status=status, mimetype=GRADES_FORMATS[fmt])
+            if encoding != IDENTITY:
+                response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(representation.etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Personal data: no shared caches, and clients revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def serialize_grades(body: dict, fmt: str) -> bytes:
+    """A body (or just its data) in a wire format; JSON is compact, as jsonify() writes it"""
+    if fmt == 'msgpack':
+        return encode_msgpack(body)
+    return current_app.json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+
+def cached_grade_events(payload: dict, skip_student_info: bool = False):
+    """Replay a cached payload as the events EdusoftScraper.stream_grades() yields"""
+    if not skip_student_info:
+        yield EVENT_STUDENT_INFO, payload.get('student_info') or {}
+    grades = payload.get('grades') or []
+    if grades:
+        yield EVENT_HEADERS, list(grades[0])
+    for grade in grades:
+        yield EVENT_ROW, grade
+    yield 'grades', payload
+
+
+def stream_grades_response(username: str, password: str):
+    """
+    /api/grades?stream=1: the transcript as NDJSON, one line per event as the
+    grades page downloads and parses. Lines are {"type": ..., "data": ...}
+    with types student_info, headers, row (one per transcript row), then a
+    final summary (semesters, cumulative, projection and cache info) or error.
+
+    Cache hits are replayed in the same format. A fresh parse is cached as
+    usual, but streamed requests don't share a scrape with concurrent ones.
+    """
+    key = credential_key(username, password)
+    entry = result_cache.get(key)
+    if entry is not None and (result_cache.is_fresh(entry) or prefetcher.covers(key, entry.checked_at)):
+        events, cache = cached_grade_events(entry.payload), cache_info('hit', entry)
+    else:
+        try:
+            events, cache = session_pool.stream_grades(username, password), None
+        except UpstreamUnavailable as e:
+            logger.warning(f"Portal request refused: {e}")
+            if entry is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'The EduSoft portal is unavailable right now. Please try again later.'
+                }), 503
+            events, cache = cached_grade_events(entry.payload), cache_info('stale', entry, stale=True)
+        if events is None:
+            return jsonify({
+                'success': False,
+                'message': 'Login failed. Please check your credentials.'
+            }), 401
+
+    dumps = current_app.json.dumps
+
+    def line(kind: str, **fields) -> str:
+        return dumps(dict(fields, type=kind)) + '\n'
+
+    def generate(events, cache):
+        sent_info = sent_rows = False
+        for kind, value in events:
+            if kind == 'error':
+                # Portal error before any rows: fall back to the last known result
+                if entry is not None and not sent_rows:
+                    yield from generate(cached_grade_events(entry.payload, sent_info),
+                                        cache_info('stale', entry, stale=True))
                 else:
-                    status = 'lower'
-                
-                projections[class_name] = {
-                    'classification_en': target_name_en,
-                    'target_min_gpa': target_gpa,
-                    'required_gpa_remaining': round(required_gpa_remaining, 2),
-                    'remaining_credits': remaining_credits,
-                    'achievable': required_gpa_remaining <= 4.0,
-                    'status': status
-                }
-            else:
-                # No remaining credits - can't change classification
-                # Determine status
-                if class_name == current_classification:
-                    status = 'current'
-                elif target_gpa > current_cgpa:
-                    status = 'higher'
+                    yield line('error', message=value)
+                return
+            if kind != 'grades':
+                sent_info = sent_info or kind == EVENT_STUDENT_INFO
+                sent_rows = sent_rows or kind == EVENT_ROW
+                yield line(kind, data=value)
+                continue
+
+            grades_data = value
+            if cache is None:
+                last_updated = grades_data.get('last_updated', '')
+                if entry is not None and last_updated and last_updated == entry.last_updated:
+                    result_cache.touch(key, entry)
+                    grades_data, cache = entry.payload, cache_info('revalidated', entry)
                 else:
-                    status = 'lower'
-                
-                projections[class_name] = {
-                    'classification_en': target_name_en,
-                    'target_min_gpa': target_gpa,
-                    'required_gpa_remaining': None,
-                    'remaining_credits': 0,
-                    'achievable': class_name == current_classification,
-                    'status': status
-                }
-        
-        return {
-            'current_classification': current_classification,
-            'current_classification_en': current_classification_en,
-            'current_cgpa': round(current_cgpa, 2),
-            'total_credits': total_credits,
-            'remaining_credits': remaining_credits,
-            'projections': projections
-        }
-        
-    except Exception as e:
-        logger.error(f"Error calculating grade projection: {str(e)}", exc_info=True)
-        return None
+                    if grades_data.get('grades'):
+                        attach_grade_projection(grades_data)
+                    if grades_data.get('student_info') or grades_data.get('grades'):
+                        cache = cache_info('miss', store_grades(key, entry, last_updated, grades_data))
+                    else:
+                        yield line('error', message='Failed to parse student information and grades. '
+                                                    'The page structure might have changed.')
+                        return
+            summary = {field: grades_data.get(field) for field in ('last_updated', 'semesters', 'cumulative')}
+            if grades_data.get('grade_projection'):
+                summary['grade_projection'] = grades_data['grade_projection']
+            yield line('summary', data=summary, cache=cache)
+
+    response = Response(generate(events, cache), mimetype=NDJSON_MIMETYPE)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let a reverse proxy buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 
 # Health check endpoint
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, with the state of the upstream guard"""
+    upstream = upstream_guard.stats()
     return jsonify({
-        'status': 'healthy',
-        'service': 'EduSoft Grade Scraper API'
+        'status': 'degraded' if upstream['circuit'] == OPEN else 'healthy',
+        'service': 'EduSoft Grade Scraper API',
+        'upstream': upstream
     }), 200
 
 
-@app.route('/api/grades', methods=['POST'])
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics: per-stage and per-route latency histograms, pool gauges"""
+    return Response(metrics.registry.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@api.route('/api/grades', methods=['POST'])
 def get_grades():
     """
     Retrieve grades from EduSoft portal
@@ -215,8 +623,19 @@ def get_grades():
         },
         "message": "..."
     }
+    
+    With ?stream=1 the transcript is streamed as NDJSON instead, see
+    stream_grades_response().
     """
     try:
+        streaming = request.args.get('stream') in ('1', 'true')
+        fmt = 'json' if streaming else negotiate_grades_format()
+        if fmt is None:
+            return jsonify({
+                'success': False,
+                'message': 'Unsupported format. Use json, columnar or (with msgpack installed) msgpack.'
+            }), 406
+        
         # Get JSON data from request
         data = request.get_json()
         
@@ -236,83 +655,307 @@ def get_grades():
                 'message': 'Username and password are required'
             }), 400
         
-        # Create scraper instance
-        scraper = EdusoftScraper()
-        
-        # Login
-        login_success = scraper.login(username, password)
-        
-        if not login_success:
-            return jsonify({
-                'success': False,
-                'message': 'Login failed. Please check your credentials.'
-            }), 401
-        
-        # Get grades
-        grades_data = scraper.get_grades()
-        
-        # Log for debugging
-        logger.info(f"Grades data received: {bool(grades_data)}")
-        if grades_data:
-            logger.info(f"Student info keys: {list(grades_data.get('student_info', {}).keys())}")
-            logger.info(f"Number of grades: {len(grades_data.get('grades', []))}")
-        
-        # Check if we got any data at all
-        if not grades_data:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to retrieve grades data from the server'
-            }), 500
+        if streaming:
+            return stream_grades_response(username, password)
         
-        # Check if we have student info but no grades (might be valid - student might not have grades yet)
-        if grades_data.get('student_info') and not grades_data.get('grades'):
-            return jsonify({
-                'success': True,
-                'data': grades_data,
-                'message': 'Student information retrieved, but no grades found. This might be normal if the student has no grades yet.'
-            }), 200
+        # Get grades from the cache or over a pooled session (logs in only when needed)
+        grades_data, cache = load_grades(username, password)
         
-        # Check if we have neither student info nor grades
-        if not grades_data.get('student_info') and not grades_data.get('grades'):
-            return jsonify({
-                'success': False,
-                'data': grades_data,  # Return what we got for debugging
-                'message': 'Failed to parse student information and grades. The page structure might have changed.'
-            }), 500
+        body, status = grades_response(grades_data, cache)
+        response = render_grades(body, status, fmt, key=credential_key(username, password))
+        if status == 503:
+            response.headers['Retry-After'] = str(cache['retry_after'])
+        return response
         
-        # Calculate grade projection
-        try:
-            grade_projection = calculate_grade_projection(grades_data)
-            if grade_projection:
-                grades_data['grade_projection'] = grade_projection
-                logger.info(f"Grade projection calculated successfully: {grade_projection.get('current_classification')}")
-            else:
-                logger.warning("Grade projection calculation returned None - this may indicate extraction failed")
-                # Add a debug field to help troubleshoot
-                grades_data['grade_projection_debug'] = {
-                    'message': 'Grade projection calculation failed',
-                    'grades_count': len(grades_data.get('grades', [])),
-                    'has_grades': bool(grades_data.get('grades'))
-                }
-        except Exception as e:
-            logger.error(f"Error in grade projection calculation: {str(e)}", exc_info=True)
-            grades_data['grade_projection_error'] = str(e)
+    except Exception as e:
+        logger.error(f"Error in get_grades: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'An error occurred: {str(e)}'
+        }), 500
+
+
+def basic_auth_credentials():
+    """(username, password) from an HTTP Basic Authorization header, or None"""
+    auth = request.authorization
+    if auth is None or auth.type != 'basic' or not auth.username or not auth.password:
+        return None
+    return auth.username, auth.password
+
+
+def basic_auth_required(message: str):
+    response = jsonify({
+        'success': False,
+        'message': message
+    })
+    response.status_code = 401
+    response.headers['WWW-Authenticate'] = 'Basic realm="ITPM grades"'
+    return response
+
+
+@api.route('/api/grades/changes', methods=['GET'])
+def get_grade_changes():
+    """
+    Transcript changes since a cursor, instead of the full transcript
+    
+    Credentials go in an HTTP Basic Authorization header. Query parameters:
+        since: cursor from a previous response (default 0, all retained changes)
+    
+    Returns:
+    {
+        "success": true,
+        "data": {
+            "cursor": "9f2c41d0-3",   (pass as ?since= next time)
+            "changes": [...],         (deltas newer than since, oldest first)
+            "reset": false            (true: history doesn't reach back to since, refetch /api/grades)
+        },
+        "cache": {...}
+    }
+    """
+    credentials = basic_auth_credentials()
+    if credentials is None:
+        return basic_auth_required('Basic authentication with username and password is required')
+    
+    since = request.args.get('since', '0')
+    try:
+        change_log.parse_cursor(since)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'since must be a cursor from a previous response'
+        }), 400
+    
+    try:
+        # Refresh from the portal (subject to the result cache) so new changes are logged
+        grades_data, cache = load_grades(*credentials)
+        if grades_data is None:
+            return basic_auth_required('Login failed. Please check your credentials.')
         
+        changes, cursor, reset = change_log.since(credential_key(*credentials), since)
         return jsonify({
             'success': True,
-            'data': grades_data,
-            'message': 'Grades retrieved successfully'
+            'data': {
+                'cursor': cursor,
+                'changes': changes,
+                'reset': reset
+            },
+            'cache': cache
         }), 200
         
     except Exception as e:
-        logger.error(f"Error in get_grades: {str(e)}", exc_info=True)
+        logger.error(f"Error in get_grade_changes: {str(e)}", exc_info=True)
         return jsonify({
             'success': False,
             'message': f'An error occurred: {str(e)}'
         }), 500
 
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/grades/changes/stream', methods=['GET'])
+def stream_grade_changes():
+    """
+    Server-Sent Events stream of transcript changes
+    
+    Same Basic authentication as /api/grades/changes. Resumes after the
+    Last-Event-ID header (or ?since=); without either only new changes are
+    sent. Each `change` event carries one delta with its cursor as the event
+    id; a `reset` event means the history no longer reaches back to the
+    cursor and the client should refetch /api/grades. The portal is polled
+    every GRADES_STREAM_POLL seconds (subject to the result cache) and the
+    stream ends after GRADES_STREAM_MAX_SECONDS; EventSource reconnects.
+    """
+    credentials = basic_auth_credentials()
+    if credentials is None:
+        return basic_auth_required('Basic authentication with username and password is required')
+    
+    grades_data, _ = load_grades(*credentials)
+    if grades_data is None:
+        return basic_auth_required('Login failed. Please check your credentials.')
+    
+    key = credential_key(*credentials)
+    resume = request.headers.get('Last-Event-ID') or request.args.get('since')
+    cursor = change_log.cursor(key)
+    if resume:
+        try:
+            change_log.parse_cursor(resume)
+            # A cursor from another worker or process gets a reset event first
+            cursor = resume
+        except ValueError:
+            pass
+    dumps = current_app.json.dumps
+    
+    def generate(cursor: str):
+        started = time.monotonic()
+        next_poll = started + GRADES_STREAM_POLL
+        yield 'retry: 5000\n\n'
+        while time.monotonic() - started < GRADES_STREAM_MAX_SECONDS:
+            now = time.monotonic()
+            if now >= next_poll:
+                if load_grades(*credentials)[0] is None:
+                    yield 'event: error\ndata: {"message": "Login failed"}\n\n'
+                    return
+                next_poll = now + GRADES_STREAM_POLL
+            
+            timeout = max(0.0, min(GRADES_STREAM_HEARTBEAT, next_poll - time.monotonic()))
+            changes, latest, reset = change_log.wait(key, cursor, timeout)
+            if reset:
+                cursor = latest
+                yield f'id: {cursor}\nevent: reset\ndata: {dumps({"cursor": cursor})}\n\n'
+            for change in changes:
+                cursor = change['id']
+                yield f'id: {cursor}\nevent: change\ndata: {dumps(change)}\n\n'
+            if not reset and not changes:
+                yield ': keep-alive\n\n'
+    
+    response = Response(generate(cursor), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let a reverse proxy buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api.route('/api/grades/batch', methods=['POST'])
+def get_grades_batch():
+    """
+    Retrieve grades for many students in one call
+    
+    Request body (JSON):
+    {
+        "students": [
+            {"username": "ITITIU22177", "password": "your_password"},
+            ...
+        ],
+        "parallelism": 4,   (optional, at least 1, capped by BATCH_MAX_PARALLELISM)
+        "timeout": 30       (optional, seconds per student, at most BATCH_MAX_TIMEOUT)
+    }
+    
+    Returns NDJSON, one line per student in completion order:
+    {"index": 0, "username": "...", "status": 200, "success": true, "data": {...}, "cache": {...}, "message": "..."}
+    Failed lines carry "success": false and an "error" message.
+    """
+    data = request.get_json(silent=True)
+    students = data.get('students') if isinstance(data, dict) else None
+    
+    if not isinstance(students, list) or not students:
+        return jsonify({
+            'success': False,
+            'message': 'A non-empty "students" list is required'
+        }), 400
+    
+    if len(students) > BATCH_MAX_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'At most {BATCH_MAX_SIZE} students per batch'
+        }), 400
+    
+    try:
+        parallelism = int(data.get('parallelism', BATCH_MAX_PARALLELISM))
+        timeout = float(data.get('timeout', BATCH_DEFAULT_TIMEOUT))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({
+            'success': False,
+            'message': '"parallelism" and "timeout" must be numbers'
+        }), 400
+    
+    # NaN, infinite or non-positive timeouts would spin or fail run_batch() mid-response
+    if parallelism < 1 or not (math.isfinite(timeout) and 0 < timeout <= BATCH_MAX_TIMEOUT):
+        return jsonify({
+            'success': False,
+            'message': f'"parallelism" must be at least 1 and "timeout" between 0 and {BATCH_MAX_TIMEOUT:g} seconds'
+        }), 400
+    parallelism = min(parallelism, BATCH_MAX_PARALLELISM)
+    
+    def fetch(student):
+        username = student.get('username') if isinstance(student, dict) else None
+        password = student.get('password') if isinstance(student, dict) else None
+        if not username or not password:
+            return {
+                'success': False,
+                'message': 'Username and password are required'
+            }, 400
+        return grades_response(*load_grades(username, password))
+    
+    dumps = current_app.json.dumps
+    
+    def generate():
+        for index, result, error in run_batch(students, fetch, parallelism, timeout):
+            student = students[index]
+            line = {
+                'index': index,
+                'username': student.get('username') if isinstance(student, dict) else None
+            }
+            if error is not None:
+                logger.warning(f"Batch item {index} failed: {error}")
+                status = 504 if isinstance(error, ItemTimeout) else 500
+                line.update({'status': status, 'success': False, 'error': str(error)})
+            else:
+                body, status = result
+                line.update(body, status=status)
+                if not body.get('success'):
+                    line['error'] = body.get('message')
+            yield dumps(line) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@api.route('/api/projection', methods=['POST'])
+def get_projection():
+    """
+    Project degree classifications from known cGPA and credits (no portal access)
+    
+    Request body (JSON):
+    {
+        "students": [
+            {
+                "cgpa": 3.1,
+                "credits": 90,
+                "program_credits": 140,   (optional, default 140)
+                "what_if": [              (optional upcoming course results)
+                    {"credits": 4, "grade": "A"},
+                    {"credits": 3, "points": 3.3}
+                ]
+            },
+            ...
+        ]
+    }
+    
+    Returns:
+    {
+        "success": true,
+        "data": {"projections": [...]},   (one grade_projection per student, in order)
+        "message": "..."
+    }
+    """
+    data = request.get_json(silent=True)
+    students = data.get('students') if isinstance(data, dict) else None
+    
+    if not isinstance(students, list) or not students:
+        return jsonify({
+            'success': False,
+            'message': 'A non-empty "students" list is required'
+        }), 400
+    
+    if len(students) > PROJECTION_MAX_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'At most {PROJECTION_MAX_SIZE} students per request'
+        }), 400
+    
+    try:
+        projections = project_cohort(students)
+    except (KeyError, TypeError, ValueError, OverflowError, AttributeError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid student data: {str(e)}'
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'data': {'projections': projections},
+        'message': 'Projections calculated successfully'
+    }), 200
+
+
+@api.route('/api/login', methods=['POST'])
 def login():
     """
     Test login endpoint (doesn't return grades, just verifies credentials)
@@ -347,10 +990,18 @@ def login():
                 'message': 'Username and password are required'
             }), 400
         
-        scraper = EdusoftScraper()
-        login_success = scraper.login(username, password)
+        try:
+            verified = session_pool.verify(username, password)
+        except UpstreamUnavailable as e:
+            response = jsonify({
+                'success': False,
+                'message': 'The EduSoft portal is unavailable right now. Please try again later.'
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+            return response
         
-        if login_success:
+        if verified:
             return jsonify({
                 'success': True,
                 'message': 'Login successful'
@@ -368,7 +1019,319 @@ def login():
         }), 500
 
 
-@app.errorhandler(404)
+@api.route('/api/student/bundle', methods=['POST'])
+def get_student_bundle():
+    """
+    Grades, timetable and exam schedule with a single portal login
+    
+    Request body (JSON):
+    {
+        "username": "ITITIU22177",
+        "password": "your_password",
+        "pages": ["grades", "timetable", "exams"]   (optional, default all)
+    }
+    
+    The pages are fetched concurrently over one portal session, so the call
+    takes about as long as the slowest page. Grades go through the result
+    cache like /api/grades; a fresh cached transcript isn't fetched again.
+    
+    Returns:
+    {
+        "success": true,
+        "data": {
+            "grades": {...},                     (as in /api/grades)
+            "timetable": {"classes": [...]},
+            "exams": {"exams": [...]}
+        },
+        "errors": {"exams": "..."},              (pages that couldn't be retrieved)
+        "cache": {...},                          (grades, as in /api/grades)
+        "message": "..."
+    }
+    """
+    try:
+        data = request.get_json(silent=True)
+        
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'Request body is required'
+            }), 400
+        
+        username = data.get('username')
+        password = data.get('password')
+        
+        if not username or not password:
+            return jsonify({
+                'success': False,
+                'message': 'Username and password are required'
+            }), 400
+        
+        pages = data.get('pages') or list(BUNDLE_PAGES)
+        if not isinstance(pages, list) or any(name not in BUNDLE_PAGES for name in pages):
+            return jsonify({
+                'success': False,
+                'message': f"pages must be a list of: {', '.join(BUNDLE_PAGES)}"
+            }), 400
+        pages = list(dict.fromkeys(pages))
+        
+        key = credential_key(username, password)
+        entry = result_cache.get(key) if GRADES in pages else None
+        grades_cached = entry is not None and (result_cache.is_fresh(entry) or
+                                               prefetcher.covers(key, entry.checked_at))
+        fetch = [name for name in pages if not (name == GRADES and grades_cached)]
+        
+        bundle, errors, cache = {}, {}, None
+        if grades_cached:
+            bundle[GRADES], cache = entry.payload, cache_info('hit', entry)
+        if fetch:
+            try:
+                fetched = session_pool.get_pages(username, password, fetch)
+            except UpstreamUnavailable as e:
+                logger.warning(f"Portal request refused: {e}")
+                response = jsonify({
+                    'success': False,
+                    'message': 'The EduSoft portal is unavailable right now. Please try again later.'
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+                return response
+            if fetched is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Login failed. Please check your credentials.'
+                }), 401
+            
+            scraper, html = fetched
+            for name in fetch:
+                if name == GRADES:
+                    grades_data, cache = grades_from_page(scraper, html[name], username, key, entry)
+                    if grades_data:
+                        bundle[name] = grades_data
+                        continue
+                elif html[name]:
+                    archive_page(username, name, html[name])
+                    bundle[name] = scraper.parse_page(name, html[name])
+                    continue
+                errors[name] = f'Failed to retrieve the {name} page from the server'
+        
+        body = {
+            'success': bool(bundle),
+            'data': bundle,
+            'errors': errors,
+            'message': 'Student data retrieved successfully' if not errors else
+                       'Some pages could not be retrieved' if bundle else 'Failed to retrieve data from the server'
+        }
+        if cache is not None:
+            body['cache'] = cache
+        return jsonify(body), 200 if bundle else 500
+        
+    except Exception as e:
+        logger.error(f"Error in get_student_bundle: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'An error occurred: {str(e)}'
+        }), 500
+
+
+@api.route('/api/subscriptions', methods=['POST'])
+def subscribe():
+    """
+    Subscribe a student to background grade prefetching
+    
+    Request body (JSON):
+    {
+        "username": "ITITIU22177",
+        "password": "your_password",
+        "store_credentials": true   (optional; false only keeps the portal session alive)
+    }
+    
+    Returns:
+    {
+        "success": true,
+        "data": {"username": "...", "mode": "credentials"|"session", "interval": 900, ...},
+        "message": "..."
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'Request body is required'
+            }), 400
+        
+        username = data.get('username')
+        password = data.get('password')
+        
+        if not username or not password:
+            return jsonify({
+                'success': False,
+                'message': 'Username and password are required'
+            }), 400
+        
+        # Verify the credentials (and pool the session) before scheduling anything
+        try:
+            scraper = session_pool.acquire(username, password)
+        except UpstreamUnavailable as e:
+            response = jsonify({
+                'success': False,
+                'message': 'The EduSoft portal is unavailable right now. Please try again later.'
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+            return response
+        if scraper is None:
+            return jsonify({
+                'success': False,
+                'message': 'Login failed. Please check your credentials.'
+            }), 401
+        
+        try:
+            subscription = prefetcher.subscribe(
+                credential_key(username, password), username, password,
+                store_credentials=bool(data.get('store_credentials', True))
+            )
+        except OverflowError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 503
+        
+        return jsonify({
+            'success': True,
+            'data': subscription.to_dict(),
+            'message': 'Subscribed to grade prefetching'
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Error in subscribe: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'An error occurred: {str(e)}'
+        }), 500
+
+
+@api.route('/api/subscriptions', methods=['DELETE'])
+def unsubscribe():
+    """
+    Stop background grade prefetching for a student (same body as POST)
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('username') or not data.get('password'):
+        return jsonify({
+            'success': False,
+            'message': 'Username and password are required'
+        }), 400
+    
+    if not prefetcher.unsubscribe(credential_key(data['username'], data['password'])):
+        return jsonify({
+            'success': False,
+            'message': 'No subscription found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'message': 'Unsubscribed from grade prefetching'
+    }), 200
+
+
+def store_access_error():
+    """Error response if the transcript store queries are disabled or the bearer token is wrong"""
+    if transcript_store is None or not TRANSCRIPT_STORE_TOKEN:
+        return jsonify({
+            'success': False,
+            'message': 'Transcript store is not enabled'
+        }), 404
+    
+    auth = request.headers.get('Authorization', '')
+    scheme, _, token = auth.partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), TRANSCRIPT_STORE_TOKEN.encode()):
+        return jsonify({
+            'success': False,
+            'message': 'A valid bearer token is required'
+        }), 401
+    return None
+
+
+@api.route('/api/store/students/<student_id>', methods=['GET'])
+def get_stored_student(student_id):
+    """
+    A student's stored transcript: summary, semesters, courses and recent grade changes
+    
+    Query parameters:
+        changes: number of recent grade changes to include (default 50)
+    """
+    error = store_access_error()
+    if error:
+        return error
+    
+    try:
+        changes = max(0, min(int(request.args.get('changes', 50)), 1000))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'changes must be an integer'
+        }), 400
+    
+    student = transcript_store.student(student_id, changes=changes)
+    if student is None:
+        return jsonify({
+            'success': False,
+            'message': 'Student not found in the transcript store'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': student
+    }), 200
+
+
+@api.route('/api/store/courses/<code>/distribution', methods=['GET'])
+def get_course_distribution(code):
+    """
+    Letter grade counts and score statistics for a course
+    
+    Query parameters:
+        semester: restrict to one semester, e.g. "Học kỳ 1 - Năm học 2024-2025"
+    """
+    error = store_access_error()
+    if error:
+        return error
+    
+    return jsonify({
+        'success': True,
+        'data': transcript_store.course_distribution(code, request.args.get('semester'))
+    }), 200
+
+
+@api.route('/api/store/cohorts', methods=['GET'])
+def get_cohorts():
+    """
+    GPA, credit and classification aggregates per cohort
+    
+    Query parameters:
+        group_by: intake (default), major, class or faculty
+        intake, major, class, faculty: optional filters
+    """
+    error = store_access_error()
+    if error:
+        return error
+    
+    group_by = request.args.get('group_by', 'intake')
+    if group_by not in COHORT_GROUPS:
+        return jsonify({
+            'success': False,
+            'message': f"group_by must be one of: {', '.join(COHORT_GROUPS)}"
+        }), 400
+    filters = {name: request.args[name] for name in COHORT_GROUPS if request.args.get(name)}
+    
+    return jsonify({
+        'success': True,
+        'data': {'cohorts': transcript_store.cohorts(group_by, filters)}
+    }), 200
+
+
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({
         'success': False,
@@ -376,7 +1339,7 @@ def not_found(error):
     }), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     return jsonify({
         'success': False,
@@ -384,12 +1347,60 @@ def internal_error(error):
     }), 500
 
 
+# Imported on first use by the code that needs them; preload() imports them up front
+PRELOAD_MODULES = ('numpy', 'cryptography.fernet')
+
+
+def preload():
+    """
+    Import what workers otherwise import lazily: the parser backend, numpy
+    (cohort projections) and cryptography (stored prefetch credentials).
+    Under gunicorn --preload this runs once in the master, and forked
+    workers share the imported code copy-on-write instead of importing it.
+    """
+    default_parser()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:  # optional dependency
+            pass
+    # Keep the garbage collector from touching (and so copying) these objects in workers
+    gc.collect()
+    gc.freeze()
+
+
+def init_worker():
+    """Per-process startup, run after the fork: start the parse worker processes"""
+    parse_pool.warm()
+
+
+def create_app(preload_modules: bool = False) -> Flask:
+    """
+    Build the Flask app around the `api` blueprint.
+
+    Creating an app starts no threads or processes, and the SQLite
+    connections opened at import are reopened by forked workers, so this is
+    safe to call in a gunicorn master with --preload. preload_modules=True
+    also runs preload().
+    """
+    if preload_modules:
+        preload()
+    flask_app = Flask(__name__)
+    CORS(flask_app)  # Enable CORS for all routes
+    flask_app.register_blueprint(api)
+    return flask_app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
     # Get port from environment variable or default to 5000
     port = int(os.environ.get('PORT', 5000))
     # Get host from environment variable or default to 0.0.0.0 (all interfaces)
     host = os.environ.get('HOST', '0.0.0.0')
     
+    init_worker()
     print(f"🚀 Starting EduSoft Grade Scraper API on {host}:{port}")
     app.run(host=host, port=port, debug=False)
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the EduSoft Grade Scraper API
+
+POST /api/grades is served natively on the event loop with
+AsyncEdusoftScraper, so a single process can hold many in-flight requests
+that are waiting on the portal. The native route answers with uncompressed
+JSON only: streamed (?stream=1), conditional and compressed requests and
+other wire formats go to the Flask app, like every other route. Run with an
+ASGI server, e.g.:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import metrics
+from app import (GRADES_FORMATS, app as flask_app, grades_from_page, grades_response, init_worker, prefetcher,
+                 result_cache, session_pool, unavailable_result)
+from async_scraper import AsyncSessionPool, parse_executor
+from http_cache import IDENTITY, negotiate_encoding
+from result_cache import cache_info
+from session_pool import credential_key
+from singleflight import AsyncSingleFlight
+from upstream_guard import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+async_session_pool = AsyncSessionPool(max_size=session_pool.max_size, ttl=session_pool.ttl,
+                                      store=session_pool.store)
+grades_flight = AsyncSingleFlight()
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def load_grades_async(username: str, password: str):
+    """Async counterpart of app.load_grades, sharing the same result cache"""
+    key = credential_key(username, password)
+    entry = result_cache.get(key)
+    if entry is not None and (result_cache.is_fresh(entry) or prefetcher.covers(key, entry.checked_at)):
+        return entry.payload, cache_info('hit', entry)
+
+    (grades_data, cache), shared = await grades_flight.do(
+        key, refresh_grades_async, username, password, key, entry
+    )
+    if shared:
+        cache = dict(cache, coalesced=True)
+    return grades_data, cache
+
+
+async def refresh_grades_async(username: str, password: str, key: str, entry):
+    """Async counterpart of app.refresh_grades"""
+    try:
+        page = await async_session_pool.get_grades_page(username, password)
+    except UpstreamUnavailable as e:
+        logger.warning(f"Portal request refused: {e}")
+        return unavailable_result(entry, e)
+    if page is None:
+        return None, cache_info('miss')
+    # Parsing, projection and the cache/store/archive writes block; keep them off the loop.
+    # The copied context records their stages on the current request.
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(parse_executor(), context.run, grades_from_page, *page, username, key, entry)
+
+
+def served_natively(scope) -> bool:
+    """Whether a POST /api/grades only asks for what get_grades() answers: uncompressed JSON"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    if 'stream' in query or 'format' in query:
+        return False
+    headers = {name: value.decode('latin-1') for name, value in scope.get('headers') or []}
+    if b'if-none-match' in headers or b'if-modified-since' in headers:
+        return False
+    if negotiate_encoding(parse_accept_header(headers.get(b'accept-encoding'))) != IDENTITY:
+        return False
+    # Same choice as app.negotiate_grades_format(), with JSON winning ties
+    accept = parse_accept_header(headers.get(b'accept'), MIMEAccept)
+    return accept.best_match(list(GRADES_FORMATS.values()),
+                             default=GRADES_FORMATS['json']) == GRADES_FORMATS['json']
+
+
+async def read_body(receive) -> bytes:
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, body: dict, status: int, started: float, extra_headers=()):
+    with metrics.stage('serialize'):
+        payload = json.dumps(body).encode('utf-8')
+    server_timing = metrics.finish_request('POST', '/api/grades', status, time.perf_counter() - started)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+            (b'access-control-allow-origin', b'*'),
+            (b'server-timing', server_timing.encode()),
+            *extra_headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def get_grades(scope, receive, send):
+    """Async POST /api/grades, same request and response format as the Flask route"""
+    started = time.perf_counter()
+    headers = dict(scope.get('headers') or [])
+    metrics.start_request(headers.get(b'x-request-start', b'').decode('latin-1'))
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+
+        if not data:
+            return await send_json(send, {
+                'success': False,
+                'message': 'Request body is required'
+            }, 400, started)
+
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return await send_json(send, {
+                'success': False,
+                'message': 'Username and password are required'
+            }, 400, started)
+
+        grades_data, cache = await load_grades_async(username, password)
+        body, status = grades_response(grades_data, cache)
+        extra_headers = [(b'retry-after', str(cache['retry_after']).encode())] if status == 503 else []
+        return await send_json(send, body, status, started, extra_headers)
+
+    except Exception as e:
+        logger.error(f"Error in async get_grades: {str(e)}", exc_info=True)
+        return await send_json(send, {
+            'success': False,
+            'message': f'An error occurred: {str(e)}'
+        }, 500, started)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Runs in every server worker process
+            init_worker()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if (scope['type'] == 'http' and scope['path'] == '/api/grades' and scope['method'] == 'POST'
+            and served_natively(scope)):
+        return await get_grades(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Async EduSoft scraper built on httpx
+
+Same login/get_grades/parse_grades contract as EdusoftScraper (both build on
+PortalScraper's helpers), but the portal round-trips are coroutines and don't
+block a worker: one event loop can hold many in-flight
+student requests. Upstream concurrency is bounded process-wide, requests go
+through the same upstream guard as the sync scraper, and parsing runs in an
+executor so it doesn't stall the loop.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from login_form import is_stale_form_response
+from metrics import stage
+from parsers import GradesParser
+from script import GRADES, PortalScraper
+from session_pool import BaseSessionPool, credential_key
+from transport import CONNECT_TIMEOUT, POOL_SIZE, READ_TIMEOUT, RETRIES
+from upstream_guard import UpstreamUnavailable, default_guard
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of concurrent requests to the portal from this process
+UPSTREAM_CONCURRENCY = int(os.environ.get('ASYNC_UPSTREAM_CONCURRENCY', 32))
+
+_parse_executor: Optional[Executor] = None
+_upstream_semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+_upstream_transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+
+
+def parse_executor() -> Executor:
+    """Executor that runs CPU-bound HTML parsing off the event loop"""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('ASYNC_PARSE_WORKERS', os.cpu_count() or 4)),
+            thread_name_prefix='parse'
+        )
+    return _parse_executor
+
+
+def upstream_semaphore() -> asyncio.Semaphore:
+    """Semaphore bounding portal requests on the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _upstream_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _upstream_semaphores[loop] = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+    return semaphore
+
+
+def upstream_transport() -> httpx.AsyncHTTPTransport:
+    """Keep-alive connection pool to the portal shared by all clients on the running loop"""
+    loop = asyncio.get_running_loop()
+    transport = _upstream_transports.get(loop)
+    if transport is None:
+        transport = _upstream_transports[loop] = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=UPSTREAM_CONCURRENCY, max_keepalive_connections=POOL_SIZE),
+            retries=RETRIES
+        )
+    return transport
+
+
+class AsyncEdusoftScraper(PortalScraper):
+    """Scraper over an httpx client, whose network calls are coroutines"""
+
+    def __init__(self, parser: Optional[GradesParser] = None, executor: Optional[Executor] = None):
+        super().__init__(parser)
+        self.executor = executor
+        self.client = httpx.AsyncClient(
+            headers=self.HEADERS,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            transport=upstream_transport()
+        )
+
+    def export_cookies(self) -> List[Dict[str, str]]:
+        return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                for c in self.client.cookies.jar]
+
+    def import_cookies(self, cookies: List[Dict[str, str]]):
+        for cookie in cookies:
+            self.client.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    async def _request(self, method: str, url: str, check_status: bool = True, **kwargs) -> httpx.Response:
+        guard = default_guard()
+        async with upstream_semaphore():
+            probe = await guard.acquire_async()
+            started = time.perf_counter()
+            ok = False
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                ok = response.status_code < 500
+            finally:
+                guard.release(ok, time.perf_counter() - started, probe)
+        if check_status:
+            response.raise_for_status()
+        return response
+
+    async def fetch_login_form_async(self) -> Dict[str, str]:
+        """GET the login page for its hidden form fields and cache them"""
+        with stage('login_page'):
+            response = await self._request('GET', f"{self.base_url}/default.aspx")
+        fields = self.get_viewstate(response.text)
+        self.form_cache.set(self.base_url, fields)
+        return fields
+
+    async def post_login_async(self, fields: Dict[str, str], username: str, password: str) -> httpx.Response:
+        """Submit the login form; the status is left for the caller to check"""
+        with stage('login'):
+            return await self._request(
+                'POST',
+                f"{self.base_url}/default.aspx",
+                check_status=False,
+                data=self.login_form_data(fields, username, password),
+                headers=self.login_headers()
+            )
+
+    async def login(self, username: str, password: str) -> bool:
+        """Login to EduSoft portal"""
+        try:
+            fields = self.form_cache.get(self.base_url)
+            cached = fields is not None
+            if not cached:
+                fields = await self.fetch_login_form_async()
+            login_response = await self.post_login_async(fields, username, password)
+            if cached and is_stale_form_response(login_response.text):
+                # Stale cached form, see EdusoftScraper.login()
+                self.form_cache.invalidate(self.base_url, fields)
+                login_response = await self.post_login_async(await self.fetch_login_form_async(), username, password)
+            login_response.raise_for_status()
+            if self.is_login_success(login_response.text, username):
+                self.session_expired = False
+                return True
+            return False
+
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.warning(f"Error during async login: {e}")
+            return False
+
+    async def fetch_grades_html(self) -> str:
+        """Retrieve the raw grades page, or an empty string on failure"""
+        return await self.fetch_page_html(GRADES)
+
+    async def fetch_page_html(self, name: str) -> str:
+        """Retrieve the raw HTML of one of PAGES, or an empty string on failure"""
+        try:
+            with stage(f'{name}_page'):
+                response = await self._request('GET', f"{self.base_url}/default.aspx?page={self.PAGES[name]}")
+            if self.is_login_page(response.text):
+                self.session_expired = True
+                return ''
+            return response.text
+
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.warning(f"Error fetching {name}: {e}")
+            return ''
+
+    async def fetch_pages(self, names: Sequence[str]) -> Dict[str, str]:
+        """Fetch several of PAGES concurrently: name -> HTML, empty for pages that failed"""
+        pages = await asyncio.gather(*(self.fetch_page_html(name) for name in names))
+        return dict(zip(names, pages))
+
+    async def parse_grades_async(self, html: str) -> Dict:
+        """Parse the grades page in the parse executor"""
+        loop = asyncio.get_running_loop()
+        # Run in a copy of this context so the parse stage is recorded on the current request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor or parse_executor(), context.run, self.parse_grades, html)
+
+    async def get_grades(self) -> Dict:
+        """Retrieve and parse grades page"""
+        html = await self.fetch_grades_html()
+        if not html:
+            return {}
+        return await self.parse_grades_async(html)
+
+    async def aclose(self):
+        # The transport is shared, so only drop this client's cookies
+        self.client.cookies.clear()
+
+
+class AsyncSessionPool(BaseSessionPool):
+    """BaseSessionPool of AsyncEdusoftScraper sessions, the async counterpart of SessionPool"""
+
+    scraper_class = AsyncEdusoftScraper
+
+    async def login(self, username: str, password: str) -> Optional[AsyncEdusoftScraper]:
+        """Log in with a fresh scraper and pool it; returns None on failure"""
+        scraper = self.scraper_class()
+        if not await scraper.login(username, password):
+            await scraper.aclose()
+            return None
+        self.put(credential_key(username, password), scraper)
+        return scraper
+
+    async def acquire(self, username: str, password: str) -> Optional[AsyncEdusoftScraper]:
+        """Return a logged-in scraper, reusing a pooled session when possible"""
+        scraper = self.get(credential_key(username, password))
+        if scraper is not None:
+            return scraper
+        return await self.login(username, password)
+
+    async def get_grades_page(self, username: str, password: str) -> Optional[Tuple[AsyncEdusoftScraper, str]]:
+        """Async counterpart of SessionPool.get_grades_page"""
+        key = credential_key(username, password)
+        scraper = self.get(key)
+        if scraper is not None:
+            html = await scraper.fetch_grades_html()
+            if not scraper.session_expired:
+                return scraper, html
+            logger.info("Pooled portal session expired, logging in again")
+            self.discard(key)
+
+        scraper = await self.login(username, password)
+        if scraper is None:
+            return None
+        return scraper, await scraper.fetch_grades_html()
+
+    async def get_grades(self, username: str, password: str) -> Optional[Dict]:
+        """Fetch and parse grades over a pooled session; None if the login fails"""
+        page = await self.get_grades_page(username, password)
+        if page is None:
+            return None
+        scraper, html = page
+        return await scraper.parse_grades_async(html) if html else {}
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Concurrent fan-out of per-student work with a parallelism limit and
+per-item timeouts, yielding results in completion order
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+
+class ItemTimeout(Exception):
+    """Raised in place of a result when an item exceeds its timeout"""
+
+
+def run_batch(items: List[Any], work: Callable[[Any], Any], parallelism: int,
+              timeout: float) -> Iterator[Tuple[int, Any, BaseException]]:
+    """
+    Run `work(item)` for every item on up to `parallelism` threads.
+
+    Yields (index, result, error) tuples as items complete. An item still
+    running `timeout` seconds after it started is reported with an
+    ItemTimeout error; its thread is left to finish in the background.
+    """
+    started: Dict[int, float] = {}
+
+    def run(index: int, item: Any):
+        started[index] = time.monotonic()
+        return work(item)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(items))),
+                                  thread_name_prefix='batch')
+    try:
+        pending = {executor.submit(run, index, item): index for index, item in enumerate(items)}
+        while pending:
+            now = time.monotonic()
+            deadlines = [started[index] + timeout for index in pending.values() if index in started]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else timeout
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                yield index, (None if error else future.result()), error
+
+            now = time.monotonic()
+            for future, index in list(pending.items()):
+                if index in started and now - started[index] >= timeout:
+                    del pending[future]
+                    yield index, None, ItemTimeout(f'Timed out after {timeout:g}s')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,184 @@
+"""End-to-end latency of the scraper and POST /api/grades against the fake portal"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import http_cache
+from app import app, credential_key, result_cache
+from conftest import PASSWORD, new_student_id, record_percentiles, running_portal
+from fake_portal import PortalConfig
+from login_form import default_login_form_cache
+from script import EdusoftScraper
+
+
+@pytest.fixture(scope='module')
+def client():
+    return app.test_client()
+
+
+def post_grades(client, username: str):
+    response = client.post('/api/grades', json={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200
+    return response.get_json()['cache']['status']
+
+
+@pytest.mark.parametrize('form_cache', [True, False], ids=['cached_form', 'login_page'])
+def test_scraper_login(benchmark, portal, form_cache):
+    # Without the login form cache every login GETs the login page first
+    cache = default_login_form_cache()
+    ttl = cache.ttl
+    cache.ttl = ttl if form_cache else 0
+    benchmark.group = 'scraper_login'
+
+    def login():
+        return EdusoftScraper().login(new_student_id(), PASSWORD)
+
+    try:
+        assert benchmark(login)
+    finally:
+        cache.ttl = ttl
+    record_percentiles(benchmark)
+
+
+def test_scraper_verify_login(benchmark, portal):
+    def verify():
+        return EdusoftScraper().verify_login(new_student_id(), PASSWORD)
+
+    assert benchmark(verify)
+    record_percentiles(benchmark)
+
+
+@pytest.mark.parametrize('method', ['login', 'verify_login'])
+def test_scraper_login_stale_form(portal, method):
+    # The portal rejects a stale cached form with a 500 viewstate error; the login refetches it and retries once
+    scraper = EdusoftScraper()
+    cache = default_login_form_cache()
+    stale = {'__VIEWSTATE': 'stale', '__VIEWSTATEGENERATOR': 'stale', '__EVENTTARGET': '', '__EVENTARGUMENT': ''}
+    cache.set(scraper.base_url, stale)
+    invalidations = cache.invalidations
+
+    assert getattr(scraper, method)(new_student_id(), PASSWORD)
+    assert cache.invalidations == invalidations + 1
+    assert cache.get(scraper.base_url)['__VIEWSTATE'] != 'stale'
+
+
+def test_grades_cold(benchmark, portal, client):
+    # New student every round: login, fetch, parse, project
+    benchmark.group = 'api_grades'
+    assert benchmark(lambda: post_grades(client, new_student_id())) == 'miss'
+    record_percentiles(benchmark)
+
+
+def test_grades_pooled_session(benchmark, portal, client):
+    # Logged-in session reused from the pool, result cache dropped every round
+    benchmark.group = 'api_grades'
+    username = new_student_id()
+    key = credential_key(username, PASSWORD)
+    post_grades(client, username)
+
+    status = benchmark.pedantic(post_grades, args=(client, username),
+                                setup=lambda: result_cache.delete(key), rounds=200)
+    assert status == 'miss'
+    record_percentiles(benchmark)
+
+
+def test_grades_stream_first_row(benchmark, client):
+    # Pooled session, cache dropped every round: time until the first NDJSON row arrives
+    benchmark.group = 'api_grades_stream'
+    username = new_student_id()
+    key = credential_key(username, PASSWORD)
+
+    def first_row():
+        response = client.post('/api/grades?stream=1', json={'username': username, 'password': PASSWORD},
+                               buffered=False)
+        lines = response.iter_encoded()
+        try:
+            return next(line for line in lines if json.loads(line)['type'] == 'row')
+        finally:
+            response.close()
+
+    with running_portal(PortalConfig(semesters=16, latency=0.02)):
+        post_grades(client, username)
+        assert benchmark.pedantic(first_row, setup=lambda: result_cache.delete(key), rounds=50)
+    record_percentiles(benchmark)
+
+
+def test_grades_cache_hit(benchmark, portal, client):
+    benchmark.group = 'api_grades'
+    username = new_student_id()
+    post_grades(client, username)
+
+    assert benchmark(post_grades, client, username) == 'hit'
+    record_percentiles(benchmark)
+
+
+@pytest.mark.parametrize('headers', [
+    {'Accept-Encoding': 'identity'},
+    {'Accept-Encoding': 'gzip'},
+    {'Accept-Encoding': 'br'},
+    None
+], ids=['identity', 'gzip', 'br', 'not_modified'])
+def test_grades_cache_hit_encoding(benchmark, portal, client, headers):
+    # Cached transcript: full body per content coding, or a 304 for a client that has it
+    benchmark.group = 'api_grades_encoding'
+    username = new_student_id()
+    body = {'username': username, 'password': PASSWORD}
+    first = client.post('/api/grades', json=body)
+    if headers is None:
+        headers = {'If-None-Match': first.headers['ETag']}
+    elif headers['Accept-Encoding'] == 'br' and http_cache.brotli is None:
+        pytest.skip('brotli not installed')
+
+    response = benchmark(client.post, '/api/grades', json=body, headers=headers)
+    assert response.status_code == (304 if 'If-None-Match' in headers else 200)
+    benchmark.extra_info['bytes'] = len(response.data)
+    record_percentiles(benchmark)
+
+
+@pytest.mark.parametrize('concurrency', (8, 32))
+def test_grades_concurrent_burst(benchmark, concurrency):
+    # 64 cold students against a portal with 20ms latency per request
+    benchmark.group = 'api_grades_burst'
+    with running_portal(PortalConfig(latency=0.02)):
+        def burst():
+            usernames = [new_student_id() for _ in range(64)]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                return list(executor.map(lambda u: post_grades(app.test_client(), u), usernames))
+
+        statuses = benchmark.pedantic(burst, rounds=3, iterations=1)
+    assert set(statuses) == {'miss'}
+
+
+@pytest.mark.parametrize('concurrent', [True, False], ids=['concurrent', 'sequential'])
+def test_scraper_fetch_pages(benchmark, concurrent):
+    # Grades, timetable and exams over one logged-in session, 20ms portal latency
+    benchmark.group = 'scraper_pages'
+    names = tuple(EdusoftScraper.PAGES)
+    with running_portal(PortalConfig(latency=0.02)):
+        scraper = EdusoftScraper()
+        assert scraper.login(new_student_id(), PASSWORD)
+
+        def fetch():
+            if concurrent:
+                return scraper.fetch_pages(names)
+            return {name: scraper.fetch_page_html(name) for name in names}
+
+        pages = benchmark.pedantic(fetch, rounds=20)
+    assert all(pages.values())
+    record_percentiles(benchmark)
+
+
+def test_student_bundle_cold(benchmark, portal, client):
+    # New student every round: one login, then all pages in parallel
+    benchmark.group = 'api_bundle'
+
+    def bundle():
+        response = client.post('/api/student/bundle', json={'username': new_student_id(), 'password': PASSWORD})
+        assert response.status_code == 200
+        return response.get_json()
+
+    body = benchmark(bundle)
+    assert set(body['data']) == set(EdusoftScraper.PAGES) and not body['errors']
+    record_percentiles(benchmark)
@@ -0,0 +1,58 @@
+"""Page archive: archiving fetched pages, reading them back and re-parsing the whole archive"""
+
+import os
+
+import pytest
+
+from conftest import new_student_id
+from fake_portal import PortalConfig, render_grades_page
+from page_archive import GRADES, PageArchive, reparse
+
+# Students in the archive the reparse scenarios run over
+ARCHIVED_STUDENTS = 200
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    """An archive holding two fetches (the second one unchanged) of each student's grades page"""
+    archive = PageArchive(str(tmp_path_factory.mktemp('archive')))
+    for i in range(ARCHIVED_STUDENTS):
+        username = new_student_id()
+        html = render_grades_page(username, PortalConfig(semesters=2 + i % 15, seed=i))
+        archive.put(username, GRADES, html)
+        archive.put(username, GRADES, html)
+    return archive
+
+
+@pytest.mark.parametrize('content', ['new', 'duplicate'])
+def test_archive_put(benchmark, tmp_path, grades_pages, content):
+    # An 8-semester page that is new to the archive, or unchanged since the last fetch
+    benchmark.group = 'archive_put'
+    archive = PageArchive(str(tmp_path / 'archive'))
+    html = grades_pages[8]
+    pages = iter(range(10 ** 9))
+
+    def put():
+        page = next(pages)
+        return archive.put('ITITIU22076', GRADES, html if content == 'duplicate' else f'{html}<!-- {page} -->')
+
+    benchmark(put)
+    stats = archive.stats()
+    assert stats['blobs'] == (1 if content == 'duplicate' else stats['pages'])
+
+
+def test_archive_get(benchmark, archive):
+    benchmark.group = 'archive_get'
+    digest = archive.history(archive.select()[0][0].student)[-1].digest
+    assert benchmark(archive.get, digest).startswith('<!DOCTYPE html>')
+
+
+@pytest.mark.parametrize('workers', sorted({1, os.cpu_count() or 1}))
+def test_archive_reparse(benchmark, archive, workers):
+    # Every student's latest grades page, pool startup included
+    benchmark.group = 'archive_reparse'
+    results = benchmark.pedantic(lambda: list(reparse(archive, workers=workers)), rounds=3, iterations=1)
+    assert len(results) == ARCHIVED_STUDENTS
+    assert all(data.get('grades') for _, data in results)
+    if benchmark.stats is not None:
+        benchmark.extra_info['pages_per_second'] = round(ARCHIVED_STUDENTS / benchmark.stats.stats.mean)
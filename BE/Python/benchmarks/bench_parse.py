@@ -0,0 +1,75 @@
+"""Parse throughput per parser backend and transcript length"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import TRANSCRIPT_SIZES
+from parsers import (PARSER_BACKENDS, StreamingGradesParser, extract_form_fields, extract_last_updated,
+                     get_parser)
+from fake_portal import render_login_page
+from parse_pool import MODES, ParsePool
+from transport import STREAM_CHUNK_SIZE
+
+
+@pytest.mark.parametrize('semesters', TRANSCRIPT_SIZES)
+@pytest.mark.parametrize('backend', sorted(PARSER_BACKENDS))
+def test_parse_grades(benchmark, grades_pages, backend, semesters):
+    try:
+        parser = get_parser(backend)
+    except ImportError:
+        pytest.skip(f'{backend} is not installed')
+    html = grades_pages[semesters]
+    benchmark.group = f'parse_grades[{semesters} semesters]'
+    benchmark.extra_info['html_bytes'] = len(html.encode('utf-8'))
+
+    result = benchmark(parser.parse_grades, html)
+    assert result['grades']
+
+
+def test_extract_last_updated(benchmark, grades_pages):
+    html = grades_pages[max(TRANSCRIPT_SIZES)]
+    assert benchmark(extract_last_updated, html)
+
+
+def test_extract_form_fields(benchmark):
+    html = render_login_page()
+    assert '__VIEWSTATE' in benchmark(extract_form_fields, html)
+
+
+@pytest.mark.parametrize('semesters', TRANSCRIPT_SIZES)
+def test_parse_grades_streaming(benchmark, grades_pages, semesters):
+    # Fed in network-sized chunks, as EdusoftScraper.stream_grades() does
+    html = grades_pages[semesters]
+    chunks = [html[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(html), STREAM_CHUNK_SIZE)]
+    benchmark.group = f'parse_grades[{semesters} semesters]'
+    benchmark.extra_info['html_bytes'] = len(html.encode('utf-8'))
+
+    def parse():
+        parser = StreamingGradesParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        return parser.result()
+
+    assert benchmark(parse)['grades']
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_parse_burst(benchmark, grades_pages, mode):
+    # 32 large transcripts parsed from 8 request threads at once
+    html = grades_pages[max(TRANSCRIPT_SIZES)]
+    parser = get_parser()
+    pool = ParsePool(mode, workers=os.cpu_count())
+    pool.warm()
+    benchmark.group = 'parse_burst'
+    try:
+        with ThreadPoolExecutor(max_workers=8) as threads:
+            def burst():
+                return list(threads.map(lambda _: pool.parse_grades(parser, html), range(32)))
+
+            results = benchmark.pedantic(burst, rounds=5, iterations=1)
+    finally:
+        pool.shutdown()
+    assert all(result['grades'] for result in results)
@@ -0,0 +1,45 @@
+"""Grade projection cost for one transcript and for a cohort"""
+
+import itertools
+import random
+
+from parsers import default_parser
+from projection import CLASSIFICATION_THRESHOLDS, calculate_grade_projection, project_cohort, project_student
+
+
+def test_calculate_grade_projection(benchmark, grades_pages):
+    grades_data = default_parser().parse_grades(grades_pages[8])
+    result = benchmark(calculate_grade_projection, grades_data)
+    assert result['current_cgpa'] is not None
+
+
+def test_calculate_grade_projection_unsummarized(benchmark, grades_pages):
+    # Payloads cached before the parser summarized rows fall back to a row scan
+    grades_data = default_parser().parse_grades(grades_pages[16])
+    del grades_data['cumulative']
+    assert benchmark(calculate_grade_projection, grades_data)
+
+
+def test_project_cohort(benchmark):
+    rng = random.Random(0)
+    students = [
+        {'cgpa': round(rng.uniform(1.5, 4.0), 2), 'credits': rng.randint(10, 130)}
+        for _ in range(10000)
+    ]
+    results = benchmark(project_cohort, students)
+    assert len(results) == len(students)
+
+
+def test_project_student_matches_project_cohort():
+    # project_student() is project() for one row, without numpy; keep the two in step.
+    # The grid covers every threshold boundary, and credits short of, at and past the program total.
+    boundaries = {t[bound] for t in CLASSIFICATION_THRESHOLDS.values() for bound in ('min', 'max')}
+    cgpas = sorted({round(step * 0.05, 2) for step in range(81)} | boundaries |
+                   {round(b + delta, 2) for b in boundaries for delta in (-0.01, 0.01) if 0 <= b + delta <= 4})
+    credits = (0, 1, 30, 119, 120, 139, 140, 141, 200)
+    program_credits = (120, 140)
+    grid = list(itertools.product(cgpas, credits, program_credits))
+
+    cohort = project_cohort([{'cgpa': c, 'credits': n, 'program_credits': p} for c, n, p in grid])
+    for (cgpa, n, program), expected in zip(grid, cohort):
+        assert project_student(cgpa, n, program) == expected, (cgpa, n, program)
@@ -0,0 +1,59 @@
+"""Shared store: lookup cost per backend and a second worker resuming a pooled session"""
+
+import pytest
+
+from conftest import PASSWORD, new_student_id, record_percentiles
+from result_cache import CacheEntry, SharedCacheBackend
+from script import EdusoftScraper
+from session_pool import SessionPool
+from shared_store import MemorySharedStore, SQLiteSharedStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemorySharedStore()
+    return SQLiteSharedStore(str(tmp_path / 'shared.db'))
+
+
+def test_shared_cache_get(benchmark, store, grades_pages):
+    # An 8-semester transcript cached by another worker
+    benchmark.group = 'shared_cache_get'
+    grades_payload = EdusoftScraper().parse_grades(grades_pages[8])
+    backend = SharedCacheBackend(store)
+    backend.set('student', CacheEntry('01/06/2025 08:00', grades_payload, 0.0, 0.0))
+
+    entry = benchmark(backend.get, 'student')
+    assert entry.payload == grades_payload
+
+
+def test_shared_store_set(benchmark, store):
+    # 1 KiB values under a budget that keeps evicting
+    benchmark.group = 'shared_store_set'
+    store.max_bytes = 256 * 1024
+    value = b'x' * 1024
+    keys = iter(range(10 ** 9))
+
+    benchmark(lambda: store.set(f'key:{next(keys)}', value))
+    assert store.stats()['bytes'] <= store.max_bytes
+
+
+@pytest.mark.parametrize('shared', [True, False], ids=['resumed', 'login'])
+def test_second_worker_session(benchmark, portal, tmp_path, shared):
+    # Worker A logged the student in; worker B needs a session for them
+    benchmark.group = 'second_worker_session'
+    path = str(tmp_path / 'sessions.db')
+    worker_a = SessionPool(store=SQLiteSharedStore(path))
+
+    def acquire():
+        username = new_student_id()
+        worker_a.login(username, PASSWORD)
+        worker_b = SessionPool(store=SQLiteSharedStore(path) if shared else None)
+        return (username,), {'worker_b': worker_b}
+
+    def second_worker(username, worker_b):
+        return worker_b.get_grades_page(username, PASSWORD)
+
+    page = benchmark.pedantic(second_worker, setup=acquire, rounds=50)
+    assert page is not None and page[1]
+    record_percentiles(benchmark)
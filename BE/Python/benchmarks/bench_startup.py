@@ -0,0 +1,51 @@
+"""Cold start: time until a new API worker answers its first request"""
+
+import gc
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app as api
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A worker started without --preload: a fresh interpreter imports the app and serves GET /health
+COLD_START = "import app; assert app.app.test_client().get('/health').status_code == 200"
+
+
+def run_python(code: str):
+    subprocess.run([sys.executable, '-c', code], cwd=PYTHON_DIR, check=True, capture_output=True)
+
+
+def test_startup_interpreter(benchmark):
+    # Baseline included in every fresh-process scenario
+    benchmark.group = 'startup'
+    benchmark.pedantic(run_python, args=('pass',), rounds=5, iterations=1)
+
+
+def test_startup_import(benchmark):
+    benchmark.group = 'startup'
+    benchmark.pedantic(run_python, args=(COLD_START,), rounds=5, iterations=1)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_startup_preload_fork(benchmark):
+    # gunicorn --preload: the master already imported everything, a new worker is a fork
+    flask_app = api.create_app(preload_modules=True)
+    benchmark.group = 'startup'
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            ok = flask_app.test_client().get('/health').status_code == 200
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status)
+
+    try:
+        assert benchmark.pedantic(fork_worker, rounds=5, iterations=1) == 0
+    finally:
+        # preload() froze everything allocated so far; don't skew the other benchmarks
+        gc.unfreeze()
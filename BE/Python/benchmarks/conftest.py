@@ -0,0 +1,68 @@
+"""
+Shared fixtures for the offline benchmarks
+
+Every scenario runs against benchmarks/fake_portal.py instead of the real
+portal, so results only depend on this code and the machine running it.
+"""
+
+import itertools
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_portal import FakePortal, PortalConfig, render_grades_page  # noqa: E402
+from load import percentile  # noqa: E402
+from script import PortalScraper  # noqa: E402
+
+PASSWORD = PortalConfig.password
+# Transcript sizes (semesters) used by the parse scenarios
+TRANSCRIPT_SIZES = (2, 8, 16)
+
+_student_ids = itertools.count(1)
+
+
+def new_student_id() -> str:
+    """A username no earlier scenario has used, so it starts with a cold session and cache"""
+    return f'ITITIU{next(_student_ids):05d}'
+
+
+@contextmanager
+def running_portal(config: PortalConfig):
+    """Run a fake portal and point every new scraper at it"""
+    portal = FakePortal(config).start()
+    previous = PortalScraper.BASE_URL
+    PortalScraper.BASE_URL = portal.base_url
+    try:
+        yield portal
+    finally:
+        PortalScraper.BASE_URL = previous
+        portal.stop()
+
+
+def record_percentiles(benchmark):
+    """Add p50/p90/p99 (ms) of the collected rounds to the benchmark's extra_info"""
+    if benchmark.stats is None:
+        # --benchmark-disable: the function ran once, nothing was collected
+        return
+    samples = sorted(benchmark.stats.stats.data)
+    for p in (50, 90, 99):
+        benchmark.extra_info[f'p{p}_ms'] = round(percentile(samples, p) * 1000, 3)
+
+
+@pytest.fixture(scope='module')
+def portal():
+    with running_portal(PortalConfig()) as portal:
+        yield portal
+
+
+@pytest.fixture(scope='session')
+def grades_pages():
+    """Rendered grades pages keyed by number of semesters"""
+    return {
+        semesters: render_grades_page('ITITIU22076', PortalConfig(semesters=semesters))
+        for semesters in TRANSCRIPT_SIZES
+    }
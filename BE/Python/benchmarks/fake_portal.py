@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the EduSoft portal, for offline benchmarks
+
+Serves the pages EdusoftScraper talks to: default.aspx with a VIEWSTATE
+login form, the login postback, a synthetic xemdiemthi grades page with
+a configurable number of semesters, and the timetable (thoikhoabieu) and
+exam schedule (xemlichthi) of the last semester's courses. The student and
+the first courses are seeded from mockdata.txt; the rest of the transcript
+is generated deterministically. Per-request latency and failure rates are configurable.
+
+    python benchmarks/fake_portal.py --port 8765 --semesters 8 --latency 0.2
+
+Then point the API at it:
+
+    EDUSOFT_BASE_URL=http://127.0.0.1:8765 python app.py
+"""
+
+import argparse
+import html
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+MOCKDATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'mockdata.txt')
+
+USERNAME_FIELD = 'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtTaiKhoa'
+PASSWORD_FIELD = 'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtMatKhau'
+VIEWSTATE = 'dDwtMTA4NzQ0NjE5MTs7PvZ3ZWJGb3JtRmFrZVBvcnRhbA=='
+VIEWSTATE_GENERATOR = 'CA0B0334'
+COLUMNS = ('STT', 'Mã Môn', 'Tên Môn', 'TC', '% KT', '% Thi', 'Điểm KT', 'Điểm Thi', 'TK(10)', 'TK(CH)')
+TIMETABLE_COLUMNS = ('Mã MH', 'Tên môn học', 'Nhóm', 'Số TC', 'Lớp', 'Thứ', 'Tiết BD', 'Số tiết', 'Phòng', 'Giảng viên', 'Tuần học')
+EXAM_COLUMNS = ('STT', 'Mã MH', 'Tên môn học', 'Ghép thi', 'Tổ thi', 'Số lượng', 'Ngày thi', 'Giờ BĐ', 'Số phút', 'Phòng thi', 'Ghi chú')
+DAYS = ('Hai', 'Ba', 'Tư', 'Năm', 'Sáu', 'Bảy')
+
+# (minimum 10-point score, letter grade, 4-point value)
+LETTER_GRADES = (
+    (9.0, 'A+', 4.0), (8.0, 'A', 4.0), (7.0, 'B+', 3.3), (6.0, 'B', 3.0),
+    (5.0, 'C', 2.0), (4.0, 'D', 1.0), (0.0, 'F', 0.0)
+)
+
+# Course: (code, name, credits, 10-point score)
+Course = Tuple[str, str, int, float]
+
+
+@dataclass(frozen=True)
+class PortalConfig:
+    semesters: int = 8
+    courses_per_semester: int = 6
+    # Seconds added to every request, plus up to `jitter` extra seconds
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Fraction of requests answered with a 503
+    failure_rate: float = 0.0
+    # Every username logs in with this password
+    password: str = 'secret'
+    seed: int = 0
+    mockdata: str = MOCKDATA_PATH
+    # Shown on the grades page; the portal changes it whenever grades are updated
+    last_updated: str = '01/06/2025 08:00'
+
+
+def load_mockdata(path: str) -> Tuple[Dict, List[Dict]]:
+    """The first user in mockdata.txt and their graded courses"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}, []
+    users = data.get('users') or [{}]
+    grades = [g for g in data.get('grades', []) if g.get('grade') is not None]
+    return users[0], sorted(grades, key=lambda g: g.get('semester', ''))
+
+
+def letter_grade(score: float) -> Tuple[str, float]:
+    for minimum, letter, points in LETTER_GRADES:
+        if score >= minimum:
+            return letter, points
+    return 'F', 0.0
+
+
+def build_transcript(config: PortalConfig) -> List[List[Course]]:
+    """Courses per semester: mockdata courses first, then generated ones"""
+    _, graded = load_mockdata(config.mockdata)
+    rng = random.Random(config.seed)
+    seeded = [(g['courseCode'], g['courseName'], int(g['credits']), float(g['grade'])) for g in graded]
+
+    semesters = []
+    for s in range(config.semesters):
+        courses = []
+        for c in range(config.courses_per_semester):
+            if seeded:
+                courses.append(seeded.pop(0))
+            else:
+                courses.append((
+                    f'IT{100 + s * 10 + c:03d}IU',
+                    f'Generated Course {s + 1}.{c + 1}',
+                    rng.choice((2, 3, 4)),
+                    round(rng.uniform(3.5, 9.8), 1)
+                ))
+        semesters.append(courses)
+    return semesters
+
+
+def render_login_page(message: str = '') -> str:
+    return (
+        '<!DOCTYPE html><html><head><title>EduSoft</title></head><body>'
+        '<form method="post" action="./default.aspx" id="form1">'
+        '<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />'
+        '<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />'
+        f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{VIEWSTATE}" />'
+        f'<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="{VIEWSTATE_GENERATOR}" />'
+        f'<input name="{USERNAME_FIELD}" type="text" id="ContentPlaceHolder1_ctl00_ucDangNhap_txtTaiKhoa" />'
+        f'<input name="{PASSWORD_FIELD}" type="password" id="ContentPlaceHolder1_ctl00_ucDangNhap_txtMatKhau" />'
+        f'<span id="ContentPlaceHolder1_ctl00_ucDangNhap_lblError">{message}</span>'
+        '</form></body></html>'
+    )
+
+
+def render_home_page(username: str) -> str:
+    return f'<!DOCTYPE html><html><body><span id="lblUser">Chào bạn {html.escape(username)}</span></body></html>'
+
+
+@lru_cache(maxsize=64)
+def render_grades_page(username: str, config: PortalConfig) -> str:
+    """The xemdiemthi page for a student, in the portal's table layout"""
+    user, _ = load_mockdata(config.mockdata)
+    info = {
+        'lblMaSinhVien': username,
+        'lblTenSinhVien': user.get('fullName', 'Nguyễn Văn A'),
+        'lblLop': 'ITIT22IU01',
+        'lbNganh': 'Công nghệ thông tin',
+        'lblKhoa': 'Công nghệ thông tin',
+        'lblPhai': 'Nam',
+        'lblNoiSinh': 'TP. Hồ Chí Minh',
+        'lblHeDaoTao': 'Đại học chính quy',
+        'lblKhoaHoc': '2022',
+        'lblCVHT': 'TS. Nguyễn Văn B'
+    }
+    parts = ['<!DOCTYPE html><html><body>']
+    for suffix, value in info.items():
+        parts.append(f'<span id="ContentPlaceHolder1_ctl00_ucThongTinSV_{suffix}">{html.escape(value)}</span>')
+
+    colspan = len(COLUMNS)
+    parts.append('<div id="ContentPlaceHolder1_ctl00_div1"><table class="view-table"><tr class="title-hk-diem">')
+    parts.extend(f'<td>{column}</td>' for column in COLUMNS)
+    parts.append('</tr>')
+
+    stt = 0
+    total_credits = total_points_4 = total_points_10 = 0.0
+    for s, courses in enumerate(build_transcript(config)):
+        year = 2022 + s // 2
+        parts.append(f'<tr class="title-hk-diem"><td colspan="{colspan}">Học kỳ {s % 2 + 1} - Năm học {year}-{year + 1}</td></tr>')
+        credits = points_4 = points_10 = 0.0
+        for code, name, course_credits, score in courses:
+            stt += 1
+            letter, points = letter_grade(score)
+            parts.append(
+                f'<tr class="row-diem"><td>{stt}</td><td>{code}</td><td>{html.escape(name)}</td>'
+                f'<td>{course_credits}</td><td>30</td><td>70</td><td>{score:.1f}</td><td>{score:.1f}</td>'
+                f'<td>{score:.1f}</td><td>{letter}</td></tr>'
+            )
+            if points > 0:
+                credits += course_credits
+                points_4 += course_credits * points
+                points_10 += course_credits * score
+        total_credits += credits
+        total_points_4 += points_4
+        total_points_10 += points_10
+        summary = (
+            ('Điểm trung bình học kỳ hệ 4', f'{points_4 / credits if credits else 0:.2f}'),
+            ('Điểm trung bình học kỳ hệ 10', f'{points_10 / credits if credits else 0:.2f}'),
+            ('Điểm trung bình tích lũy (hệ 4)', f'{total_points_4 / total_credits if total_credits else 0:.2f}'),
+            ('Điểm trung bình tích lũy', f'{total_points_10 / total_credits if total_credits else 0:.2f}'),
+            ('Số tín chỉ đạt', f'{credits:.0f}'),
+            ('Số tín chỉ tích lũy', f'{total_credits:.0f}')
+        )
+        for label, value in summary:
+            parts.append(f'<tr class="row-diemTK"><td colspan="{colspan}"><span>{label}:</span> <span>{value}</span></td></tr>')
+
+    parts.append('</table></div>')
+    parts.append(f'<span id="ContentPlaceHolder1_ctl00_lblNgayCapNhatDiem">Ngày cập nhật điểm: {config.last_updated}</span>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def render_table(columns: Tuple[str, ...], rows: List[Tuple]) -> str:
+    parts = ['<table class="grid-view"><tr class="title-table">']
+    parts.extend(f'<th>{column}</th>' for column in columns)
+    parts.append('</tr>')
+    for row in rows:
+        parts.append('<tr>' + ''.join(f'<td>{html.escape(str(cell))}</td>' for cell in row) + '</tr>')
+    parts.append('</table>')
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=64)
+def render_timetable_page(username: str, config: PortalConfig) -> str:
+    """The thoikhoabieu page: the last semester's courses, two meetings a week each"""
+    courses = build_transcript(config)[-1] if config.semesters else []
+    rows = []
+    for c, (code, name, credits, _) in enumerate(courses):
+        for meeting in range(2):
+            rows.append((code, name, '01', credits, 'ITIT22IU01', DAYS[(c + meeting * 3) % len(DAYS)],
+                         1 + (c % 3) * 3 + meeting, 3, f'A{c + 1}.{101 + meeting}', 'TS. Nguyễn Văn B',
+                         '12345678901234--'))
+    return (f'<!DOCTYPE html><html><body><span id="lblUser">{html.escape(username)}</span>'
+            f'<div id="ContentPlaceHolder1_ctl00_pnlTKB">{render_table(TIMETABLE_COLUMNS, rows)}</div></body></html>')
+
+
+@lru_cache(maxsize=64)
+def render_exams_page(username: str, config: PortalConfig) -> str:
+    """The xemlichthi page: one final exam per course of the last semester"""
+    courses = build_transcript(config)[-1] if config.semesters else []
+    rows = [(c + 1, code, name, '', '001', 40, f'{10 + c:02d}/01/2026', '08:00' if c % 2 else '13:00', 90,
+             f'A{c + 1}.101', '') for c, (code, name, _, _) in enumerate(courses)]
+    return (f'<!DOCTYPE html><html><body><span id="lblUser">{html.escape(username)}</span>'
+            f'<div id="ContentPlaceHolder1_ctl00_pnlLichThi">{render_table(EXAM_COLUMNS, rows)}</div></body></html>')
+
+
+# Logged-in pages: ?page= value -> (counter name, renderer)
+PAGES = {
+    'xemdiemthi': ('grades', render_grades_page),
+    'thoikhoabieu': ('timetable', render_timetable_page),
+    'xemlichthi': ('exams', render_exams_page)
+}
+
+
+class FakePortal:
+    """Threaded HTTP server with per-request latency/failure injection and request counters"""
+
+    def __init__(self, config: Optional[PortalConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or PortalConfig()
+        self.sessions: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.config.failure_rate
+
+    def delay(self):
+        if self.config.latency or self.config.jitter:
+            with self._lock:
+                jitter = self._rng.uniform(0, self.config.jitter)
+            time.sleep(self.config.latency + jitter)
+
+    def start(self) -> 'FakePortal':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_html(self, body: str, status: int = 200, cookie: Optional[str] = None):
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                if cookie:
+                    self.send_header('Set-Cookie', f'ASP.NET_SessionId={cookie}; path=/; HttpOnly')
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def session_user(self) -> Optional[str]:
+                for part in self.headers.get('Cookie', '').split(';'):
+                    name, _, value = part.strip().partition('=')
+                    if name == 'ASP.NET_SessionId':
+                        return portal.sessions.get(value)
+                return None
+
+            def injected_failure(self) -> bool:
+                portal.delay()
+                if portal.should_fail():
+                    portal.count('failures')
+                    self.send_html('<html><body>Service Unavailable</body></html>', status=503)
+                    return True
+                return False
+
+            def do_GET(self):
+                if self.injected_failure():
+                    return
+                page = parse_qs(urlparse(self.path).query).get('page', [''])[0]
+                user = self.session_user()
+                if page in PAGES:
+                    counter, render = PAGES[page]
+                    portal.count(counter)
+                    if user is None:
+                        return self.send_html(render_login_page())
+                    return self.send_html(render(user, portal.config))
+                portal.count('login_page')
+                return self.send_html(render_home_page(user) if user else render_login_page())
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                if self.injected_failure():
+                    return
+                portal.count('login')
+                if form.get('__VIEWSTATE') != [VIEWSTATE]:
+                    return self.send_html('<html><body>Validation of viewstate MAC failed.</body></html>', status=500)
+                username = form.get(USERNAME_FIELD, [''])[0].upper()
+                if username and form.get(PASSWORD_FIELD) == [portal.config.password]:
+                    session_id = uuid.uuid4().hex
+                    portal.sessions[session_id] = username
+                    return self.send_html(render_home_page(username), cookie=session_id)
+                return self.send_html(render_login_page('Sai tên đăng nhập hoặc mật khẩu'))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the EduSoft portal')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--semesters', type=int, default=PortalConfig.semesters)
+    parser.add_argument('--courses', type=int, default=PortalConfig.courses_per_semester,
+                        help='courses per semester')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--password', default=PortalConfig.password)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = PortalConfig(
+        semesters=args.semesters,
+        courses_per_semester=args.courses,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        password=args.password,
+        seed=args.seed
+    )
+    portal = FakePortal(config, host=args.host, port=args.port)
+    print(f"🧪 Fake EduSoft portal on {portal.base_url} (password: {config.password})")
+    try:
+        portal.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
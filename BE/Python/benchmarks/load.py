@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Concurrent load generator for POST /api/grades
+
+Fires requests from a pool of worker threads and reports throughput,
+latency percentiles, HTTP statuses and cache statuses. Against a running
+API (itself pointed at the fake portal with EDUSOFT_BASE_URL):
+
+    python benchmarks/load.py --url http://127.0.0.1:5000 --concurrency 32 --requests 1000
+
+or fully offline, starting the fake portal and the Flask app in-process:
+
+    python benchmarks/load.py --self-contained --latency 0.1 --concurrency 32
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def run_load(url: str, usernames: List[str], password: str, total: int, concurrency: int) -> Dict:
+    """Send `total` requests spread round-robin over `usernames`"""
+    local = threading.local()
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    cache_statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def one(i: int):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = {'username': usernames[i % len(usernames)], 'password': password}
+        start = time.perf_counter()
+        try:
+            response = session.post(f'{url}/api/grades', json=body, timeout=120)
+            status = response.status_code
+            cache = (response.json().get('cache') or {}).get('status', '-')
+        except (requests.RequestException, ValueError) as e:
+            status, cache = type(e).__name__, '-'
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+            cache_statuses[cache] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(total / wall, 1) if wall else 0.0,
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latencies, p) * 1000, 1) for p in PERCENTILES},
+            'max': round(latencies[-1] * 1000, 1) if latencies else 0.0
+        },
+        'statuses': dict(statuses),
+        'cache': dict(cache_statuses)
+    }
+
+
+def start_self_contained(args) -> str:
+    """Start the fake portal and the Flask app in this process, return the API URL"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from werkzeug.serving import make_server
+
+    from fake_portal import FakePortal, PortalConfig
+    from script import PortalScraper
+
+    portal = FakePortal(PortalConfig(
+        semesters=args.semesters,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        password=args.password
+    )).start()
+    PortalScraper.BASE_URL = portal.base_url
+
+    from app import app
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def print_report(report: Dict):
+    latency = report['latency_ms']
+    print(f"📈 {report['requests']} requests, concurrency {report['concurrency']}, "
+          f"{report['wall_seconds']}s, {report['throughput_rps']} req/s")
+    print('   latency ms: ' + ', '.join(f'{name} {value}' for name, value in latency.items()))
+    print(f"   statuses: {report['statuses']}")
+    print(f"   cache: {report['cache']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Load test POST /api/grades')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='API base URL')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--users', type=int, default=50, help='distinct usernames to spread requests over')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--self-contained', action='store_true',
+                        help='start the fake portal and the API in-process instead of using --url')
+    parser.add_argument('--semesters', type=int, default=8, help='(self-contained) transcript length')
+    parser.add_argument('--latency', type=float, default=0.0, help='(self-contained) portal latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='(self-contained) extra random portal latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='(self-contained) portal 503 rate')
+    args = parser.parse_args(argv)
+
+    url = start_self_contained(args) if args.self_contained else args.url.rstrip('/')
+    usernames = [f'ITITIU{i:05d}' for i in range(args.users)]
+    print_report(run_load(url, usernames, args.password, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
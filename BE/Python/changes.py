@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Change detection between successive parsed transcripts
+
+diff_transcripts() compares two grades payloads and returns only what
+changed: added, changed and removed courses, updated semester summaries,
+cumulative figures and the degree classification. ChangeLog keeps a short
+per-student history of those deltas, so clients can ask for everything
+since a cursor instead of downloading the whole transcript again.
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from parsers import ROW_COURSE, SemesterSummarizer, summarize_rows
+
+# Columns that identify a course row rather than describe its result
+COURSE_KEY_COLUMNS = ('STT', 'Mã Môn')
+
+# (semester, course code, occurrence within that semester)
+CourseKey = Tuple[str, str, int]
+
+
+def course_rows(payload: Dict) -> 'OrderedDict[CourseKey, Dict]':
+    """Course rows of a payload keyed by semester and course code"""
+    summarizer = SemesterSummarizer()
+    rows: 'OrderedDict[CourseKey, Dict]' = OrderedDict()
+    seen: Dict[Tuple[str, str], int] = {}
+    for row in payload.get('grades') or []:
+        if summarizer.add_row(row.get('STT', '')) != ROW_COURSE:
+            continue
+        semester = summarizer.semesters[-1]['semester']
+        code = row.get('Mã Môn', '')
+        occurrence = seen.get((semester, code), 0)
+        seen[(semester, code)] = occurrence + 1
+        rows[(semester, code, occurrence)] = row
+    return rows
+
+
+def _semester_summaries(payload: Dict) -> 'OrderedDict[str, Dict]':
+    semesters = payload.get('semesters')
+    if semesters is None:
+        semesters, _ = summarize_rows(row.get('STT', '') for row in payload.get('grades') or [])
+    return OrderedDict((semester['semester'], semester) for semester in semesters)
+
+
+def _field_changes(old: Dict, new: Dict, skip=()) -> Dict[str, List]:
+    return {
+        field: [old.get(field), new.get(field)]
+        for field in dict.fromkeys(list(old) + list(new))
+        if field not in skip and old.get(field) != new.get(field)
+    }
+
+
+def _classification(payload: Dict) -> Optional[str]:
+    projection = payload.get('grade_projection') or {}
+    return projection.get('current_classification')
+
+
+def diff_transcripts(old: Dict, new: Dict) -> Dict:
+    """
+    Delta between two grades payloads; empty if nothing a client shows changed.
+
+    Sections are only present when they changed:
+    - courses: {added: [...], changed: [...], removed: [...]}
+    - semesters: {added: [...], changed: [...]}
+    - cumulative, classification, last_updated: {old: ..., new: ...}
+    """
+    delta: Dict = {}
+
+    old_courses, new_courses = course_rows(old), course_rows(new)
+    added = [dict(row, semester=key[0]) for key, row in new_courses.items() if key not in old_courses]
+    removed = [dict(row, semester=key[0]) for key, row in old_courses.items() if key not in new_courses]
+    changed = []
+    for key, row in new_courses.items():
+        previous = old_courses.get(key)
+        if previous is None:
+            continue
+        fields = _field_changes(previous, row, skip=COURSE_KEY_COLUMNS)
+        if fields:
+            changed.append({
+                'semester': key[0],
+                'code': key[1],
+                'name': row.get('Tên Môn', ''),
+                'changes': fields
+            })
+    courses = {name: items for name, items in (('added', added), ('changed', changed), ('removed', removed)) if items}
+    if courses:
+        delta['courses'] = courses
+
+    old_semesters, new_semesters = _semester_summaries(old), _semester_summaries(new)
+    semesters_added = [summary for name, summary in new_semesters.items() if name not in old_semesters]
+    semesters_changed = []
+    for name, summary in new_semesters.items():
+        if name in old_semesters:
+            fields = _field_changes(old_semesters[name], summary, skip=('semester',))
+            if fields:
+                semesters_changed.append({'semester': name, 'changes': fields})
+    semesters = {name: items for name, items in (('added', semesters_added), ('changed', semesters_changed)) if items}
+    if semesters:
+        delta['semesters'] = semesters
+
+    for section, old_value, new_value in (
+        ('cumulative', old.get('cumulative'), new.get('cumulative')),
+        ('classification', _classification(old), _classification(new)),
+        ('student_info', old.get('student_info'), new.get('student_info'))
+    ):
+        if old_value != new_value:
+            delta[section] = {'old': old_value, 'new': new_value}
+
+    # A new last-updated stamp alone isn't a change worth notifying about
+    if delta and old.get('last_updated') != new.get('last_updated'):
+        delta['last_updated'] = {'old': old.get('last_updated'), 'new': new.get('last_updated')}
+    return delta
+
+
+class ChangeLog:
+    """
+    Recent transcript deltas per student.
+
+    Keeps at most `history` deltas per student and `max_students` students
+    (least recently changed dropped first). Readers can block in wait() until
+    a delta newer than their cursor arrives.
+
+    Every delta gets the next id of one counter for the whole log, so an id
+    is never handed out twice, even after a student is dropped. Cursors are
+    '<epoch>-<id>'. The epoch is random per process, so a cursor from before
+    a restart or from another worker is recognized and answered with a reset
+    instead of being mistaken for a position in this log.
+    """
+
+    def __init__(self, history: int = 50, max_students: int = 1024):
+        self.history = history
+        self.max_students = max_students
+        self._cond = threading.Condition()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.epoch = secrets.token_hex(4)
+        # key -> [(id, delta)], oldest first
+        self._events: 'OrderedDict[str, List[Tuple[int, Dict]]]' = OrderedDict()
+        # key -> highest id of the student's deltas that may be missing (trimmed or dropped)
+        self._floors: Dict[str, int] = {}
+        self._last_id = 0
+        # Highest id of any dropped student's deltas
+        self._dropped = 0
+
+    def _log(self):
+        # Callers hold self._cond. A forked worker starts its own log (and epoch).
+        if self._pid != os.getpid():
+            self._start()
+
+    def parse_cursor(self, cursor: str) -> Optional[int]:
+        """
+        The id in a cursor from this log ('0' or '' for the beginning), or
+        None for a cursor from another process. Raises ValueError if malformed.
+        """
+        if cursor in ('', '0'):
+            return 0
+        epoch, separator, event_id = cursor.partition('-')
+        if not separator or not event_id.isdigit():
+            raise ValueError(f'Invalid cursor {cursor!r}')
+        with self._cond:
+            self._log()
+            return int(event_id) if epoch == self.epoch else None
+
+    def append(self, key: str, delta: Dict) -> Dict:
+        with self._cond:
+            self._log()
+            self._last_id += 1
+            event = dict(delta, id=f'{self.epoch}-{self._last_id}', at=time.time())
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = []
+                # Deltas of this student dropped earlier all have ids up to here
+                self._floors[key] = self._dropped
+            events.append((self._last_id, event))
+            if len(events) > self.history:
+                self._floors[key] = events[-self.history - 1][0]
+                del events[:-self.history]
+            self._events.move_to_end(key)
+            while len(self._events) > self.max_students:
+                dropped, dropped_events = self._events.popitem(last=False)
+                self._floors.pop(dropped, None)
+                self._dropped = max(self._dropped, dropped_events[-1][0])
+            self._cond.notify_all()
+            return event
+
+    def cursor(self, key: str) -> str:
+        """Cursor of the latest delta of a student (or of the log, if none is kept)"""
+        with self._cond:
+            self._log()
+            return self._latest(key)
+
+    def _latest(self, key: str) -> str:
+        events = self._events.get(key)
+        return f'{self.epoch}-{events[-1][0] if events else self._last_id}'
+
+    def since(self, key: str, cursor: str) -> Tuple[List[Dict], str, bool]:
+        """
+        Deltas newer than `cursor`, the latest cursor and whether the history
+        no longer reaches back to `cursor` (the client should refetch in full).
+        Raises ValueError for a malformed cursor.
+        """
+        event_id = self.parse_cursor(cursor)
+        with self._cond:
+            return self._since(key, event_id)
+
+    def _since(self, key: str, event_id: Optional[int]) -> Tuple[List[Dict], str, bool]:
+        latest = self._latest(key)
+        if event_id is None or event_id > self._last_id:
+            # Cursor from before a restart or from another worker
+            return [], latest, True
+        events = self._events.get(key, ())
+        newer = [event for id_, event in events if id_ > event_id]
+        truncated = event_id < self._floors.get(key, self._dropped)
+        return newer, latest, truncated
+
+    def wait(self, key: str, cursor: str, timeout: float) -> Tuple[List[Dict], str, bool]:
+        """since(), blocking up to `timeout` seconds until there is something newer than `cursor`"""
+        event_id = self.parse_cursor(cursor)
+        with self._cond:
+            self._cond.wait_for(lambda: any(self._since(key, event_id)[::2]), timeout)
+            return self._since(key, event_id)
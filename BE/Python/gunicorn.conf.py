@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the EduSoft Grade Scraper API
+
+    cd Python && gunicorn -c gunicorn.conf.py
+
+The app is created once in the master (preload_app) with every library the
+workers need already imported, then forked: a new or restarted worker
+serves traffic right after the fork instead of importing Flask, requests,
+the parser backend etc. itself, and shares those pages copy-on-write.
+"""
+
+import gc
+import os
+
+wsgi_app = 'app:create_app(preload_modules=True)'
+preload_app = True
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def pre_fork(server, worker):
+    # Objects the master created since preload() stay out of the workers' GC too
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads and processes don't survive fork(); start the per-worker ones here
+    from app import init_worker
+    init_worker()
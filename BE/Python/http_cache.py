@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+HTTP validators and compression for /api/grades responses
+
+ETag: weak, a hash of the serialized transcript (`data`) in the response's
+wire format. The envelope around it (`cache` with the entry's age etc.)
+isn't part of the hash, so a transcript keeps its tag until it changes.
+Last-Modified comes from the portal's "last updated" stamp. A request whose
+If-None-Match (or, without it, If-Modified-Since) still matches gets a 304
+with no body.
+
+Bodies are compressed with gzip or, with the optional `brotli` package, br,
+as Accept-Encoding allows. The transcript is serialized and deflated once
+per cached result (Representation); a gzip response is that precompressed
+segment between the freshly deflated envelope pieces. Independently
+deflated segments, each ended with a sync flush, are one valid deflate
+stream when concatenated. Brotli streams can't be joined like that, so br is
+compressed per response and only chosen when the client prefers it.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: br responses
+    brotli = None
+
+GZIP, BROTLI, IDENTITY = 'gzip', 'br', 'identity'
+
+# Smaller bodies (errors, 304s) aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+
+# Portal stamps are local time in Vietnam (no DST)
+PORTAL_TIMEZONE = timezone(timedelta(hours=7))
+STAMP_RE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})(?:\s+(\d{1,2}):(\d{2})(?::(\d{2}))?)?')
+
+# gzip member header: deflate, no flags, no mtime, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def stamp_datetime(stamp: str) -> Optional[datetime]:
+    """The portal's 'dd/mm/yyyy HH:MM' last-updated stamp as an aware datetime"""
+    match = STAMP_RE.search(stamp or '')
+    if not match:
+        return None
+    day, month, year, hour, minute, second = (int(part) if part else 0 for part in match.groups())
+    try:
+        return datetime(year, month, day, hour, minute, second, tzinfo=PORTAL_TIMEZONE)
+    except ValueError:
+        return None
+
+
+def deflate_segment(data: bytes, final: bool = False) -> bytes:
+    """
+    Raw deflate of `data` on its own. A non-final segment ends byte-aligned
+    (sync flush), so another segment can follow it in the same stream.
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def negotiate_encoding(accept_encodings) -> str:
+    """
+    Content coding for a werkzeug Accept-Encoding header. gzip wins ties,
+    since it is served precompressed; br only if the client prefers it.
+    """
+    gzip_q = accept_encodings.quality(GZIP)
+    br_q = accept_encodings.quality(BROTLI) if brotli is not None else 0
+    if br_q > gzip_q:
+        return BROTLI
+    if gzip_q > 0:
+        return GZIP
+    return IDENTITY
+
+
+class Representation:
+    """A transcript serialized once for one wire format, with its ETag and deflated form"""
+
+    __slots__ = ('data', 'etag', '_deflated')
+
+    def __init__(self, data: bytes, fmt: str):
+        self.data = data
+        # Opaque tag, unquoted; the header value is W/"<etag>"
+        self.etag = f'{fmt}-{hashlib.blake2b(data, digest_size=12).hexdigest()}'
+        self._deflated = None
+
+    def deflated(self) -> bytes:
+        # Compressed on the first gzip response, then reused
+        if self._deflated is None:
+            self._deflated = deflate_segment(self.data)
+        return self._deflated
+
+    def body(self, head: bytes, tail: bytes, encoding: str) -> Tuple[bytes, str]:
+        """head + data + tail in `encoding`, or uncompressed if it's small; returns (body, encoding used)"""
+        size = len(head) + len(self.data) + len(tail)
+        if encoding == IDENTITY or size < MIN_COMPRESS_SIZE:
+            return b''.join((head, self.data, tail)), IDENTITY
+        if encoding == BROTLI:
+            return brotli.compress(b''.join((head, self.data, tail)), quality=BROTLI_QUALITY), BROTLI
+        # Python's zlib can't combine CRCs, but running crc32 over data again is cheap
+        crc = zlib.crc32(tail, zlib.crc32(self.data, zlib.crc32(head)))
+        return b''.join((
+            GZIP_HEADER,
+            deflate_segment(head),
+            self.deflated(),
+            deflate_segment(tail, final=True),
+            struct.pack('<II', crc, size & 0xffffffff)
+        )), GZIP
+
+
+class RepresentationCache:
+    """
+    Representations per (result cache key, format), valid while the portal's
+    last-updated stamp is unchanged (the same rule the result cache uses to
+    skip re-parsing)
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[str, Representation]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, fmt: str, version: str) -> Optional[Representation]:
+        with self._lock:
+            cached = self._entries.get((key, fmt))
+            if cached is None or cached[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, fmt))
+            self.hits += 1
+            return cached[1]
+
+    def set(self, key: str, fmt: str, version: str, representation: Representation):
+        with self._lock:
+            self._entries[(key, fmt)] = (version, representation)
+            self._entries.move_to_end((key, fmt))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def not_modified(request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Whether the request's validators still match (If-None-Match takes precedence)"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified.replace(microsecond=0) <= since
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Shared cache of the portal's login form fields
+
+A login used to GET default.aspx only to read the hidden ASP.NET fields
+(__VIEWSTATE, __VIEWSTATEGENERATOR, ...) it posts back. The anonymous login
+form's fields stay the same for every visitor for long periods, so they
+are cached per portal for LOGIN_FORM_TTL seconds (0 disables the cache),
+and a login with a cached form is a single POST.
+
+If the portal rejects a postback made with a cached form as stale (its
+viewstate error page), the entry is dropped and the login is retried once
+with a freshly fetched form. Other failures, 5xx included, are never
+retried: the login POST is not resent while the portal is failing.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Error pages ASP.NET serves for a postback whose form state it can't use
+STALE_FORM_MARKERS = (
+    'Validation of viewstate MAC failed',
+    'Invalid viewstate',
+    'The state information is invalid'
+)
+
+_default_cache: Optional['LoginFormCache'] = None
+_default_cache_lock = threading.Lock()
+
+
+def is_stale_form_response(text: str) -> bool:
+    """Whether a login postback was rejected because of its form state"""
+    return any(marker in text for marker in STALE_FORM_MARKERS)
+
+
+class LoginFormCache:
+    """Login form fields per portal base URL, expiring after ttl seconds"""
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._forms: Dict[str, Tuple[Dict[str, str], float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, base_url: str) -> Optional[Dict[str, str]]:
+        """A copy of the cached fields, or None if there are none or they expired"""
+        with self._lock:
+            cached = self._forms.get(base_url)
+            if cached is None or time.monotonic() - cached[1] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(cached[0])
+
+    def set(self, base_url: str, fields: Dict[str, str]) -> bool:
+        """Cache fields read from a login page; returns False if they aren't a usable form"""
+        if self.ttl <= 0 or not fields.get('__VIEWSTATE'):
+            return False
+        with self._lock:
+            self._forms[base_url] = (dict(fields), time.monotonic())
+        return True
+
+    def invalidate(self, base_url: str, fields: Dict[str, str]):
+        """Drop the cached form if it still is `fields` (another login may have refreshed it)"""
+        with self._lock:
+            cached = self._forms.get(base_url)
+            if cached is not None and cached[0] == fields:
+                del self._forms[base_url]
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'forms': len(self._forms),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+
+def default_login_form_cache() -> LoginFormCache:
+    """The process-wide cache, configured by LOGIN_FORM_TTL"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LoginFormCache(ttl=float(os.environ.get('LOGIN_FORM_TTL', 600)))
+        return _default_cache
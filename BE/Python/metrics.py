@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Per-stage request timing and Prometheus metrics
+
+Code wraps each stage of a request (portal round trips, parsing, projection,
+serialization) in `stage(name)`. Every stage feeds a process-wide histogram
+exposed on /metrics in the Prometheus text format, and is also recorded on
+the current request (tracked with a contextvar) so the response can carry a
+Server-Timing header.
+
+A sampling profiler can be switched on with METRICS_PROFILE_SAMPLE_RATE:
+that fraction of requests runs under cProfile and the stats are logged, or
+written to METRICS_PROFILE_DIR when it is set.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, from cached responses (~1ms) to slow portal pages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('METRICS_PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('METRICS_PROFILE_DIR')
+
+# (stage, seconds) pairs recorded during the current request, None outside one
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_timings', default=None)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value combination"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts..., sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], metric_type: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.metric_type = metric_type
+
+    def collect(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}',
+                f'{self.name} {_format_value(self.read())}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All registered metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                logger.warning(f"Failed to collect metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'itpm_stage_duration_seconds',
+    'Time spent in each stage of a request (portal round trips, parsing, projection, serialization)',
+    labels=('stage',)
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    'itpm_request_duration_seconds',
+    'Time from the start of request handling to the response',
+    labels=('method', 'route', 'status')
+))
+QUEUE_SECONDS = registry.register(Histogram(
+    'itpm_request_queue_seconds',
+    'Time between the proxy accepting a request (X-Request-Start) and a worker picking it up'
+))
+
+
+def register_gauge(name: str, documentation: str, read: Callable[[], float]) -> CallbackMetric:
+    return registry.register(CallbackMetric(name, documentation, read))
+
+
+def register_counter(name: str, documentation: str, read: Callable[[], float]) -> CallbackMetric:
+    """A counter read from a callback; `read` must only ever increase"""
+    return registry.register(CallbackMetric(name, documentation, read, metric_type='counter'))
+
+
+def record(name: str, seconds: float):
+    """Record a finished stage on the histogram and the current request"""
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as request stage `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def queue_seconds(header: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Time spent queued before a worker picked the request up, from an
+    X-Request-Start header ("t=<epoch>" in seconds, milliseconds or
+    microseconds, as set by nginx, Heroku and similar proxies).
+    """
+    if not header:
+        return None
+    try:
+        started = float(header.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    # Normalize microseconds and milliseconds to seconds
+    while started > 1e11:
+        started /= 1000
+    waited = (now if now is not None else time.time()) - started
+    return waited if waited >= 0 else None
+
+
+def start_request(queue_header: Optional[str] = None):
+    """Begin collecting stage timings for the current request"""
+    timings = []
+    waited = queue_seconds(queue_header)
+    if waited is not None:
+        QUEUE_SECONDS.observe(waited)
+        timings.append(('queue', waited))
+    _timings.set(timings)
+
+
+def finish_request(method: str, route: str, status: int, seconds: float) -> str:
+    """Observe the request duration, stop collecting and return its Server-Timing header value"""
+    REQUEST_SECONDS.observe(seconds, method, route, str(status))
+    header = server_timing(seconds)
+    _timings.set(None)
+    return header
+
+
+def server_timing(total: Optional[float] = None) -> str:
+    """Server-Timing header value for the current request, stages with the same name summed"""
+    totals: Dict[str, float] = {}
+    for name, seconds in _timings.get() or ():
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in totals.items()]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def start_profile() -> Optional[cProfile.Profile]:
+    """
+    Start profiling the current thread for a METRICS_PROFILE_SAMPLE_RATE
+    fraction of calls; returns None when this call isn't sampled
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler: Optional[cProfile.Profile], label: str):
+    """Stop a profile from start_profile and log it, or dump it to METRICS_PROFILE_DIR"""
+    if profiler is None:
+        return
+    profiler.disable()
+    if PROFILE_DIR:
+        safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_') or 'request'
+        path = os.path.join(PROFILE_DIR, f'{safe_label}-{time.time():.6f}.prof')
+        profiler.dump_stats(path)
+        logger.info(f"Profile for {label} written to {path}")
+    else:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+        logger.info(f"Profile for {label}:\n{out.getvalue()}")
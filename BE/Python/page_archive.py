@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Content-addressed archive of raw portal pages, and bulk re-parsing of it
+
+With PAGE_ARCHIVE_DIR set, every portal page the API parses is archived. When
+the portal layout changes or a parser improves, the structured data is then
+regenerated from the archive (reparse()) as a local CPU job, instead of
+scraping every student again.
+
+Each distinct page content (SHA-256 of the HTML) is stored once, compressed
+with zstd (the optional `zstandard` package) or zlib, in append-only segment
+files of about PAGE_ARCHIVE_SEGMENT_SIZE bytes. An SQLite index maps every
+(student, page, fetch time) to a content digest, and every digest to its
+place in a segment. Each record in a segment starts with a header carrying
+its codec, digest and length, so segments can be checked on their own.
+
+    python page_archive.py stats --archive /var/lib/itpm/pages
+    python page_archive.py reparse --archive /var/lib/itpm/pages --store transcripts.db --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is used instead
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: appends are only serialized within the process
+    fcntl = None
+
+from pages import PAGE_PARSERS
+from parse_pool import _init_worker, _worker_parser
+from parsers import build_grades, default_parser
+from script import GRADES
+
+ZSTD, ZLIB = 'zstd', 'zlib'
+CODEC_IDS = {ZSTD: 1, ZLIB: 2}
+# Levels past 6 are several times slower for about 1% smaller portal pages
+ZSTD_LEVEL = int(os.environ.get('PAGE_ARCHIVE_ZSTD_LEVEL', 6))
+
+# Record header: magic, codec id, SHA-256 digest, payload length
+RECORD_MAGIC = b'ITPA'
+RECORD_HEADER = struct.Struct('>4sB32sI')
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+class ArchivedPage(NamedTuple):
+    student: str
+    page: str
+    fetched_at: float
+    digest: str
+
+
+# Where a page's content is stored: (segment, offset, length, codec)
+BlobLocation = Tuple[int, int, int, str]
+
+
+def compress(raw: bytes, codec: str) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return zlib.compress(raw, 9)
+
+
+def decompress(payload: bytes, codec: str) -> bytes:
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('This archive has zstd records; install the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f'segment-{segment:06d}.bin')
+
+
+def read_blob(directory: str, digest: str, location: BlobLocation) -> str:
+    """The page stored at `location`, checked against its digest"""
+    segment, offset, length, codec = location
+    with open(segment_path(directory, segment), 'rb') as f:
+        f.seek(offset)
+        payload = f.read(length)
+    raw = decompress(payload, codec)
+    if hashlib.sha256(raw).hexdigest() != digest:
+        raise ValueError(f'Archived page {digest} is corrupt')
+    return raw.decode('utf-8')
+
+
+class PageArchive:
+    """Append-only page store in `directory`, safe to share between processes"""
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE, codec: Optional[str] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.codec = codec or (ZSTD if zstandard is not None else ZLIB)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            ' digest TEXT PRIMARY KEY,'
+            ' segment INTEGER NOT NULL,'
+            ' offset INTEGER NOT NULL,'
+            ' length INTEGER NOT NULL,'
+            ' raw_size INTEGER NOT NULL,'
+            ' codec TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' student TEXT NOT NULL,'
+            ' page TEXT NOT NULL,'
+            ' fetched_at REAL NOT NULL,'
+            ' digest TEXT NOT NULL REFERENCES blobs (digest));'
+            'CREATE INDEX IF NOT EXISTS pages_student ON pages (student, page, fetched_at);'
+            'CREATE INDEX IF NOT EXISTS pages_page ON pages (page, fetched_at);'
+        )
+        # Serializes segment appends across processes (gunicorn workers)
+        self._lock_file = open(os.path.join(self.directory, 'archive.lock'), 'a')
+
+    def _db(self) -> sqlite3.Connection:
+        # Callers hold self._lock; a forked worker opens its own connection (see SQLiteCacheBackend)
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    @contextmanager
+    def _appending(self):
+        with self._lock:
+            conn = self._db()
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield conn
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def put(self, student: str, page: str, html: str, fetched_at: Optional[float] = None) -> str:
+        """Archive a fetched page; content already in the archive is only indexed. Returns its digest."""
+        raw = html.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        # Compress before taking the cross-worker lock; blobs are never removed, so content found now stays archived
+        with self._lock:
+            archived = self._db().execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone() is not None
+        payload = None if archived else compress(raw, self.codec)
+        with self._appending() as conn:
+            if payload is not None and conn.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone() is None:
+                segment, offset = self._append(conn, digest, payload)
+                conn.execute('INSERT INTO blobs VALUES (?, ?, ?, ?, ?, ?)',
+                             (digest, segment, offset, len(payload), len(raw), self.codec))
+            conn.execute('INSERT INTO pages VALUES (?, ?, ?, ?)',
+                         (student.strip().upper(), page, fetched_at or time.time(), digest))
+            conn.commit()
+        return digest
+
+    def _append(self, conn: sqlite3.Connection, digest: str, payload: bytes) -> Tuple[int, int]:
+        """Write a record to the newest segment (starting a new one once it's full); returns where the payload is"""
+        segment = conn.execute('SELECT MAX(segment) FROM blobs').fetchone()[0] or 1
+        path = segment_path(self.directory, segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+            segment += 1
+            path = segment_path(self.directory, segment)
+        with open(path, 'ab') as f:
+            # Any bytes past the last indexed record are from an interrupted append
+            offset = f.tell() + RECORD_HEADER.size
+            f.write(RECORD_HEADER.pack(RECORD_MAGIC, CODEC_IDS[self.codec], bytes.fromhex(digest), len(payload)))
+            f.write(payload)
+        return segment, offset
+
+    def location(self, digest: str) -> BlobLocation:
+        with self._lock:
+            row = self._db().execute(
+                'SELECT segment, offset, length, codec FROM blobs WHERE digest = ?', (digest,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        return row
+
+    def get(self, digest: str) -> str:
+        """The archived page with this digest"""
+        return read_blob(self.directory, digest, self.location(digest))
+
+    def history(self, student: str, page: Optional[str] = None) -> List[ArchivedPage]:
+        """Every archived fetch for a student, oldest first"""
+        query = 'SELECT student, page, fetched_at, digest FROM pages WHERE student = ?'
+        params = [student.strip().upper()]
+        if page is not None:
+            query += ' AND page = ?'
+            params.append(page)
+        with self._lock:
+            rows = self._db().execute(query + ' ORDER BY fetched_at', params).fetchall()
+        return [ArchivedPage(*row) for row in rows]
+
+    def select(self, page: str = GRADES, since: Optional[float] = None,
+               latest_only: bool = True) -> List[Tuple[ArchivedPage, BlobLocation]]:
+        """Archived fetches of a page (only each student's latest by default) with their locations"""
+        if latest_only:
+            # SQLite takes the bare columns from the row holding MAX(fetched_at)
+            query = ('SELECT student, page, MAX(fetched_at) AS fetched_at, digest FROM pages'
+                     ' WHERE page = ? AND fetched_at >= ? GROUP BY student')
+        else:
+            query = 'SELECT student, page, fetched_at, digest FROM pages WHERE page = ? AND fetched_at >= ?'
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute(
+                f'SELECT p.student, p.page, p.fetched_at, p.digest, b.segment, b.offset, b.length, b.codec'
+                f' FROM ({query}) AS p JOIN blobs AS b ON b.digest = p.digest ORDER BY p.student, p.fetched_at',
+                (page, since or 0)
+            ).fetchall()
+        return [(ArchivedPage(*row[:4]), tuple(row[4:])) for row in rows]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._db()
+            pages, students = conn.execute('SELECT COUNT(*), COUNT(DISTINCT student) FROM pages').fetchone()
+            blobs, raw_bytes, stored_bytes, segments = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length), 0), COUNT(DISTINCT segment)'
+                ' FROM blobs'
+            ).fetchone()
+        return {
+            'pages': pages,
+            'students': students,
+            'blobs': blobs,
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'segments': segments,
+            'codec': self.codec
+        }
+
+
+def _reparse_blob(directory: str, page: str, backend: str, digest: str, location: BlobLocation) -> Dict:
+    """Read and parse one archived page in a worker; errors come back as {'error': ...}"""
+    try:
+        html = read_blob(directory, digest, location)
+        if page == GRADES:
+            return build_grades(_worker_parser(backend).extract(html))
+        return PAGE_PARSERS[page](html)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+
+def reparse(archive: PageArchive, page: str = GRADES, workers: Optional[int] = None, backend: Optional[str] = None,
+            latest_only: bool = True, since: Optional[float] = None) -> Iterator[Tuple[ArchivedPage, Dict]]:
+    """
+    Parse archived pages again on a process pool, yielding (page, parsed data)
+    as results arrive. Content shared by several fetches is parsed once.
+    """
+    by_digest: Dict[str, List[ArchivedPage]] = {}
+    locations: Dict[str, BlobLocation] = {}
+    for entry, location in archive.select(page, since=since, latest_only=latest_only):
+        by_digest.setdefault(entry.digest, []).append(entry)
+        locations[entry.digest] = location
+    if not by_digest:
+        return
+
+    backend = backend or default_parser().name
+    workers = workers or os.cpu_count() or 4
+    digests = list(by_digest)
+    count = len(digests)
+    # Same start method as the parse pool (see parse_pool.py)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(backend,)) as executor:
+        results = executor.map(
+            _reparse_blob,
+            [archive.directory] * count, [page] * count, [backend] * count,
+            digests, [locations[digest] for digest in digests],
+            chunksize=max(1, min(64, count // (workers * 4)))
+        )
+        for digest, data in zip(digests, results):
+            for entry in by_digest[digest]:
+                yield entry, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive of raw portal pages')
+    parser.add_argument('command', choices=('stats', 'reparse'))
+    parser.add_argument('--archive', default=os.environ.get('PAGE_ARCHIVE_DIR'), required='PAGE_ARCHIVE_DIR' not in os.environ,
+                        help='archive directory (default: PAGE_ARCHIVE_DIR)')
+    parser.add_argument('--page', default=GRADES, choices=(GRADES, *PAGE_PARSERS))
+    parser.add_argument('--all-versions', action='store_true', help="every archived fetch, not only each student's latest")
+    parser.add_argument('--since', type=float, help='only pages fetched at or after this Unix time')
+    parser.add_argument('--workers', type=int, help='parse processes (default: CPU count)')
+    parser.add_argument('--backend', help='grades parser backend (default: the best installed)')
+    parser.add_argument('--store', help='write re-parsed grades to this transcript store (SQLite file)')
+    parser.add_argument('--out', help='write results as JSON lines to this file (- for stdout)')
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    if args.command == 'stats':
+        print(json.dumps(archive.stats(), indent=2))
+        return
+
+    store = None
+    if args.store:
+        from projection import calculate_grade_projection
+        from transcript_store import TranscriptStore
+        store = TranscriptStore(args.store)
+    out = None
+    if args.out:
+        out = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8')
+
+    started = time.perf_counter()
+    parsed = failed = 0
+    for entry, data in reparse(archive, args.page, workers=args.workers, backend=args.backend,
+                               latest_only=not args.all_versions, since=args.since):
+        if 'error' in data:
+            failed += 1
+            print(f"❌ {entry.student} {entry.digest[:12]}: {data['error']}", file=sys.stderr)
+            continue
+        parsed += 1
+        if store is not None and args.page == GRADES:
+            # Same projection the API attaches (see attach_grade_projection in app.py)
+            grade_projection = calculate_grade_projection(data)
+            if grade_projection is not None:
+                data['grade_projection'] = grade_projection
+            store.upsert(data)
+        if out is not None:
+            out.write(json.dumps({**entry._asdict(), 'data': data}, ensure_ascii=False) + '\n')
+    if out is not None and out is not sys.stdout:
+        out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Re-parsed {parsed} {args.page} pages ({failed} failed) in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
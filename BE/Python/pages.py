@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Parsers for the portal pages other than the grades page
+
+The timetable (page=thoikhoabieu) and the exam schedule (page=xemlichthi)
+are ASP.NET grids: a table whose first row holds the column titles. The
+table is found by its title row (it has a course code column) rather than
+by element ids, and every row below it becomes a dict. Known columns get
+English keys (code, course, room, ...); others keep the portal's title.
+"""
+
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional
+
+TIMETABLE, EXAMS = 'timetable', 'exams'
+
+# Normalized column title -> key in the parsed rows
+COLUMN_KEYS = {
+    'stt': 'stt',
+    'mã mh': 'code',
+    'mã môn học': 'code',
+    'tên môn học': 'course',
+    'tên mh': 'course',
+    'nhóm': 'group',
+    'nhóm tổ': 'group',
+    'tổ': 'lab_group',
+    'tổ th': 'lab_group',
+    'số tc': 'credits',
+    'stc': 'credits',
+    'lớp': 'class',
+    'thứ': 'day',
+    'tiết bd': 'start_period',
+    'tiết bắt đầu': 'start_period',
+    'số tiết': 'periods',
+    'phòng': 'room',
+    'phòng học': 'room',
+    'phòng thi': 'room',
+    'giảng viên': 'professor',
+    'cbgd': 'professor',
+    'tuần học': 'weeks',
+    'ghép thi': 'combined_with',
+    'tổ thi': 'exam_group',
+    'số lượng': 'students',
+    'ngày thi': 'date',
+    'giờ bđ': 'start_time',
+    'giờ bắt đầu': 'start_time',
+    'số phút': 'minutes',
+    'hình thức thi': 'format',
+    'ghi chú': 'note'
+}
+# A title row has one of these
+KEY_COLUMNS = ('code',)
+
+
+def normalize_title(text: str) -> str:
+    return ' '.join(text.split()).rstrip(':').lower()
+
+
+class TableExtractor(HTMLParser):
+    """Collects the text of every table cell, grouped by table and row"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # One list of rows per table, in document order of the <table> tags
+        self.tables: List[List[List[str]]] = []
+        self._open: List[int] = []
+        self._cell: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self._close_cell()
+            self.tables.append([])
+            self._open.append(len(self.tables) - 1)
+        elif not self._open:
+            return
+        elif tag == 'tr':
+            self._close_cell()
+            self.tables[self._open[-1]].append([])
+        elif tag in ('td', 'th'):
+            self._close_cell()
+            rows = self.tables[self._open[-1]]
+            if not rows:
+                rows.append([])
+            self._cell = []
+        elif tag == 'br' and self._cell is not None:
+            self._cell.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th', 'tr'):
+            self._close_cell()
+        elif tag == 'table' and self._open:
+            self._close_cell()
+            self._open.pop()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _close_cell(self):
+        if self._cell is not None and self._open:
+            self.tables[self._open[-1]][-1].append(' '.join(''.join(self._cell).split()))
+        self._cell = None
+
+
+def extract_rows(html: str) -> List[Dict[str, str]]:
+    """Rows of the first table with a course code column, keyed by column"""
+    extractor = TableExtractor()
+    extractor.feed(html)
+    extractor.close()
+    for rows in extractor.tables:
+        for position, titles in enumerate(rows):
+            keys = [COLUMN_KEYS.get(normalize_title(title), title.strip()) for title in titles]
+            if not any(key in keys for key in KEY_COLUMNS):
+                continue
+            # Rows with fewer cells are group headings or notes spanning the table
+            return [dict(zip(keys, cells)) for cells in rows[position + 1:]
+                    if len(cells) == len(keys) and any(cells)]
+    return []
+
+
+def parse_timetable(html: str) -> Dict:
+    """page=thoikhoabieu: one entry per class meeting, with its period range as `time`"""
+    classes = extract_rows(html)
+    for entry in classes:
+        try:
+            start = int(entry['start_period'])
+            end = start + int(entry['periods']) - 1
+        except (KeyError, ValueError):
+            continue
+        entry['time'] = f'{start}-{end}'
+    return {'classes': classes}
+
+
+def parse_exam_schedule(html: str) -> Dict:
+    """page=xemlichthi: one entry per exam"""
+    return {'exams': extract_rows(html)}
+
+
+# Parser per bundle page name (see EdusoftScraper.PAGES)
+PAGE_PARSERS: Dict[str, Callable[[str], Dict]] = {
+    TIMETABLE: parse_timetable,
+    EXAMS: parse_exam_schedule
+}
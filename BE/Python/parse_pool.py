@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Where grades pages get parsed
+
+Parsing is CPU-bound and holds the GIL, so in a threaded worker a burst of
+large transcripts stalls every request thread behind it, including the ones
+only waiting on the portal. PARSE_EXECUTOR picks where
+EdusoftScraper.parse_grades() runs:
+
+- inline (default): in the request thread
+- thread: a thread pool of PARSE_WORKERS threads; caps concurrent parses and
+  overlaps with lxml, which releases the GIL while parsing
+- process: PARSE_WORKERS warm worker processes that import the parser
+  backend on start, so parsing scales across cores
+
+Workers get the raw HTML and send back only the extracted cells (student
+info, headers, rows, last-updated stamp). Row dicts and semester summaries
+are built in the calling process, which keeps the data sent back small.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from parsers import Extracted, GradesParser, build_grades, default_parser, get_parser
+
+logger = logging.getLogger(__name__)
+
+INLINE, THREAD, PROCESS = 'inline', 'thread', 'process'
+MODES = (INLINE, THREAD, PROCESS)
+
+# Parser backends created in a worker process, by name
+_worker_parsers: Dict[str, GradesParser] = {}
+
+_default_pool: Optional['ParsePool'] = None
+_default_pool_lock = threading.Lock()
+
+
+def _worker_parser(backend: str) -> GradesParser:
+    parser = _worker_parsers.get(backend)
+    if parser is None:
+        parser = _worker_parsers[backend] = get_parser(backend)
+    return parser
+
+
+def _init_worker(backend: str):
+    # Import the backend (bs4, lxml or selectolax) before the first page arrives
+    _worker_parser(backend)
+
+
+def _extract(backend: str, html: str) -> Extracted:
+    return _worker_parser(backend).extract(html)
+
+
+def _ready(backend: str) -> str:
+    return _worker_parser(backend).name
+
+
+class ParsePool:
+    """Runs GradesParser.extract() inline, on a thread pool or on warm worker processes"""
+
+    def __init__(self, mode: str = INLINE, workers: Optional[int] = None, backend: Optional[str] = None):
+        if mode not in MODES:
+            raise ValueError(f"PARSE_EXECUTOR must be one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 4
+        self._backend = backend
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def backend(self) -> str:
+        """Backend the worker processes use; their parser must match the callers'"""
+        if self._backend is None:
+            # Resolved on first use, so creating the pool doesn't import a parser backend
+            self._backend = default_parser().name
+        return self._backend
+
+    def _create_executor(self) -> Optional[Executor]:
+        if self.mode == THREAD:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        if self.mode == PROCESS:
+            # Forking a process that already runs threads can leave locks held in
+            # the child; start workers from a clean forkserver (or spawn) instead
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                       initializer=_init_worker, initargs=(self.backend,))
+        return None
+
+    def executor(self) -> Optional[Executor]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def warm(self):
+        """Start every worker now rather than on the first parses"""
+        if self.mode != PROCESS:
+            return
+        executor = self.executor()
+        try:
+            # Workers are started on demand, one per task that finds none idle
+            futures = [executor.submit(_ready, self.backend) for _ in range(self.workers)]
+        except RuntimeError:
+            # A starting worker re-importing the main module (app.py under
+            # `python app.py`) may not start workers of its own
+            return
+        for future in futures:
+            future.result()
+        logger.info(f"Started {self.workers} parse worker processes ({self.backend})")
+
+    def in_flight(self) -> int:
+        """Parses submitted and not yet finished"""
+        return self._in_flight
+
+    def extract(self, parser: GradesParser, html: str) -> Extracted:
+        executor = self.executor()
+        if executor is None:
+            return parser.extract(html)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if self.mode == PROCESS:
+                if parser.name != self.backend:
+                    return parser.extract(html)
+                return executor.submit(_extract, self.backend, html).result()
+            return executor.submit(parser.extract, html).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer): replace the pool, parse here
+            logger.error("Parse worker pool broke, restarting it")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            return parser.extract(html)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def parse_grades(self, parser: GradesParser, html: str) -> Dict:
+        """parser.parse_grades(html), with the extraction run on this pool"""
+        return build_grades(self.extract(parser, html))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def default_pool() -> ParsePool:
+    """The process-wide pool configured by PARSE_EXECUTOR and PARSE_WORKERS"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            workers = os.environ.get('PARSE_WORKERS')
+            _default_pool = ParsePool(
+                mode=os.environ.get('PARSE_EXECUTOR', INLINE),
+                workers=int(workers) if workers else None
+            )
+        return _default_pool
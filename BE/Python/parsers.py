@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+HTML parsing backends for EduSoft portal pages
+
+The grades page can be parsed with selectolax or lxml (both C-backed) or with
+BeautifulSoup's pure-Python html.parser as a fallback. All backends return the
+same structure. StreamingGradesParser produces it too, incrementally, from a
+page that is still downloading. Hidden login form fields and the last-updated stamp are pulled
+out with regular expressions so those pages don't need a parse tree at all.
+"""
+
+import html as html_lib
+import logging
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Student info key -> span id on the grades page
+STUDENT_INFO_FIELDS = {
+    'ma_sinh_vien': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblMaSinhVien',
+    'ten_sinh_vien': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblTenSinhVien',
+    'lop': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblLop',
+    'nganh': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lbNganh',
+    'khoa': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblKhoa',
+    'phai': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblPhai',
+    'noi_sinh': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblNoiSinh',
+    'he_dao_tao': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblHeDaoTao',
+    'khoa_hoc': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblKhoaHoc',
+    'co_van_hoc_tap': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblCVHT'
+}
+GRADES_CONTAINER_ID = 'ContentPlaceHolder1_ctl00_div1'
+LAST_UPDATED_ID = 'ContentPlaceHolder1_ctl00_lblNgayCapNhatDiem'
+
+# Hidden ASP.NET fields posted back with the login form
+FORM_FIELDS = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTTARGET', '__EVENTARGUMENT')
+
+INPUT_TAG_RE = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+ATTRIBUTE_RE = re.compile(r'''([^\s=/>]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''')
+LAST_UPDATED_RE = re.compile(
+    r'<span[^>]*\bid=["\']' + LAST_UPDATED_ID + r'["\'][^>]*>(.*?)</span>',
+    re.IGNORECASE | re.DOTALL
+)
+TAG_RE = re.compile(r'<[^>]+>')
+
+# Transcript rows are told apart by their first (STT) cell
+SEMESTER_HEADER_RE = re.compile(r'^\s*Học kỳ')
+SUMMARY_ROW_RE = re.compile(
+    r'(?P<label>Điểm trung bình học kỳ hệ 4|Điểm trung bình học kỳ hệ 10'
+    r'|Điểm trung bình tích lũy \(hệ 4\)|Điểm trung bình tích lũy(?: \(hệ 10\))?'
+    r'|Số tín chỉ đạt|Số tín chỉ tích lũy)\s*:?\s*(?P<value>\d+(?:[.,]\d+)?)'
+)
+SUMMARY_FIELDS = {
+    'Điểm trung bình học kỳ hệ 4': ('semester_gpa_4', float),
+    'Điểm trung bình học kỳ hệ 10': ('semester_gpa_10', float),
+    'Điểm trung bình tích lũy (hệ 4)': ('cumulative_gpa_4', float),
+    'Điểm trung bình tích lũy': ('cumulative_gpa_10', float),
+    'Điểm trung bình tích lũy (hệ 10)': ('cumulative_gpa_10', float),
+    'Số tín chỉ đạt': ('credits_passed', int),
+    'Số tín chỉ tích lũy': ('cumulative_credits', int)
+}
+ROW_SEMESTER, ROW_SUMMARY, ROW_COURSE = 'semester', 'summary', 'course'
+
+# (student_info, header cells, row cells, last_updated) as extracted by a backend
+Extracted = Tuple[Dict[str, str], List[str], List[List[str]], str]
+
+
+def _tag_attributes(tag: str) -> Dict[str, str]:
+    attributes = {}
+    for match in ATTRIBUTE_RE.finditer(tag):
+        value = next((v for v in match.group(2, 3, 4) if v is not None), '')
+        attributes[match.group(1).lower()] = html_lib.unescape(value)
+    return attributes
+
+
+def extract_form_fields(html: str) -> Dict[str, str]:
+    """Extract VIEWSTATE and the other hidden form fields with a regex scan"""
+    fields = dict.fromkeys(FORM_FIELDS, '')
+    missing = set(FORM_FIELDS)
+    for match in INPUT_TAG_RE.finditer(html):
+        tag = match.group(0)
+        if '__' not in tag:
+            continue
+        attributes = _tag_attributes(tag)
+        name = attributes.get('name')
+        if name in missing:
+            fields[name] = attributes.get('value', '')
+            missing.discard(name)
+            if not missing:
+                break
+    return fields
+
+
+def extract_last_updated(html: str) -> str:
+    """Extract the grades "last updated" stamp with a regex scan"""
+    match = LAST_UPDATED_RE.search(html)
+    if not match:
+        return ''
+    return html_lib.unescape(TAG_RE.sub('', match.group(1))).strip()
+
+
+class SemesterSummarizer:
+    """
+    Classifies transcript rows by their STT cell and accumulates typed
+    per-semester summaries (semester/cumulative GPA and credits) as rows
+    are added, so the cumulative figures never need a second pass.
+    """
+
+    def __init__(self):
+        self.semesters: List[Dict] = []
+        self._current: Optional[Dict] = None
+
+    def _semester(self, name: str = '') -> Dict:
+        semester = {'semester': name, 'course_count': 0}
+        for field, _ in SUMMARY_FIELDS.values():
+            semester[field] = None
+        self.semesters.append(semester)
+        self._current = semester
+        return semester
+
+    def add_row(self, stt: str) -> str:
+        """Record a row given its STT cell; returns the row kind"""
+        if SEMESTER_HEADER_RE.match(stt):
+            self._semester(stt)
+            return ROW_SEMESTER
+
+        semester = self._current or self._semester()
+        match = SUMMARY_ROW_RE.search(stt)
+        if match:
+            field, convert = SUMMARY_FIELDS[match.group('label')]
+            value = match.group('value').replace(',', '.')
+            semester[field] = convert(float(value))
+            return ROW_SUMMARY
+
+        semester['course_count'] += 1
+        return ROW_COURSE
+
+    def cumulative(self) -> Dict:
+        """Latest cumulative GPA (4 and 10 scale) and accumulated credits"""
+        latest = {'gpa_4': None, 'gpa_10': None, 'credits': None}
+        fields = (('gpa_4', 'cumulative_gpa_4'), ('gpa_10', 'cumulative_gpa_10'),
+                  ('credits', 'cumulative_credits'))
+        for key, field in fields:
+            for semester in reversed(self.semesters):
+                if semester[field] is not None:
+                    latest[key] = semester[field]
+                    break
+        return latest
+
+
+def summarize_rows(stt_cells) -> Tuple[List[Dict], Dict]:
+    """Per-semester summaries and cumulative figures for a sequence of STT cells"""
+    summarizer = SemesterSummarizer()
+    for stt in stt_cells:
+        summarizer.add_row(stt)
+    return summarizer.semesters, summarizer.cumulative()
+
+
+def build_grades(extracted: Extracted) -> Dict:
+    """The grades payload (row dicts, semester summaries) for a backend's extracted cells"""
+    student_info, headers, rows, last_updated = extracted
+
+    grades = []
+    summarizer = SemesterSummarizer()
+    for cells in rows:
+        if cells:
+            summarizer.add_row(cells[0])
+            grades.append({
+                headers[i] if i < len(headers) else f'column_{i}': value
+                for i, value in enumerate(cells)
+            })
+
+    return {
+        'student_info': student_info,
+        'grades': grades,
+        'last_updated': last_updated,
+        'semesters': summarizer.semesters,
+        'cumulative': summarizer.cumulative()
+    }
+
+
+class GradesParser:
+    """Base class for grades page parsers; subclasses implement `extract`"""
+
+    name = ''
+
+    def extract(self, html: str) -> Extracted:
+        raise NotImplementedError
+
+    def parse_grades(self, html: str) -> Dict:
+        """Parse student info and grades from HTML"""
+        return build_grades(self.extract(html))
+
+
+class SoupParser(GradesParser):
+    """Pure-Python fallback using BeautifulSoup with html.parser"""
+
+    name = 'html.parser'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def extract(self, html: str) -> Extracted:
+        soup = self._soup(html, 'html.parser')
+
+        # One pass over the spans instead of one find() per field
+        wanted = set(STUDENT_INFO_FIELDS.values())
+        wanted.add(LAST_UPDATED_ID)
+        spans = {}
+        for span in soup.find_all('span', id=True):
+            element_id = span['id']
+            if element_id in wanted and element_id not in spans:
+                spans[element_id] = span.text.strip()
+        student_info = {
+            key: spans[element_id]
+            for key, element_id in STUDENT_INFO_FIELDS.items()
+            if element_id in spans
+        }
+
+        headers, rows = [], []
+        container = soup.find('div', {'id': GRADES_CONTAINER_ID})
+        table = container.find('table') if container else None
+        if table:
+            trs = table.find_all('tr')
+            if trs:
+                headers = [cell.text.strip() for cell in trs[0].find_all(['th', 'td'])]
+            rows = [[cell.text.strip() for cell in tr.find_all('td')] for tr in trs[1:]]
+
+        return student_info, headers, rows, spans.get(LAST_UPDATED_ID, '')
+
+
+class LxmlParser(GradesParser):
+    """C-backed parser using lxml.html"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        self._fromstring = lxml.html.document_fromstring
+
+    def _document(self, html: str):
+        try:
+            return self._fromstring(html)
+        except ValueError:
+            # lxml refuses str input carrying an XML encoding declaration
+            return self._fromstring(html.encode('utf-8'))
+
+    def extract(self, html: str) -> Extracted:
+        document = self._document(html)
+
+        wanted = set(STUDENT_INFO_FIELDS.values())
+        wanted.add(LAST_UPDATED_ID)
+        spans = {}
+        for span in document.iter('span'):
+            element_id = span.get('id')
+            if element_id in wanted and element_id not in spans:
+                spans[element_id] = span.text_content().strip()
+        student_info = {
+            key: spans[element_id]
+            for key, element_id in STUDENT_INFO_FIELDS.items()
+            if element_id in spans
+        }
+
+        headers, rows = [], []
+        containers = document.xpath('//div[@id=$id]', id=GRADES_CONTAINER_ID)
+        table = containers[0].find('.//table') if containers else None
+        if table is not None:
+            trs = list(table.iter('tr'))
+            if trs:
+                headers = [cell.text_content().strip() for cell in trs[0].iter('th', 'td')]
+            rows = [[cell.text_content().strip() for cell in tr.iter('td')] for tr in trs[1:]]
+
+        return student_info, headers, rows, spans.get(LAST_UPDATED_ID, '')
+
+
+class SelectolaxParser(GradesParser):
+    """C-backed parser using selectolax (lexbor engine)"""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def extract(self, html: str) -> Extracted:
+        tree = self._parser(html)
+
+        wanted = set(STUDENT_INFO_FIELDS.values())
+        wanted.add(LAST_UPDATED_ID)
+        spans = {}
+        for span in tree.css('span[id]'):
+            element_id = span.attributes.get('id')
+            if element_id in wanted and element_id not in spans:
+                spans[element_id] = span.text().strip()
+        student_info = {
+            key: spans[element_id]
+            for key, element_id in STUDENT_INFO_FIELDS.items()
+            if element_id in spans
+        }
+
+        headers, rows = [], []
+        container = tree.css_first(f'div#{GRADES_CONTAINER_ID}')
+        table = container.css_first('table') if container else None
+        if table is not None:
+            trs = table.css('tr')
+            if trs:
+                headers = [cell.text().strip() for cell in trs[0].css('th, td')]
+            rows = [[cell.text().strip() for cell in tr.css('td')] for tr in trs[1:]]
+
+        return student_info, headers, rows, spans.get(LAST_UPDATED_ID, '')
+
+
+PARSER_BACKENDS = {
+    SelectolaxParser.name: SelectolaxParser,
+    LxmlParser.name: LxmlParser,
+    SoupParser.name: SoupParser
+}
+
+_default_parser: Optional[GradesParser] = None
+
+
+def get_parser(name: Optional[str] = None) -> GradesParser:
+    """
+    Create a grades parser by backend name.
+
+    'auto' (the default, overridable with EDUSOFT_PARSER) picks the fastest
+    installed backend: selectolax, then lxml, then html.parser.
+    """
+    name = name or os.environ.get('EDUSOFT_PARSER', 'auto')
+    if name != 'auto':
+        return PARSER_BACKENDS[name]()
+    for backend in PARSER_BACKENDS.values():
+        try:
+            return backend()
+        except ImportError:
+            continue
+    raise ImportError('No HTML parser backend available; install beautifulsoup4')
+
+
+def default_parser() -> GradesParser:
+    """The process-wide parser selected by get_parser()"""
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = get_parser()
+        logger.info(f"Using {_default_parser.name} grades parser")
+    return _default_parser
+
+
+# (event type, value) emitted by StreamingGradesParser
+GradesEvent = Tuple[str, object]
+EVENT_STUDENT_INFO, EVENT_HEADERS, EVENT_ROW = 'student_info', 'headers', 'row'
+
+
+class StreamingGradesParser(HTMLParser):
+    """
+    Event-driven grades page parser fed the page a chunk at a time.
+
+    feed() returns the events completed by that chunk: the student info once
+    all its spans are seen (or the grades table starts), the table headers,
+    then every row as soon as its </tr> arrives. Only the current row and
+    span are buffered, never the page or a tree. result() returns the same
+    structure as GradesParser.parse_grades() once the page is fed.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.student_info: Dict[str, str] = {}
+        self.headers: List[str] = []
+        self.grades: List[Dict[str, str]] = []
+        self.last_updated = ''
+        self.summarizer = SemesterSummarizer()
+        self._span_keys = {element_id: key for key, element_id in STUDENT_INFO_FIELDS.items()}
+        self._events: List[GradesEvent] = []
+        self._info_sent = False
+        # Text collectors: wanted span (id, nesting depth, text) and current cell
+        self._span: Optional[Tuple[str, int, List[str]]] = None
+        self._cell: Optional[List[str]] = None
+        self._row: Optional[List[str]] = None
+        self._header_row = False
+        # Nesting depth inside the grades container div / its first table; -1 once left
+        self._div_depth = 0
+        self._table_depth = 0
+        self._table_done = False
+
+    def feed(self, data: str) -> List[GradesEvent]:
+        super().feed(data)
+        events, self._events = self._events, []
+        return events
+
+    def close(self) -> List[GradesEvent]:
+        super().close()
+        self._end_row()
+        self._send_student_info()
+        events, self._events = self._events, []
+        return events
+
+    def result(self) -> Dict:
+        return {
+            'student_info': self.student_info,
+            'grades': self.grades,
+            'last_updated': self.last_updated,
+            'semesters': self.summarizer.semesters,
+            'cumulative': self.summarizer.cumulative()
+        }
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'span':
+            if self._span is not None:
+                element_id, depth, text = self._span
+                self._span = (element_id, depth + 1, text)
+                return
+            element_id = dict(attrs).get('id')
+            if element_id in self._span_keys or element_id == LAST_UPDATED_ID:
+                self._span = (element_id, 1, [])
+        elif tag == 'div':
+            if self._div_depth > 0:
+                self._div_depth += 1
+            elif self._div_depth == 0 and dict(attrs).get('id') == GRADES_CONTAINER_ID:
+                self._div_depth = 1
+                self._send_student_info()
+        elif self._div_depth > 0 and not self._table_done:
+            self._table_tag(tag)
+
+    def _table_tag(self, tag: str):
+        if tag == 'table':
+            self._table_depth += 1
+        elif self._table_depth == 0:
+            return
+        elif tag == 'tr':
+            self._end_row()
+            self._row = []
+            self._header_row = not self.headers and not self.grades
+        elif tag in ('td', 'th') and self._row is not None:
+            self._end_cell()
+            # Like the tree backends, data rows only take td cells
+            if tag == 'td' or self._header_row:
+                self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'span' and self._span is not None:
+            element_id, depth, text = self._span
+            if depth > 1:
+                self._span = (element_id, depth - 1, text)
+                return
+            self._span = None
+            value = ''.join(text).strip()
+            if element_id == LAST_UPDATED_ID:
+                self.last_updated = self.last_updated or value
+            else:
+                self.student_info.setdefault(self._span_keys[element_id], value)
+                if len(self.student_info) == len(self._span_keys):
+                    self._send_student_info()
+        elif tag == 'div' and self._div_depth > 0:
+            self._div_depth -= 1
+            if self._div_depth == 0:
+                self._end_row()
+                self._div_depth = -1
+        elif self._table_depth > 0:
+            if tag in ('td', 'th'):
+                self._end_cell()
+            elif tag == 'tr':
+                self._end_row()
+            elif tag == 'table':
+                self._table_depth -= 1
+                if self._table_depth == 0:
+                    self._end_row()
+                    self._table_done = True
+
+    def handle_data(self, data):
+        if self._span is not None:
+            self._span[2].append(data)
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        row, self._row = self._row, None
+        if row is None:
+            return
+        if self._header_row:
+            self.headers = row
+            self._events.append((EVENT_HEADERS, row))
+        elif row:
+            self.summarizer.add_row(row[0])
+            grade = {
+                self.headers[i] if i < len(self.headers) else f'column_{i}': value
+                for i, value in enumerate(row)
+            }
+            self.grades.append(grade)
+            self._events.append((EVENT_ROW, grade))
+
+    def _send_student_info(self):
+        if not self._info_sent:
+            self._info_sent = True
+            self._events.append((EVENT_STUDENT_INFO, self.student_info))
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Background prefetch of grades for subscribed students
+
+Instead of students polling /api/grades (and through it, the portal), a
+client subscribes a student once and a small worker pool keeps their cached
+result current. Each subscription refreshes on its own interval: short
+during exam-result windows, doubling while the portal's last-updated stamp
+stays unchanged. Refreshes share one token bucket, so the load on the portal
+is bounded no matter how many students subscribe.
+
+Subscriptions either store the password encrypted with Fernet (requires the
+`cryptography` package) or, without it, only keep the student's pooled
+portal session alive and pause once the portal expires it.
+"""
+
+import base64
+import heapq
+import importlib.util
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Refresh outcomes reported by the refresh callback
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+PORTAL_ERROR = 'portal_error'
+LOGIN_FAILED = 'login_failed'
+SESSION_EXPIRED = 'session_expired'
+
+MODE_CREDENTIALS = 'credentials'
+MODE_SESSION = 'session'
+
+# Month/day ranges when exam results are usually published (end of each semester)
+DEFAULT_EXAM_WINDOWS = '01-02:02-20,06-01:07-20,08-10:09-10'
+
+# (month, day) start and end, both inclusive
+ExamWindow = Tuple[Tuple[int, int], Tuple[int, int]]
+
+
+def parse_exam_windows(spec: str) -> List[ExamWindow]:
+    """Parse 'MM-DD:MM-DD,...' into (start, end) month/day pairs"""
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        start, end = part.split(':')
+        start_month, start_day = (int(x) for x in start.split('-'))
+        end_month, end_day = (int(x) for x in end.split('-'))
+        windows.append(((start_month, start_day), (end_month, end_day)))
+    return windows
+
+
+def in_exam_window(windows: List[ExamWindow], now: Optional[datetime] = None) -> bool:
+    """Whether `now` falls in one of the windows (a window may wrap past new year)"""
+    now = now or datetime.now()
+    today = (now.month, now.day)
+    for start, end in windows:
+        if start <= end:
+            if start <= today <= end:
+                return True
+        elif today >= start or today <= end:
+            return True
+    return False
+
+
+class CredentialVault:
+    """
+    Encrypts stored passwords with Fernet; unavailable without the cryptography package.
+    cryptography (an optional dependency) is only imported once a password is stored.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        # Same format as Fernet.generate_key()
+        self._key = key.encode() if key else base64.urlsafe_b64encode(os.urandom(32))
+        self._fernet = None
+        self._available = importlib.util.find_spec('cryptography') is not None
+
+    @property
+    def available(self) -> bool:
+        return self._available
+
+    def _cipher(self):
+        if self._fernet is None:
+            from cryptography.fernet import Fernet
+            self._fernet = Fernet(self._key)
+        return self._fernet
+
+    def encrypt(self, password: str) -> bytes:
+        return self._cipher().encrypt(password.encode('utf-8'))
+
+    def decrypt(self, token: bytes) -> Optional[str]:
+        from cryptography.fernet import InvalidToken
+        try:
+            return self._cipher().decrypt(token).decode('utf-8')
+        except InvalidToken:
+            return None
+
+
+class Subscription:
+    """A student whose grades are refreshed in the background"""
+
+    __slots__ = ('key', 'username', 'secret', 'interval', 'unchanged', 'failures',
+                 'next_run', 'last_refreshed', 'last_status', 'created_at')
+
+    def __init__(self, key: str, username: str, secret: Optional[bytes]):
+        self.key = key
+        self.username = username
+        # Encrypted password, or None to only reuse the pooled portal session
+        self.secret = secret
+        self.interval = 0.0
+        self.unchanged = 0
+        self.failures = 0
+        self.next_run = 0.0
+        self.last_refreshed: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.created_at = time.time()
+
+    @property
+    def mode(self) -> str:
+        return MODE_CREDENTIALS if self.secret is not None else MODE_SESSION
+
+    def to_dict(self) -> Dict:
+        return {
+            'username': self.username,
+            'mode': self.mode,
+            'interval': round(self.interval),
+            'next_refresh_in': max(0, round(self.next_run - time.monotonic())),
+            'last_refreshed': self.last_refreshed,
+            'last_status': self.last_status
+        }
+
+
+class PrefetchScheduler:
+    """
+    Refreshes subscribed students' grades on adaptive intervals.
+
+    `refresh(username, password, key)` does one upstream refresh (password is
+    None for session-only subscriptions) and returns one of CHANGED,
+    UNCHANGED, PORTAL_ERROR, LOGIN_FAILED or SESSION_EXPIRED.
+    """
+
+    def __init__(self, refresh: Callable[[str, Optional[str], str], str],
+                 vault: Optional[CredentialVault] = None,
+                 limiter: Optional[TokenBucket] = None,
+                 workers: int = 4,
+                 interval: float = 900,
+                 exam_interval: float = 120,
+                 max_interval: float = 4 * 3600,
+                 exam_windows: Optional[List[ExamWindow]] = None,
+                 session_ttl: Optional[float] = None,
+                 max_subscriptions: int = 1000,
+                 max_failures: int = 5):
+        self.refresh = refresh
+        self.vault = vault or CredentialVault()
+        self.limiter = limiter or TokenBucket(rate=1, burst=5)
+        self.workers = workers
+        self.interval = interval
+        self.exam_interval = exam_interval
+        self.max_interval = max_interval
+        self.exam_windows = exam_windows if exam_windows is not None else parse_exam_windows(DEFAULT_EXAM_WINDOWS)
+        # Session-only subscriptions refresh before the pooled session goes idle
+        self.session_ttl = session_ttl
+        self.max_subscriptions = max_subscriptions
+        self.max_failures = max_failures
+
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._queue: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.refreshes = 0
+
+    def base_interval(self) -> float:
+        return self.exam_interval if in_exam_window(self.exam_windows) else self.interval
+
+    def next_interval(self, sub: Subscription, status: str) -> float:
+        """Seconds until the next refresh of `sub` after a refresh that ended with `status`"""
+        base = self.base_interval()
+        if status == UNCHANGED:
+            sub.unchanged += 1
+            sub.failures = 0
+            interval = base * 2 ** min(sub.unchanged, 16)
+        elif status in (PORTAL_ERROR, SESSION_EXPIRED):
+            sub.failures += 1
+            interval = base * 2 ** min(sub.failures, 16)
+        else:
+            sub.unchanged = 0
+            sub.failures = 0
+            interval = base
+        interval = min(interval, self.max_interval)
+        if sub.mode == MODE_SESSION and self.session_ttl:
+            interval = min(interval, self.session_ttl * 0.8)
+        return interval
+
+    def subscribe(self, key: str, username: str, password: str, store_credentials: bool = True) -> Subscription:
+        """Subscribe (or re-subscribe) a student and schedule an immediate refresh"""
+        secret = self.vault.encrypt(password) if store_credentials and self.vault.available else None
+        with self._cond:
+            if key not in self._subscriptions and len(self._subscriptions) >= self.max_subscriptions:
+                raise OverflowError(f'At most {self.max_subscriptions} subscriptions are allowed')
+            sub = self._subscriptions[key] = Subscription(key, username, secret)
+            sub.interval = self.base_interval()
+            self._schedule(sub, 0)
+        self._ensure_started()
+        return sub
+
+    def unsubscribe(self, key: str) -> bool:
+        with self._cond:
+            return self._subscriptions.pop(key, None) is not None
+
+    def get(self, key: str) -> Optional[Subscription]:
+        with self._cond:
+            return self._subscriptions.get(key)
+
+    def covers(self, key: str, checked_at: float) -> bool:
+        """
+        Whether a cached result confirmed at `checked_at` (wall-clock) is kept
+        current by a healthy subscription and can be served without the portal.
+        
+        Coverage lasts for the base interval, not the backed-off one: a
+        transcript that stays unchanged is refreshed less often, but a hit
+        is still at most 1.5 base intervals old (e.g. 3 minutes in exam
+        windows), and older results are checked against the portal.
+        """
+        sub = self.get(key)
+        if sub is None or sub.failures:
+            return False
+        return time.time() - checked_at <= min(sub.interval, self.base_interval()) * 1.5
+
+    def stats(self) -> Dict:
+        with self._cond:
+            modes = [sub.mode for sub in self._subscriptions.values()]
+        return {
+            'subscriptions': len(modes),
+            'credentials': modes.count(MODE_CREDENTIALS),
+            'session_only': modes.count(MODE_SESSION),
+            'refreshes': self.refreshes,
+            'exam_window': in_exam_window(self.exam_windows)
+        }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _schedule(self, sub: Subscription, delay: float):
+        # Callers hold self._cond. Jitter spreads out students subscribed together.
+        if delay:
+            delay *= random.uniform(0.9, 1.1)
+        sub.next_run = time.monotonic() + delay
+        heapq.heappush(self._queue, (sub.next_run, next(self._sequence), sub.key))
+        self._cond.notify()
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch')
+            self._thread = threading.Thread(target=self._dispatch, name='prefetch-dispatch', daemon=True)
+            self._thread.start()
+
+    def _next_due(self) -> Optional[Subscription]:
+        """Block until a subscription is due; None once stopped"""
+        with self._cond:
+            while not self._stopped:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                run_at, _, key = self._queue[0]
+                wait = run_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                sub = self._subscriptions.get(key)
+                # Skip entries left behind by unsubscribe or re-subscribe
+                if sub is not None and sub.next_run == run_at:
+                    return sub
+            return None
+
+    def _dispatch(self):
+        while True:
+            sub = self._next_due()
+            if sub is None:
+                return
+            self._slots.acquire()
+            self.limiter.acquire()
+            try:
+                self._executor.submit(self._run, sub)
+            except RuntimeError:
+                # Executor shut down by stop()
+                self._slots.release()
+                return
+
+    def _run(self, sub: Subscription):
+        try:
+            password = None
+            if sub.secret is not None:
+                password = self.vault.decrypt(sub.secret)
+                if password is None:
+                    logger.warning(f"Dropping prefetch subscription for {sub.username}: undecryptable credentials")
+                    self.unsubscribe(sub.key)
+                    return
+            try:
+                status = self.refresh(sub.username, password, sub.key)
+            except Exception as e:
+                logger.error(f"Prefetch refresh failed for {sub.username}: {e}", exc_info=True)
+                status = PORTAL_ERROR
+
+            with self._cond:
+                self.refreshes += 1
+                if self._subscriptions.get(sub.key) is not sub:
+                    return
+                sub.last_status = status
+                sub.last_refreshed = time.time()
+                sub.interval = self.next_interval(sub, status)
+                # Don't keep retrying a changed password (or a dead session) against the portal
+                if status == LOGIN_FAILED or sub.failures > self.max_failures:
+                    logger.info(f"Dropping prefetch subscription for {sub.username}: {status}")
+                    del self._subscriptions[sub.key]
+                    return
+                self._schedule(sub, sub.interval)
+        finally:
+            self._slots.release()
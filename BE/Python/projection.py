@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Vectorized degree classification projections
+
+Computes, for many students and many classification thresholds at once,
+the GPA a student needs over their remaining credits to reach each
+classification. Works on known numbers only (no portal access), and
+supports what-if scenarios for hypothetical upcoming course grades.
+
+numpy is only imported for cohorts: a single student's projection (every
+/api/grades response) runs in plain Python off the same threshold table,
+so API workers start without loading numpy.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from parsers import summarize_rows
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Vietnamese university classification thresholds (4.0 scale)
+CLASSIFICATION_THRESHOLDS = {
+    'Xuất sắc': {'min': 3.6, 'max': 4.0, 'name_en': 'Excellent'},
+    'Giỏi': {'min': 3.2, 'max': 3.59, 'name_en': 'Very Good'},
+    'Khá': {'min': 2.5, 'max': 3.19, 'name_en': 'Good'},
+    'Trung bình': {'min': 2.0, 'max': 2.49, 'name_en': 'Average'},
+    'Yếu': {'min': 0.0, 'max': 1.99, 'name_en': 'Weak'}
+}
+
+# Assume typical program has ~140 credits total when the program is unknown
+DEFAULT_PROGRAM_CREDITS = 140
+MAX_GPA = 4.0
+
+# Letter grade -> grade points (4.0 scale)
+GRADE_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'D-': 0.7,
+    'F': 0.0
+}
+
+STATUS_LOWER, STATUS_CURRENT, STATUS_HIGHER = 0, 1, 2
+STATUS_NAMES = ('lower', 'current', 'higher')
+
+# (names, English names, minimum GPAs, maximum GPAs) in table order
+ThresholdTable = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[float, ...], Tuple[float, ...]]
+
+
+def threshold_table(thresholds: Dict) -> ThresholdTable:
+    """Flatten a thresholds dict into the columns project() works on"""
+    return (
+        tuple(thresholds),
+        tuple(t['name_en'] for t in thresholds.values()),
+        tuple(float(t['min']) for t in thresholds.values()),
+        tuple(float(t['max']) for t in thresholds.values())
+    )
+
+
+DEFAULT_THRESHOLD_TABLE = threshold_table(CLASSIFICATION_THRESHOLDS)
+
+
+def _table(thresholds: Optional[Dict]) -> ThresholdTable:
+    return threshold_table(thresholds) if thresholds else DEFAULT_THRESHOLD_TABLE
+
+
+def project(cgpa: Sequence[float], credits: Sequence[int],
+            program_credits: Optional[Sequence[int]] = None,
+            thresholds: Optional[Dict] = None) -> Dict[str, 'np.ndarray']:
+    """
+    Project n students against m classification thresholds in one pass.
+
+    Returns arrays (n students along axis 0, thresholds along axis 1):
+    - current: (n,) index of the current classification, -1 if none matches
+    - remaining_credits: (n,)
+    - required_gpa: (n, m) GPA needed over the remaining credits, clamped at
+      0 and NaN where no credits remain
+    - achievable: (n, m)
+    - status: (n, m) STATUS_LOWER / STATUS_CURRENT / STATUS_HIGHER
+    """
+    import numpy as np
+
+    _, _, mins, maxs = _table(thresholds)
+    mins = np.array(mins, dtype=np.float64)
+    maxs = np.array(maxs, dtype=np.float64)
+    cgpa = np.asarray(cgpa, dtype=np.float64)
+    credits = np.asarray(credits, dtype=np.int64)
+    if program_credits is None:
+        program_credits = np.full(cgpa.shape, DEFAULT_PROGRAM_CREDITS, dtype=np.int64)
+    program_credits = np.asarray(program_credits, dtype=np.int64)
+
+    # First threshold (in table order) whose range contains the cGPA
+    in_range = (mins <= cgpa[:, None]) & (cgpa[:, None] <= maxs)
+    current = np.where(in_range.any(axis=1), in_range.argmax(axis=1), -1)
+
+    remaining = np.maximum(0, program_credits - credits)
+    has_remaining = remaining > 0
+
+    required_total_points = mins * (credits + remaining)[:, None]
+    additional_points = required_total_points - (cgpa * credits)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        required = np.maximum(0.0, additional_points / remaining[:, None])
+    required = np.where(has_remaining[:, None], required, np.nan)
+
+    is_current = np.arange(len(mins)) == current[:, None]
+    achievable = np.where(has_remaining[:, None], required <= MAX_GPA, is_current)
+
+    status = np.where(mins > cgpa[:, None], STATUS_HIGHER, STATUS_LOWER)
+    status = np.where(is_current, STATUS_CURRENT, status)
+
+    return {
+        'current': current,
+        'remaining_credits': remaining,
+        'required_gpa': required,
+        'achievable': achievable,
+        'status': status
+    }
+
+
+def apply_what_if(cgpa: Sequence[float], credits: Sequence[int],
+                  courses: Sequence[Sequence[Dict]]):
+    """
+    Fold hypothetical course results into each student's cGPA and credits.
+
+    `courses[i]` lists student i's upcoming courses as dicts with positive
+    `credits` and either a letter `grade` or 4.0-scale `points`. Failed courses (0
+    points) don't count towards accumulated credits or the cumulative GPA,
+    as on the portal. Returns the new (cgpa, credits) arrays.
+    """
+    import numpy as np
+
+    cgpa = np.asarray(cgpa, dtype=np.float64)
+    credits = np.asarray(credits, dtype=np.int64)
+
+    owners, course_credits, course_points = [], [], []
+    for student, student_courses in enumerate(courses):
+        for course in student_courses or ():
+            points = course.get('points')
+            if points is None:
+                grade = str(course.get('grade', '')).strip().upper()
+                if grade not in GRADE_POINTS:
+                    raise ValueError(f"Unknown grade '{grade}'")
+                points = GRADE_POINTS[grade]
+            points, course_credit = float(points), int(course['credits'])
+            if not 0 <= points <= MAX_GPA:
+                raise ValueError('what_if points must be between 0 and 4')
+            if course_credit <= 0:
+                raise ValueError('what_if credits must be positive')
+            owners.append(student)
+            course_credits.append(course_credit)
+            course_points.append(points)
+
+    owners = np.asarray(owners, dtype=np.int64)
+    course_credits = np.asarray(course_credits, dtype=np.int64)
+    course_points = np.asarray(course_points, dtype=np.float64)
+    passed = course_points > 0
+
+    added_credits = np.bincount(owners[passed], weights=course_credits[passed], minlength=len(cgpa))
+    added_points = np.bincount(owners[passed], weights=(course_credits * course_points)[passed],
+                               minlength=len(cgpa))
+
+    new_credits = credits + added_credits.astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new_cgpa = np.where(new_credits > 0, (cgpa * credits + added_points) / new_credits, cgpa)
+    return new_cgpa, new_credits
+
+
+def format_projection(table: ThresholdTable, current: int, remaining: int, cgpa: float, credits: int,
+                      required: Sequence[float], achievable: Sequence[bool], status: Sequence[int]) -> Dict:
+    """The API's grade_projection dict for one student's row of projection results"""
+    names, names_en, mins, _ = table
+    projections = {}
+    for j, class_name in enumerate(names):
+        projections[class_name] = {
+            'classification_en': names_en[j],
+            'target_min_gpa': mins[j],
+            'required_gpa_remaining': round(float(required[j]), 2) if remaining > 0 else None,
+            'remaining_credits': remaining,
+            'achievable': bool(achievable[j]),
+            'status': STATUS_NAMES[status[j]]
+        }
+
+    return {
+        'current_classification': names[current] if current >= 0 else None,
+        'current_classification_en': names_en[current] if current >= 0 else None,
+        'current_cgpa': round(float(cgpa), 2),
+        'total_credits': int(credits),
+        'remaining_credits': remaining,
+        'projections': projections
+    }
+
+
+def student_projection(result: Dict[str, 'np.ndarray'], index: int, cgpa: float, credits: int,
+                       thresholds: Optional[Dict] = None) -> Dict:
+    """Format row `index` of a project() result as the API's grade_projection dict"""
+    return format_projection(
+        _table(thresholds), int(result['current'][index]), int(result['remaining_credits'][index]),
+        cgpa, credits, result['required_gpa'][index], result['achievable'][index], result['status'][index]
+    )
+
+
+def project_student(cgpa: float, credits: int,
+                    program_credits: int = DEFAULT_PROGRAM_CREDITS) -> Dict:
+    """
+    Grade projection for a single student; project() for one row, without
+    numpy. benchmarks/bench_projection.py checks that the two agree.
+    """
+    _, _, mins, maxs = table = DEFAULT_THRESHOLD_TABLE
+    cgpa, credits = float(cgpa), int(credits)
+    current = next((j for j in range(len(mins)) if mins[j] <= cgpa <= maxs[j]), -1)
+    remaining = max(0, int(program_credits) - credits)
+
+    required, achievable, status = [], [], []
+    for j, minimum in enumerate(mins):
+        if remaining > 0:
+            needed = max(0.0, (minimum * (credits + remaining) - cgpa * credits) / remaining)
+            achievable.append(needed <= MAX_GPA)
+        else:
+            needed = float('nan')
+            achievable.append(j == current)
+        required.append(needed)
+        if j == current:
+            status.append(STATUS_CURRENT)
+        else:
+            status.append(STATUS_HIGHER if minimum > cgpa else STATUS_LOWER)
+    return format_projection(table, current, remaining, cgpa, credits, required, achievable, status)
+
+
+def calculate_grade_projection(grades_data: dict) -> dict:
+    """
+    Calculate grade projections based on current cGPA and credits.
+    
+    Args:
+        grades_data: Dictionary containing grades data with 'grades' list
+    
+    Returns:
+        Dictionary with projection information including:
+        - current_classification: Current degree classification
+        - current_cgpa: Current cumulative GPA (4.0 scale)
+        - total_credits: Total credits accumulated
+        - projections: Projections for each classification level
+    """
+    try:
+        grades = grades_data.get('grades', [])
+        
+        if not grades:
+            logger.warning("No grades found in grades_data")
+            return None
+        
+        # Latest cumulative cGPA and credits, summarized by the parser.
+        # Payloads from before the parser summarized rows fall back to a scan.
+        cumulative = grades_data.get('cumulative')
+        if cumulative is None:
+            _, cumulative = summarize_rows(grade.get('STT', '') for grade in grades)
+        current_cgpa = cumulative.get('gpa_4')
+        total_credits = cumulative.get('credits')
+        logger.info(f"Extracted cGPA: {current_cgpa}, total credits: {total_credits}")
+        
+        if current_cgpa is None or total_credits is None:
+            logger.warning(f"Failed to extract required data - cGPA: {current_cgpa}, total_credits: {total_credits}")
+            return None
+        
+        return project_student(current_cgpa, total_credits)
+        
+    except Exception as e:
+        logger.error(f"Error calculating grade projection: {str(e)}", exc_info=True)
+        return None
+
+
+def project_cohort(students: List[Dict], thresholds: Optional[Dict] = None) -> List[Dict]:
+    """
+    Grade projections for many students.
+
+    Each student dict has `cgpa`, `credits`, optional `program_credits` and
+    optional `what_if` (a list of upcoming courses, see apply_what_if). With
+    `what_if` the projection starts from the hypothetical cGPA and credits,
+    which are also reported under `what_if`.
+    """
+    import numpy as np
+
+    cgpa = np.array([float(s['cgpa']) for s in students], dtype=np.float64)
+    credits = np.array([int(s['credits']) for s in students], dtype=np.int64)
+    program_credits = np.array([int(s.get('program_credits') or DEFAULT_PROGRAM_CREDITS)
+                                for s in students], dtype=np.int64)
+
+    # NaN compares false both ways, so it needs its own check
+    if np.any(~np.isfinite(cgpa) | (cgpa < 0) | (cgpa > MAX_GPA)):
+        raise ValueError('cgpa must be between 0 and 4')
+    if np.any(credits < 0) or np.any(program_credits <= 0):
+        raise ValueError('credits must not be negative and program_credits must be positive')
+
+    what_if = [s.get('what_if') for s in students]
+    if any(what_if):
+        cgpa, credits = apply_what_if(cgpa, credits, what_if)
+
+    result = project(cgpa, credits, program_credits, thresholds)
+    projections = []
+    for i in range(len(students)):
+        projection = student_projection(result, i, cgpa[i], credits[i], thresholds)
+        if what_if[i]:
+            projection['what_if'] = {
+                'projected_cgpa': round(float(cgpa[i]), 2),
+                'projected_credits': int(credits[i])
+            }
+        projections.append(projection)
+    return projections
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Typed transcript records and compact (column-oriented) wire formats
+
+The JSON payload built by the parser keeps one dict per table row, keyed by
+the Vietnamese header text, which is what existing clients consume. This
+module turns it into slotted records with numeric fields parsed once, and
+into a column-oriented form that repeats no keys, for clients that ask for
+it via content negotiation (JSON or MessagePack).
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional
+
+from parsers import ROW_COURSE, STUDENT_INFO_FIELDS, SemesterSummarizer
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+COLUMNAR_JSON_MIMETYPE = 'application/vnd.itpm.grades.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Portal column headers with a typed CourseRecord field
+COURSE_COLUMNS = {
+    'STT': 'stt',
+    'Mã Môn': 'code',
+    'Tên Môn': 'name',
+    'TC': 'credits',
+    'TK(10)': 'score_10',
+    'TK(CH)': 'grade'
+}
+
+
+def _to_int(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class StudentInfo:
+    ma_sinh_vien: str = ''
+    ten_sinh_vien: str = ''
+    lop: str = ''
+    nganh: str = ''
+    khoa: str = ''
+    phai: str = ''
+    noi_sinh: str = ''
+    he_dao_tao: str = ''
+    khoa_hoc: str = ''
+    co_van_hoc_tap: str = ''
+
+
+@dataclass(slots=True)
+class CourseRecord:
+    semester: int
+    stt: Optional[int]
+    code: str
+    name: str
+    credits: Optional[int]
+    score_10: Optional[float]
+    grade: str
+    # Remaining portal columns (component scores, weights, ...) as raw text
+    extra: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class SemesterSummary:
+    semester: str
+    course_count: int = 0
+    semester_gpa_4: Optional[float] = None
+    semester_gpa_10: Optional[float] = None
+    cumulative_gpa_4: Optional[float] = None
+    cumulative_gpa_10: Optional[float] = None
+    credits_passed: Optional[int] = None
+    cumulative_credits: Optional[int] = None
+
+
+@dataclass(slots=True)
+class Transcript:
+    student_info: StudentInfo
+    courses: List[CourseRecord]
+    semesters: List[SemesterSummary]
+    last_updated: str = ''
+    cumulative: Dict = field(default_factory=dict)
+    grade_projection: Optional[Dict] = None
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> 'Transcript':
+        """Build typed records from a parsed grades payload"""
+        info = payload.get('student_info') or {}
+        student_info = StudentInfo(**{key: info.get(key, '') for key in STUDENT_INFO_FIELDS})
+
+        summarizer = SemesterSummarizer()
+        courses = []
+        for row in payload.get('grades') or []:
+            kind = summarizer.add_row(row.get('STT', ''))
+            if kind != ROW_COURSE:
+                continue
+            courses.append(CourseRecord(
+                semester=len(summarizer.semesters) - 1,
+                stt=_to_int(row.get('STT')),
+                code=row.get('Mã Môn', ''),
+                name=row.get('Tên Môn', ''),
+                credits=_to_int(row.get('TC')),
+                score_10=_to_float(row.get('TK(10)')),
+                grade=row.get('TK(CH)', ''),
+                extra={k: v for k, v in row.items() if k not in COURSE_COLUMNS}
+            ))
+
+        semesters = [SemesterSummary(**summary) for summary in summarizer.semesters]
+        return cls(
+            student_info=student_info,
+            courses=courses,
+            semesters=semesters,
+            last_updated=payload.get('last_updated', ''),
+            cumulative=summarizer.cumulative(),
+            grade_projection=payload.get('grade_projection')
+        )
+
+    def to_columnar(self) -> Dict:
+        """Column-oriented form: one list per field instead of one dict per row"""
+        course_columns = {f.name: [] for f in fields(CourseRecord) if f.name != 'extra'}
+        extra_columns: Dict[str, List] = {}
+        for i, course in enumerate(self.courses):
+            for name, values in course_columns.items():
+                values.append(getattr(course, name))
+            for header, value in course.extra.items():
+                # Columns missing from earlier rows are padded with None
+                extra_columns.setdefault(header, [None] * i).append(value)
+            for values in extra_columns.values():
+                if len(values) <= i:
+                    values.append(None)
+        course_columns.update(extra_columns)
+
+        semester_columns = {f.name: [getattr(s, f.name) for s in self.semesters]
+                            for f in fields(SemesterSummary)}
+
+        columnar = {
+            'student_info': {f.name: getattr(self.student_info, f.name) for f in fields(StudentInfo)},
+            'last_updated': self.last_updated,
+            'cumulative': self.cumulative,
+            'semesters': semester_columns,
+            'courses': course_columns
+        }
+        if self.grade_projection is not None:
+            columnar['grade_projection'] = self.grade_projection
+        return columnar
+
+
+def encode_msgpack(body: Dict) -> bytes:
+    """Serialize a response body as MessagePack (requires the msgpack package)"""
+    return msgpack.packb(body, use_bin_type=True)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Cache of parsed grades payloads, revalidated against the portal's
+"last updated" stamp
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class CacheEntry:
+    """A cached grades payload and the portal stamp it was parsed from"""
+
+    __slots__ = ('last_updated', 'payload', 'stored_at', 'checked_at')
+
+    def __init__(self, last_updated: str, payload: Dict, stored_at: float, checked_at: float):
+        self.last_updated = last_updated
+        self.payload = payload
+        self.stored_at = stored_at
+        self.checked_at = checked_at
+
+
+class MemoryCacheBackend:
+    """In-process LRU storage for cache entries"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk storage for cache entries, surviving restarts"""
+
+    def __init__(self, path: str, max_size: int = 1024):
+        self.max_size = max_size
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS result_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' last_updated TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' checked_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS result_cache_checked_at ON result_cache (checked_at)'
+        )
+        self._conn.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        # Callers hold self._lock. A connection must not be used across fork()
+        # (gunicorn --preload creates the cache in the master), so a forked
+        # worker opens its own.
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db().execute(
+                'SELECT last_updated, payload, stored_at, checked_at FROM result_cache WHERE key = ?',
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(row[0], json.loads(row[1]), row[2], row[3])
+
+    def set(self, key: str, entry: CacheEntry):
+        payload = json.dumps(entry.payload, ensure_ascii=False)
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                'INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?)',
+                (key, entry.last_updated, payload, entry.stored_at, entry.checked_at)
+            )
+            # Evict the least recently checked rows beyond max_size
+            conn.execute(
+                'DELETE FROM result_cache WHERE key IN ('
+                ' SELECT key FROM result_cache ORDER BY checked_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            )
+            conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._db()
+            conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+            conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute('SELECT COUNT(*) FROM result_cache').fetchone()[0]
+
+
+class SharedCacheBackend:
+    """
+    Cache entries in a shared store (see shared_store.py), so every worker
+    process serves the results any of them parsed
+    """
+
+    def __init__(self, store, ttl: float = 3600, prefix: str = 'result:'):
+        self.store = store
+        # Entries the ResultCache would drop anyway expire in the store too
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        value = self.store.get(self.prefix + key)
+        if value is None:
+            return None
+        data = json.loads(value)
+        return CacheEntry(data['last_updated'], data['payload'], data['stored_at'], data['checked_at'])
+
+    def set(self, key: str, entry: CacheEntry):
+        value = json.dumps({
+            'last_updated': entry.last_updated,
+            'payload': entry.payload,
+            'stored_at': entry.stored_at,
+            'checked_at': entry.checked_at
+        }, ensure_ascii=False).encode('utf-8')
+        self.store.set(self.prefix + key, value, ttl=self.ttl)
+
+    def delete(self, key: str):
+        self.store.delete(self.prefix + key)
+
+
+class ResultCache:
+    """
+    Parsed grades payloads keyed on credentials.
+
+    Entries younger than `fresh_for` seconds (since they were last confirmed
+    against the portal) are served without contacting the portal at all.
+    Older entries are revalidated: if the portal's last-updated stamp is
+    unchanged the cached payload is reused instead of re-parsing the page.
+    Entries not confirmed for `ttl` seconds are dropped.
+    """
+
+    def __init__(self, backend=None, ttl: float = 3600, fresh_for: float = 60):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.fresh_for = fresh_for
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for `key` unless it has expired"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.checked_at > self.ttl:
+            self.backend.delete(key)
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Whether `entry` can be served without revalidation"""
+        return time.time() - entry.checked_at <= self.fresh_for
+
+    def set(self, key: str, last_updated: str, payload: Dict) -> CacheEntry:
+        """Store a freshly parsed payload"""
+        now = time.time()
+        entry = CacheEntry(last_updated, payload, now, now)
+        self.backend.set(key, entry)
+        return entry
+
+    def touch(self, key: str, entry: CacheEntry):
+        """Mark `entry` as confirmed unchanged by the portal"""
+        entry.checked_at = time.time()
+        self.backend.set(key, entry)
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+
+def cache_info(status: str, entry: Optional[CacheEntry] = None, stale: bool = False) -> Dict:
+    """Describe how a response was served, for the `cache` response field"""
+    info = {'status': status, 'stale': stale}
+    if entry is not None:
+        info['age'] = int(time.time() - entry.stored_at)
+        info['last_updated'] = entry.last_updated
+    return info
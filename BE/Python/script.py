@@ -3,159 +3,393 @@
 Lightweight Python script to login and retrieve grades from EduSoft
 """
 
-import requests
-from bs4 import BeautifulSoup
+import codecs
+import contextvars
 import json
-import re
-from typing import Dict, List, Optional
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
+import requests
 
-class EdusoftScraper:
-    def __init__(self):
-        self.base_url = "https://edusoftweb.hcmiu.edu.vn"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        })
+from login_form import STALE_FORM_MARKERS, default_login_form_cache, is_stale_form_response
+from metrics import record, stage
+from pages import EXAMS, PAGE_PARSERS, TIMETABLE
+from parsers import (GradesEvent, GradesParser, StreamingGradesParser, default_parser,
+                     extract_form_fields, extract_last_updated)
+from parse_pool import default_pool
+from transport import STREAM_CHUNK_SIZE, new_session, read_until, upstream_timeout
+from upstream_guard import UpstreamUnavailable
+
+GRADES = 'grades'
+# Threads fetching bundle pages, shared by all scrapers in the process
+BUNDLE_WORKERS = int(os.environ.get('BUNDLE_WORKERS', 16))
+
+_page_executor: Optional[ThreadPoolExecutor] = None
+_page_executor_lock = threading.Lock()
+
+
+def page_executor() -> ThreadPoolExecutor:
+    """Thread pool fetch_pages() runs page requests on, created on first use"""
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(max_workers=BUNDLE_WORKERS, thread_name_prefix='page')
+        return _page_executor
+
+
+class PortalScraper:
+    """
+    What the sync and async scrapers share: portal constants and the helpers
+    that build requests and parse responses without any network I/O.
+    Subclasses implement the cookie jar export/import.
+    """
+    # Present on every page that renders the login box, i.e. when we're not logged in
+    LOGIN_FORM_MARKER = 'ucDangNhap$txtTaiKhoa'
+    # Password box of the login form, re-rendered when a login attempt fails
+    LOGIN_FAILED_MARKER = 'ucDangNhap$txtMatKhau'
+    LOGIN_SUCCESS_MARKER = 'Chào bạn'
+    # Error pages for a postback with a stale login form (see login_form.py)
+    STALE_FORM_MARKER_BYTES = tuple(marker.encode() for marker in STALE_FORM_MARKERS)
+    # What verify_login() reads the postback response up to
+    LOGIN_RESULT_MARKERS = (LOGIN_SUCCESS_MARKER.encode(), LOGIN_FAILED_MARKER.encode()) + STALE_FORM_MARKER_BYTES
+    # Overridable to point at a local stand-in (see benchmarks/fake_portal.py)
+    BASE_URL = os.environ.get('EDUSOFT_BASE_URL', "https://edusoftweb.hcmiu.edu.vn").rstrip('/')
+    # Pages get_bundle() can fetch: name -> default.aspx?page= value
+    PAGES = {
+        GRADES: 'xemdiemthi',
+        TIMETABLE: 'thoikhoabieu',
+        EXAMS: 'xemlichthi'
+    }
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1'
+    }
+
+    def __init__(self, parser: Optional[GradesParser] = None):
+        self.base_url = self.BASE_URL
+        self.parser = parser or default_parser()
+        self.session_expired = False
+        # Login form fields shared by all scrapers (see login_form.py)
+        self.form_cache = default_login_form_cache()
+    
+    def export_cookies(self) -> List[Dict[str, str]]:
+        """The session's cookies, for resuming it in another process (see SessionPool)"""
+        raise NotImplementedError
+    
+    def import_cookies(self, cookies: List[Dict[str, str]]):
+        """Adopt cookies from export_cookies(), taking over that portal session"""
+        raise NotImplementedError
     
     def get_viewstate(self, html: str) -> Dict[str, str]:
         """Extract VIEWSTATE and other form fields from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        viewstate = soup.find('input', {'name': '__VIEWSTATE'})
-        viewstate_generator = soup.find('input', {'name': '__VIEWSTATEGENERATOR'})
-        event_target = soup.find('input', {'name': '__EVENTTARGET'})
-        event_argument = soup.find('input', {'name': '__EVENTARGUMENT'})
-        
+        return extract_form_fields(html)
+    
+    def is_login_page(self, html: str) -> bool:
+        """Check whether the portal served the login form instead of the requested page"""
+        return self.LOGIN_FORM_MARKER in html
+    
+    def login_form_data(self, fields: Dict[str, str], username: str, password: str) -> Dict[str, str]:
+        """Build the login form postback from the login page's hidden form fields"""
+        form_data = dict(fields)
+        form_data.update({
+            'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtTaiKhoa': username,
+            'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtMatKhau': password,
+            'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$btnDangNhap': 'Đăng Nhập'
+        })
+        return form_data
+    
+    def login_headers(self) -> Dict[str, str]:
+        """Extra headers sent with the login form postback"""
         return {
-            '__VIEWSTATE': viewstate['value'] if viewstate else '',
-            '__VIEWSTATEGENERATOR': viewstate_generator['value'] if viewstate_generator else '',
-            '__EVENTTARGET': event_target['value'] if event_target else '',
-            '__EVENTARGUMENT': event_argument['value'] if event_argument else ''
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Origin': self.base_url,
+            'Referer': f"{self.base_url}/default.aspx"
         }
     
+    def is_login_success(self, html: str, username: str) -> bool:
+        """Check whether the login postback landed on a logged-in page"""
+        return 'Chào bạn' in html or username.upper() in html
+    
+    def get_last_updated(self, html: str) -> str:
+        """Extract the portal's grade "last updated" stamp without a full parse"""
+        return extract_last_updated(html)
+    
+    def parse_grades(self, html: str) -> Dict:
+        """Parse student info and grades from HTML"""
+        with stage('parse'):
+            # Inline, or on the parse thread/process pool (see parse_pool.py)
+            return default_pool().parse_grades(self.parser, html)
+    
+    def parse_page(self, name: str, html: str) -> Dict:
+        """Parse one of PAGES with its page-specific parser"""
+        if name == GRADES:
+            return self.parse_grades(html)
+        with stage(f'parse_{name}'):
+            return PAGE_PARSERS[name](html)
+
+
+class EdusoftScraper(PortalScraper):
+    """Scraper over a requests session"""
+
+    def __init__(self, parser: Optional[GradesParser] = None):
+        super().__init__(parser)
+        self.timeout = upstream_timeout()
+        # Own cookie jar, shared keep-alive connection pool
+        self.session = new_session()
+        self.session.headers.update(self.HEADERS)
+    
+    def export_cookies(self) -> List[Dict[str, str]]:
+        return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                for c in self.session.cookies]
+    
+    def import_cookies(self, cookies: List[Dict[str, str]]):
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+    
+    def fetch_login_form(self) -> Dict[str, str]:
+        """
+        GET the login page for its hidden form fields and cache them. Only
+        read as far as the login box, where the hidden fields usually are, or
+        on to the end of the form if __VIEWSTATEGENERATOR isn't among them.
+        """
+        print("🔄 Fetching login page...")
+        with stage('login_page'):
+            response = self.session.get(f"{self.base_url}/default.aspx", timeout=self.timeout, stream=True)
+            try:
+                response.raise_for_status()
+                encoding = response.encoding or 'utf-8'
+                found, head = read_until(response, (self.LOGIN_FORM_MARKER.encode(),), release=False)
+                fields = self.get_viewstate(head.decode(encoding, 'replace'))
+                if found is not None and not fields.get('__VIEWSTATEGENERATOR') and b'</form>' not in head:
+                    _, rest = read_until(response, (b'</form>',))
+                    fields = self.get_viewstate((head + rest).decode(encoding, 'replace'))
+            finally:
+                response.close()
+        self.form_cache.set(self.base_url, fields)
+        return fields
+    
+    def login_form(self) -> Tuple[Dict[str, str], bool]:
+        """The login form fields, from the cache if possible, and whether they were cached"""
+        fields = self.form_cache.get(self.base_url)
+        if fields is not None:
+            return fields, True
+        return self.fetch_login_form(), False
+    
+    def post_login(self, fields: Dict[str, str], username: str, password: str,
+                   stream: bool = False) -> requests.Response:
+        """Submit the login form"""
+        return self.session.post(
+            f"{self.base_url}/default.aspx",
+            data=self.login_form_data(fields, username, password),
+            headers=self.login_headers(),
+            timeout=self.timeout,
+            stream=stream
+        )
+    
     def login(self, username: str, password: str) -> bool:
         """Login to EduSoft portal"""
         try:
-            # Step 1: Get the login page to retrieve VIEWSTATE
-            print("🔄 Fetching login page...")
-            response = self.session.get(f"{self.base_url}/default.aspx")
-            response.raise_for_status()
-            
-            # Extract VIEWSTATE
-            form_data = self.get_viewstate(response.text)
+            # Step 1: Login form fields (VIEWSTATE), cached or from the login page
+            fields, cached = self.login_form()
             
-            # Step 2: Prepare login form data
-            form_data.update({
-                'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtTaiKhoa': username,
-                'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$txtMatKhau': password,
-                'ctl00$ContentPlaceHolder1$ctl00$ucDangNhap$btnDangNhap': 'Đăng Nhập'
-            })
-            
-            # Step 3: Submit login form
+            # Step 2: Submit login form
             print("🔐 Logging in...")
-            login_response = self.session.post(
-                f"{self.base_url}/default.aspx",
-                data=form_data,
-                headers={
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'Origin': self.base_url,
-                    'Referer': f"{self.base_url}/default.aspx"
-                }
-            )
+            with stage('login'):
+                login_response = self.post_login(fields, username, password)
+            
+            if cached and is_stale_form_response(login_response.text):
+                # The portal no longer accepts the cached form; refetch it and try once more
+                self.form_cache.invalidate(self.base_url, fields)
+                fields = self.fetch_login_form()
+                with stage('login'):
+                    login_response = self.post_login(fields, username, password)
             
             login_response.raise_for_status()
             
             # Check if login was successful
-            if 'Chào bạn' in login_response.text or username.upper() in login_response.text:
+            if self.is_login_success(login_response.text, username):
                 print("✅ Login successful!")
+                self.session_expired = False
                 return True
             else:
                 print("❌ Login failed!")
                 return False
                 
+        except UpstreamUnavailable:
+            # The guard refused the request; that's no login failure, let callers decide
+            raise
         except Exception as e:
             print(f"❌ Error during login: {e}")
             return False
     
-    def get_grades(self) -> Dict:
-        """Retrieve grades page"""
+    def verify_login(self, username: str, password: str) -> bool:
+        """
+        Cheaper login for credential checks.
+        
+        Stops reading the postback response as soon as a success or failure
+        marker shows up. The session ends up logged in exactly like with
+        login().
+        """
+        try:
+            fields, cached = self.login_form()
+            login_response, marker, body = self.verify_postback(fields, username, password)
+            if cached and marker in self.STALE_FORM_MARKER_BYTES:
+                # Stale cached form, see login()
+                self.form_cache.invalidate(self.base_url, fields)
+                login_response, marker, body = self.verify_postback(self.fetch_login_form(), username, password)
+            login_response.raise_for_status()
+            
+            if marker is None:
+                # Neither marker: fall back to the full-page check
+                html = body.decode(login_response.encoding or 'utf-8', 'replace')
+                success = self.is_login_success(html, username) and not self.is_login_page(html)
+            else:
+                success = marker == self.LOGIN_SUCCESS_MARKER.encode()
+            if success:
+                self.session_expired = False
+            return success
+            
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"❌ Error during login: {e}")
+            return False
+    
+    def verify_postback(self, fields: Dict[str, str], username: str,
+                        password: str) -> Tuple[requests.Response, Optional[bytes], bytes]:
+        """
+        Submit the login form and read the response up to the first of
+        LOGIN_RESULT_MARKERS: (response, marker or None, body read). An error
+        response is only scanned for STALE_FORM_MARKER_BYTES, as the portal
+        rejects a stale form with a 500 viewstate error page.
+        """
+        with stage('login'):
+            login_response = self.post_login(fields, username, password, stream=True)
+            markers = self.STALE_FORM_MARKER_BYTES if login_response.status_code >= 400 else self.LOGIN_RESULT_MARKERS
+            marker, body = read_until(login_response, markers)
+        return login_response, marker, body
+    
+    def fetch_grades_html(self) -> str:
+        """
+        Retrieve the raw grades page, or an empty string on failure.
+        Raises UpstreamUnavailable if the upstream guard refuses the request.
+        """
+        return self.fetch_page_html(GRADES)
+    
+    def fetch_page_html(self, name: str) -> str:
+        """
+        Retrieve the raw HTML of one of PAGES, or an empty string on failure
+        (session_expired is set if the portal expired the session).
+        Raises UpstreamUnavailable if the upstream guard refuses the request.
+        """
         try:
-            print("📊 Fetching grades page...")
-            response = self.session.get(f"{self.base_url}/default.aspx?page=xemdiemthi")
+            print(f"📊 Fetching {name} page...")
+            with stage(f'{name}_page'):
+                response = self.session.get(f"{self.base_url}/default.aspx?page={self.PAGES[name]}",
+                                            timeout=self.timeout)
             response.raise_for_status()
             
-            return self.parse_grades(response.text)
+            # The portal redirects expired sessions back to the login form
+            if self.is_login_page(response.text):
+                print("⚠️ Session expired, login required")
+                self.session_expired = True
+                return ''
+            
+            return response.text
             
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"❌ Error fetching {name}: {e}")
+            return ''
+    
+    def fetch_pages(self, names: Sequence[str]) -> Dict[str, str]:
+        """
+        Fetch several of PAGES at once over this session: name -> HTML, empty
+        for pages that failed. The requests run concurrently, so this takes
+        about as long as the slowest page.
+        """
+        if len(names) == 1:
+            return {names[0]: self.fetch_page_html(names[0])}
+        # Each page request records its stage timing on the calling request
+        futures = {name: page_executor().submit(contextvars.copy_context().run, self.fetch_page_html, name)
+                   for name in names}
+        return {name: future.result() for name, future in futures.items()}
+    
+    def get_bundle(self, names: Sequence[str] = tuple(PortalScraper.PAGES)) -> Dict[str, Dict]:
+        """
+        Fetch and parse several pages over this (logged-in) session: name ->
+        parsed page, empty for pages that failed
+        """
+        pages = self.fetch_pages(names)
+        return {name: self.parse_page(name, html) if html else {} for name, html in pages.items()}
+    
+    def stream_grades(self) -> Iterator[GradesEvent]:
+        """
+        Download and parse the grades page incrementally.
+
+        Yields the StreamingGradesParser events as the body arrives, then a
+        final ('grades', payload) event with the full parse. On an expired
+        session (session_expired is set) or a fetch error it yields a single
+        ('error', message) event instead, possibly after some rows.
+        """
+        parser = StreamingGradesParser()
+        marker = self.LOGIN_FORM_MARKER
+        tail = ''
+        parse_seconds = 0.0
+        started = time.perf_counter()
+        try:
+            print("📊 Streaming grades page...")
+            response = self.session.get(f"{self.base_url}/default.aspx?page={self.PAGES[GRADES]}",
+                                        timeout=self.timeout, stream=True)
+            try:
+                response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')('replace')
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    text = decoder.decode(chunk)
+                    # The portal redirects expired sessions back to the login form
+                    if marker in tail + text:
+                        print("⚠️ Session expired, login required")
+                        self.session_expired = True
+                        yield 'error', 'Session expired'
+                        return
+                    tail = text[-len(marker):]
+                    parse_started = time.perf_counter()
+                    events = parser.feed(text)
+                    parse_seconds += time.perf_counter() - parse_started
+                    yield from events
+                parse_started = time.perf_counter()
+                events = parser.feed(decoder.decode(b'', final=True)) + parser.close()
+                parse_seconds += time.perf_counter() - parse_started
+                yield from events
+            finally:
+                response.close()
+        except UpstreamUnavailable as e:
+            yield 'error', str(e)
+            return
         except Exception as e:
             print(f"❌ Error fetching grades: {e}")
+            yield 'error', 'Failed to retrieve grades data from the server'
+            return
+        finally:
+            # Download and parsing interleave; split the time between the two stages
+            record('grades_page', time.perf_counter() - started - parse_seconds)
+            record('parse', parse_seconds)
+        yield 'grades', parser.result()
+
+    def get_grades(self) -> Dict:
+        """Retrieve and parse grades page"""
+        html = self.fetch_grades_html()
+        if not html:
             return {}
-    
-    def parse_grades(self, html: str) -> Dict:
-        """Parse student info and grades from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        result = {
-            'student_info': {},
-            'grades': [],
-            'last_updated': ''
-        }
-        
-        # Extract student info
-        info_fields = {
-            'ma_sinh_vien': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblMaSinhVien',
-            'ten_sinh_vien': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblTenSinhVien',
-            'lop': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblLop',
-            'nganh': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lbNganh',
-            'khoa': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblKhoa',
-            'phai': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblPhai',
-            'noi_sinh': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblNoiSinh',
-            'he_dao_tao': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblHeDaoTao',
-            'khoa_hoc': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblKhoaHoc',
-            'co_van_hoc_tap': 'ContentPlaceHolder1_ctl00_ucThongTinSV_lblCVHT'
-        }
-        
-        for key, element_id in info_fields.items():
-            element = soup.find('span', {'id': element_id})
-            if element:
-                result['student_info'][key] = element.text.strip()
-        
-        # Extract grades table
-        grade_container = soup.find('div', {'id': 'ContentPlaceHolder1_ctl00_div1'})
-        if grade_container:
-            table = grade_container.find('table')
-            if table:
-                rows = table.find_all('tr')
-                
-                # Get headers
-                headers = []
-                if rows:
-                    header_row = rows[0]
-                    headers = [th.text.strip() for th in header_row.find_all(['th', 'td'])]
-                
-                # Get grade rows
-                for row in rows[1:]:
-                    cells = row.find_all('td')
-                    if cells:
-                        grade = {}
-                        for i, cell in enumerate(cells):
-                            header = headers[i] if i < len(headers) else f'column_{i}'
-                            grade[header] = cell.text.strip()
-                        
-                        if grade:
-                            result['grades'].append(grade)
-        
-        # Extract last updated time
-        last_updated_elem = soup.find('span', {'id': 'ContentPlaceHolder1_ctl00_lblNgayCapNhatDiem'})
-        if last_updated_elem:
-            result['last_updated'] = last_updated_elem.text.strip()
-        
-        return result
+        return self.parse_grades(html)
     
     def save_to_file(self, data: Dict, filename: str = 'grades.json'):
         """Save data to JSON file"""
@@ -220,8 +454,12 @@ def main():
         scraper.save_to_file(grades_data)
         
         # Also save raw HTML
-        response = scraper.session.get(f"{scraper.base_url}/default.aspx?page=xemdiemthi")
+        response = scraper.session.get(f"{scraper.base_url}/default.aspx?page=xemdiemthi", timeout=scraper.timeout)
         scraper.save_html(response.text)
+        if os.environ.get('PAGE_ARCHIVE_DIR'):
+            # Only the latest page is in grades.html; the archive keeps every fetch
+            from page_archive import PageArchive
+            PageArchive(os.environ['PAGE_ARCHIVE_DIR']).put(username, GRADES, response.text)
         
     else:
         print("❌ Failed to retrieve grades.")
@@ -240,6 +478,7 @@ USAGE:
 ------
 1. Install required packages:
    pip install requests beautifulsoup4
+   (optionally lxml or selectolax for faster parsing)
 
 2. Run the script:
    python edusoft_scraper.py
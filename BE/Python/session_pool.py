@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pool of logged-in EduSoft sessions shared across API requests
+
+With a shared store (see shared_store.py) the pool also publishes each
+session's cookie jar, so a worker without a live session for a student
+can resume another worker's portal session instead of logging in again.
+"""
+
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from parsers import GradesEvent
+from script import GRADES, EdusoftScraper, PortalScraper
+
+logger = logging.getLogger(__name__)
+
+# Secret mixed into credential keys so that keys never reveal the password.
+# Set SESSION_KEY_SECRET when several workers must agree on the same keys.
+_KEY_SECRET = os.environ.get('SESSION_KEY_SECRET', '').encode() or secrets.token_bytes(32)
+
+
+def credential_key(username: str, password: str) -> str:
+    """Build a stable, non-reversible key for a username/password pair"""
+    message = f"{username.strip().upper()}\0{password}".encode('utf-8')
+    return hmac.new(_KEY_SECRET, message, hashlib.sha256).hexdigest()
+
+
+class PooledSession:
+    """A logged-in scraper together with its bookkeeping timestamps"""
+
+    __slots__ = ('scraper', 'created_at', 'last_used', 'shared_at')
+
+    def __init__(self, scraper: PortalScraper):
+        self.scraper = scraper
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # When the cookie jar was last written to the shared store
+        self.shared_at = self.created_at
+
+
+class BaseSessionPool:
+    """
+    LRU pool of authenticated EduSoft sessions keyed on credentials, without
+    any portal I/O: SessionPool and AsyncSessionPool add the logins and page
+    fetches for their kind of scraper.
+
+    Entries expire after `ttl` seconds without use (the portal's own session
+    timeout is sliding too) and the least recently used entry is evicted once
+    the pool holds `max_size` sessions.
+
+    With a `store`, cookie jars are published there (expiring after `ttl`
+    too) and a key missing from this pool is looked up in the store before
+    the caller has to log in.
+    """
+
+    # Scraper that logs in and resumes sessions from the shared store
+    scraper_class = PortalScraper
+
+    def __init__(self, max_size: int = 256, ttl: float = 600, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._sessions: 'OrderedDict[str, PooledSession]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def get(self, key: str) -> Optional[PortalScraper]:
+        """Return the pooled scraper for `key` if it is still fresh"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and now - entry.last_used > self.ttl:
+                del self._sessions[key]
+                entry = None
+            if entry is not None:
+                entry.last_used = now
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                # Keep the shared copy from expiring while this worker uses the session
+                republish = self.store is not None and now - entry.shared_at > self.ttl / 2
+                if republish:
+                    entry.shared_at = now
+        if entry is not None:
+            if republish:
+                self.share(key, entry.scraper)
+            return entry.scraper
+
+        scraper = self.resume(key)
+        with self._lock:
+            if scraper is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+        self.put(key, scraper, share=False)
+        return scraper
+
+    def put(self, key: str, scraper: PortalScraper, share: bool = True):
+        """Add a logged-in scraper, evicting the least recently used ones"""
+        with self._lock:
+            self._sessions[key] = PooledSession(scraper)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+        if share:
+            self.share(key, scraper)
+
+    def discard(self, key: str):
+        """Forget the session stored under `key`"""
+        with self._lock:
+            self._sessions.pop(key, None)
+        if self.store is not None:
+            self.store.delete(f'session:{key}')
+
+    def share(self, key: str, scraper: PortalScraper):
+        """Publish the scraper's cookie jar to the shared store"""
+        if self.store is None:
+            return
+        value = json.dumps(scraper.export_cookies()).encode('utf-8')
+        self.store.set(f'session:{key}', value, ttl=self.ttl)
+
+    def resume(self, key: str) -> Optional[PortalScraper]:
+        """A scraper carrying the cookie jar another worker shared under `key`, if any"""
+        if self.store is None:
+            return None
+        value = self.store.get(f'session:{key}')
+        if value is None:
+            return None
+        scraper = self.scraper_class()
+        scraper.import_cookies(json.loads(value))
+        return scraper
+
+    def stats(self) -> Dict:
+        """Pool size and hit counters"""
+        with self._lock:
+            return {
+                'size': len(self._sessions),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits
+            }
+
+
+class SessionPool(BaseSessionPool):
+    """BaseSessionPool of EdusoftScraper sessions"""
+
+    scraper_class = EdusoftScraper
+
+    def login(self, username: str, password: str) -> Optional[EdusoftScraper]:
+        """Log in with a fresh scraper and pool it; returns None on failure"""
+        scraper = self.scraper_class()
+        if not scraper.login(username, password):
+            return None
+        self.put(credential_key(username, password), scraper)
+        return scraper
+
+    def acquire(self, username: str, password: str) -> Optional[EdusoftScraper]:
+        """Return a logged-in scraper, reusing a pooled session when possible"""
+        scraper = self.get(credential_key(username, password))
+        if scraper is not None:
+            return scraper
+        return self.login(username, password)
+
+    def verify(self, username: str, password: str) -> bool:
+        """
+        Check credentials as cheaply as possible: a pooled session counts as
+        verified, otherwise log in with the streaming verify_login() and pool
+        the session for the next grades request
+        """
+        key = credential_key(username, password)
+        if self.get(key) is not None:
+            return True
+        scraper = EdusoftScraper()
+        if not scraper.verify_login(username, password):
+            return False
+        self.put(key, scraper)
+        return True
+
+    def get_grades_page(self, username: str, password: str) -> Optional[Tuple[EdusoftScraper, str]]:
+        """
+        Fetch the raw grades page over a pooled session.
+
+        A pooled session the portal has expired is dropped and the user is
+        logged in again transparently. Returns None if the login fails and the
+        scraper together with the page HTML (empty on fetch errors) otherwise.
+        """
+        pages = self.get_pages(username, password, (GRADES,))
+        if pages is None:
+            return None
+        scraper, html = pages
+        return scraper, html[GRADES]
+
+    def get_pages(self, username: str, password: str,
+                  names: Sequence[str]) -> Optional[Tuple[EdusoftScraper, Dict[str, str]]]:
+        """
+        Fetch several portal pages (EdusoftScraper.PAGES) concurrently over one
+        pooled session, logging in again if the portal expired it. Returns
+        None if the login fails, otherwise the scraper and name -> HTML
+        (empty for pages that failed).
+        """
+        key = credential_key(username, password)
+        scraper = self.get(key)
+        if scraper is not None:
+            pages = scraper.fetch_pages(names)
+            if not scraper.session_expired:
+                return scraper, pages
+            logger.info("Pooled portal session expired, logging in again")
+            self.discard(key)
+
+        scraper = self.login(username, password)
+        if scraper is None:
+            return None
+        return scraper, scraper.fetch_pages(names)
+
+    def stream_grades(self, username: str, password: str) -> Optional[Iterator[GradesEvent]]:
+        """
+        EdusoftScraper.stream_grades() over a pooled session, logging in again
+        if the portal expired it. Returns None if the login fails.
+        """
+        key = credential_key(username, password)
+        scraper = self.get(key)
+        if scraper is not None:
+            events = scraper.stream_grades()
+            # An expired session shows up as the first event, before any rows
+            first = next(events)
+            if not scraper.session_expired:
+                return itertools.chain((first,), events)
+            logger.info("Pooled portal session expired, logging in again")
+            self.discard(key)
+
+        scraper = self.login(username, password)
+        if scraper is None:
+            return None
+        return scraper.stream_grades()
+
+    def get_pooled_grades_page(self, key: str) -> Optional[Tuple[EdusoftScraper, str]]:
+        """
+        Fetch the raw grades page over the session pooled under `key`, without
+        logging in. Returns None if there is no live session for `key`.
+        """
+        scraper = self.get(key)
+        if scraper is None:
+            return None
+        html = scraper.fetch_grades_html()
+        if scraper.session_expired:
+            self.discard(key)
+            return None
+        return scraper, html
+
+    def get_grades(self, username: str, password: str) -> Optional[Dict]:
+        """Fetch and parse grades over a pooled session; None if the login fails"""
+        page = self.get_grades_page(username, password)
+        if page is None:
+            return None
+        scraper, html = page
+        return scraper.parse_grades(html) if html else {}
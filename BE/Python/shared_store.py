@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Key/value store shared by the API workers of a node (or of several nodes)
+
+Each worker process used to keep its own portal sessions and parsed
+transcripts, so with N gunicorn workers a returning student reached the
+worker holding their session or cached result about 1/N of the time. A
+shared store holds byte values under string keys with an optional expiry,
+evicts the least recently used entries once the stored bytes exceed
+max_bytes, and reports its size:
+
+- MemorySharedStore: in-process, for a single worker
+- SQLiteSharedStore: a WAL-mode SQLite file that every worker on the node
+  opens (and memory-maps)
+- RedisSharedStore: a Redis server (requires the `redis` package), shared
+  by several nodes; eviction is left to the server's maxmemory policy
+
+All three have the same get/set/delete/stats methods, which is all the
+session pool and the result cache use. SHARED_STORE selects one (see
+open_shared_store()).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Default budget for stored keys and values, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def entry_size(key: str, value: bytes) -> int:
+    """Bytes an entry counts against max_bytes"""
+    return len(key) + len(value)
+
+
+class MemorySharedStore:
+    """In-process LRU store, bounded by the total size of its entries"""
+
+    backend = 'memory'
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at or None)
+        self._entries: 'OrderedDict[str, Tuple[bytes, Optional[float]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._bytes += entry_size(key, value)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry_size(key, entry[0])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+class SQLiteSharedStore:
+    """
+    Store in an SQLite file shared by every process that opens it.
+
+    WAL mode lets readers run alongside a writer, and reads go through a
+    memory map of the file. The total size of the entries is kept in a
+    one-row table by triggers, so every process sees the same accounting.
+    """
+
+    backend = 'sqlite'
+    # An entry's LRU position is updated at most this often, so most reads don't write
+    TOUCH_INTERVAL = 30
+    # Least recently used entries looked at per eviction step
+    EVICT_BATCH = 16
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # A cache: losing the last transactions on power loss is fine
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'PRAGMA mmap_size={int(self.max_bytes * 2)}')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS shared_store ('
+            ' key TEXT PRIMARY KEY,'
+            ' value BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' expires_at REAL,'
+            ' accessed_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS shared_store_accessed_at ON shared_store (accessed_at);'
+            'CREATE INDEX IF NOT EXISTS shared_store_expires_at ON shared_store (expires_at);'
+            'CREATE TABLE IF NOT EXISTS shared_store_size (bytes INTEGER NOT NULL);'
+            'INSERT INTO shared_store_size SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM shared_store_size);'
+            'CREATE TRIGGER IF NOT EXISTS shared_store_insert AFTER INSERT ON shared_store'
+            ' BEGIN UPDATE shared_store_size SET bytes = bytes + NEW.size; END;'
+            'CREATE TRIGGER IF NOT EXISTS shared_store_update AFTER UPDATE OF size ON shared_store'
+            ' BEGIN UPDATE shared_store_size SET bytes = bytes + NEW.size - OLD.size; END;'
+            'CREATE TRIGGER IF NOT EXISTS shared_store_delete AFTER DELETE ON shared_store'
+            ' BEGIN UPDATE shared_store_size SET bytes = bytes - OLD.size; END;'
+        )
+        # Session cookies end up in here; keep the file private to the service user
+        if self.path != ':memory:':
+            try:
+                os.chmod(self.path, 0o600)
+            except OSError:
+                pass
+
+    def _db(self) -> sqlite3.Connection:
+        # Callers hold self._lock; a forked worker opens its own connection (see SQLiteCacheBackend)
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM shared_store WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            if now - row[2] > self.TOUCH_INTERVAL:
+                conn.execute('UPDATE shared_store SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                'INSERT INTO shared_store VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,'
+                ' expires_at = excluded.expires_at, accessed_at = excluded.accessed_at',
+                (key, value, entry_size(key, value), now + ttl if ttl else None, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used ones while over max_bytes"""
+        conn.execute('DELETE FROM shared_store WHERE expires_at <= ?', (now,))
+        excess = conn.execute('SELECT bytes FROM shared_store_size').fetchone()[0] - self.max_bytes
+        while excess > 0:
+            oldest = conn.execute(
+                'SELECT key, size FROM shared_store ORDER BY accessed_at LIMIT ?', (self.EVICT_BATCH,)
+            ).fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                conn.execute('DELETE FROM shared_store WHERE key = ?', (key,))
+                self.evictions += 1
+                excess -= size
+                if excess <= 0:
+                    break
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._db()
+            conn.execute('DELETE FROM shared_store WHERE key = ?', (key,))
+            conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._db()
+            entries = conn.execute('SELECT COUNT(*) FROM shared_store').fetchone()[0]
+            size = conn.execute('SELECT bytes FROM shared_store_size').fetchone()[0]
+        return {
+            'backend': self.backend,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            # Counters are per process; entries and bytes cover every process
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class RedisSharedStore:
+    """Store on a Redis server; keys are namespaced with `prefix`"""
+
+    backend = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'itpm:'):
+        # Optional dependency, only needed with a redis:// SHARED_STORE
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def stats(self) -> Dict:
+        memory = self.client.info('memory')
+        return {
+            'backend': self.backend,
+            'entries': self.client.dbsize(),
+            'bytes': memory['used_memory'],
+            'max_bytes': memory.get('maxmemory', 0),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.client.info('stats').get('evicted_keys', 0)
+        }
+
+
+def open_shared_store(spec: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Store for a SHARED_STORE value: empty or 'memory' for an in-process
+    store, a redis:// (rediss://, unix://) URL for Redis, otherwise an
+    SQLite file path, optionally written as sqlite:///path
+    """
+    if not spec or spec == 'memory':
+        return MemorySharedStore(max_bytes=max_bytes)
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSharedStore(spec)
+    if spec.startswith('sqlite:///'):
+        spec = spec[len('sqlite:///'):]
+    return SQLiteSharedStore(spec, max_bytes=max_bytes)
+
+
+def default_shared_store():
+    """The process-wide store, configured by SHARED_STORE and SHARED_STORE_MAX_BYTES"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = open_shared_store(
+                os.environ.get('SHARED_STORE'),
+                max_bytes=int(os.environ.get('SHARED_STORE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            )
+        return _default_store
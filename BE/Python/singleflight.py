@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Single-flight request coalescing
+
+Concurrent calls made with the same key share one execution: the first
+caller runs the function, the others wait for it and receive the same
+result (or exception).
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based single-flight group"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[..., Any], *args) -> Tuple[Any, bool]:
+        """
+        Run fn(*args) unless a call for `key` is already in flight.
+        Returns (result, shared) where shared is True for callers that
+        waited on another caller's execution.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """asyncio single-flight group (use from a single event loop)"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args) -> Tuple[Any, bool]:
+        """
+        Async counterpart of SingleFlight.do. fn runs as its own task, so a
+        caller that is cancelled (e.g. the client disconnected) stops waiting
+        without cancelling the call for everyone else.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = self._calls[key] = asyncio.ensure_future(fn(*args))
+
+        def finished(task: asyncio.Task):
+            del self._calls[key]
+            # Mark the exception as retrieved in case every caller was cancelled
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task), False
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Persistent transcript store (SQLite, WAL mode)
+
+Every parsed transcript is upserted per student: only course and semester
+rows whose content changed are written, and each course change is kept in
+course_changes as history. Analytics queries (per-student history,
+per-course grade distributions, cohort aggregates) are answered from the
+store without contacting the portal.
+"""
+
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+from changes import course_rows
+from records import Transcript
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS students ('
+    ' student_id TEXT PRIMARY KEY,'
+    ' name TEXT, class TEXT, major TEXT, faculty TEXT, intake TEXT,'
+    ' cgpa_4 REAL, cgpa_10 REAL, credits INTEGER, classification TEXT,'
+    ' last_updated TEXT, updated_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS semesters ('
+    ' student_id TEXT NOT NULL,'
+    ' semester TEXT NOT NULL,'
+    ' position INTEGER NOT NULL,'
+    ' course_count INTEGER,'
+    ' semester_gpa_4 REAL, semester_gpa_10 REAL,'
+    ' cumulative_gpa_4 REAL, cumulative_gpa_10 REAL,'
+    ' credits_passed INTEGER, cumulative_credits INTEGER,'
+    ' PRIMARY KEY (student_id, semester))',
+    'CREATE TABLE IF NOT EXISTS courses ('
+    ' student_id TEXT NOT NULL,'
+    ' semester TEXT NOT NULL,'
+    ' code TEXT NOT NULL,'
+    ' occurrence INTEGER NOT NULL,'
+    ' position INTEGER NOT NULL,'
+    ' name TEXT, credits INTEGER, score_10 REAL, grade TEXT,'
+    ' raw TEXT NOT NULL,'
+    ' updated_at REAL NOT NULL,'
+    ' PRIMARY KEY (student_id, semester, code, occurrence))',
+    'CREATE TABLE IF NOT EXISTS course_changes ('
+    ' student_id TEXT NOT NULL,'
+    ' semester TEXT NOT NULL,'
+    ' code TEXT NOT NULL,'
+    ' old_score_10 REAL, new_score_10 REAL,'
+    ' old_grade TEXT, new_grade TEXT,'
+    ' changed_at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS courses_code_semester ON courses (code, semester)',
+    'CREATE INDEX IF NOT EXISTS courses_semester ON courses (semester)',
+    'CREATE INDEX IF NOT EXISTS course_changes_student ON course_changes (student_id, changed_at)',
+    'CREATE INDEX IF NOT EXISTS students_intake_major ON students (intake, major)'
+)
+
+SEMESTER_COLUMNS = ('course_count', 'semester_gpa_4', 'semester_gpa_10', 'cumulative_gpa_4',
+                    'cumulative_gpa_10', 'credits_passed', 'cumulative_credits')
+COURSE_COLUMNS = ('position', 'name', 'credits', 'score_10', 'grade', 'raw')
+
+# Student columns cohort aggregates can be grouped by
+COHORT_GROUPS = {'intake': 'intake', 'major': 'major', 'class': 'class', 'faculty': 'faculty'}
+
+
+class TranscriptStore:
+    """SQLite-backed store of parsed transcripts, one row per student/semester/course"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        # Callers hold self._lock; a forked worker opens its own connection
+        # rather than using the one inherited from the master
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def upsert(self, payload: Dict) -> Optional[Dict]:
+        """
+        Write a parsed grades payload, touching only rows that changed.
+        Returns counts of inserted/updated/deleted course rows, or None if the
+        payload has no student id.
+        """
+        info = payload.get('student_info') or {}
+        student_id = (info.get('ma_sinh_vien') or '').strip().upper()
+        if not student_id:
+            return None
+
+        transcript = Transcript.from_payload(payload)
+        projection = payload.get('grade_projection') or {}
+        now = time.time()
+
+        # course_rows() and Transcript.from_payload() walk the rows in the same order
+        courses = {}
+        for position, ((key, row), course) in enumerate(zip(course_rows(payload).items(), transcript.courses)):
+            courses[key] = (
+                position, course.name, course.credits, course.score_10, course.grade,
+                json.dumps(row, ensure_ascii=False, sort_keys=True)
+            )
+        semesters = {
+            summary.semester: (position,) + tuple(getattr(summary, column) for column in SEMESTER_COLUMNS)
+            for position, summary in enumerate(transcript.semesters)
+        }
+
+        counts = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        with self._lock, self._db() as conn:
+            conn.execute(
+                'INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (student_id) DO UPDATE SET'
+                ' name = excluded.name, class = excluded.class, major = excluded.major,'
+                ' faculty = excluded.faculty, intake = excluded.intake, cgpa_4 = excluded.cgpa_4,'
+                ' cgpa_10 = excluded.cgpa_10, credits = excluded.credits,'
+                ' classification = excluded.classification, last_updated = excluded.last_updated,'
+                ' updated_at = excluded.updated_at',
+                (student_id, info.get('ten_sinh_vien'), info.get('lop'), info.get('nganh'), info.get('khoa'),
+                 info.get('khoa_hoc'), transcript.cumulative.get('gpa_4'), transcript.cumulative.get('gpa_10'),
+                 transcript.cumulative.get('credits'), projection.get('current_classification'),
+                 transcript.last_updated, now)
+            )
+
+            stored_semesters = {
+                row['semester']: tuple(row[column] for column in ('position',) + SEMESTER_COLUMNS)
+                for row in conn.execute('SELECT * FROM semesters WHERE student_id = ?', (student_id,))
+            }
+            changed_semesters = [(student_id, name) + values for name, values in semesters.items()
+                                 if stored_semesters.get(name) != values]
+            conn.executemany(
+                'INSERT OR REPLACE INTO semesters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', changed_semesters
+            )
+            conn.executemany(
+                'DELETE FROM semesters WHERE student_id = ? AND semester = ?',
+                [(student_id, name) for name in stored_semesters if name not in semesters]
+            )
+
+            stored_courses = {
+                (row['semester'], row['code'], row['occurrence']): tuple(row[column] for column in COURSE_COLUMNS)
+                for row in conn.execute('SELECT * FROM courses WHERE student_id = ?', (student_id,))
+            }
+            writes, history = [], []
+            for key, values in courses.items():
+                previous = stored_courses.get(key)
+                if previous == values:
+                    continue
+                writes.append((student_id,) + key + values + (now,))
+                if previous is None:
+                    counts['inserted'] += 1
+                    continue
+                counts['updated'] += 1
+                # Renumbering (position) alone isn't a grade change
+                if previous[3:5] != values[3:5]:
+                    history.append((student_id, key[0], key[1], previous[3], values[3], previous[4], values[4], now))
+            removed = [(student_id,) + key for key in stored_courses if key not in courses]
+            counts['deleted'] = len(removed)
+
+            conn.executemany(
+                'INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', writes
+            )
+            conn.executemany(
+                'DELETE FROM courses WHERE student_id = ? AND semester = ? AND code = ? AND occurrence = ?', removed
+            )
+            conn.executemany('INSERT INTO course_changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)', history)
+        return counts
+
+    def student(self, student_id: str, changes: int = 50) -> Optional[Dict]:
+        """A student's stored transcript with semesters, courses and recent grade changes"""
+        student_id = student_id.strip().upper()
+        with self._lock:
+            conn = self._db()
+            student = conn.execute('SELECT * FROM students WHERE student_id = ?', (student_id,)).fetchone()
+            if student is None:
+                return None
+            semesters = conn.execute(
+                'SELECT * FROM semesters WHERE student_id = ? ORDER BY position', (student_id,)
+            ).fetchall()
+            courses = conn.execute(
+                'SELECT semester, code, name, credits, score_10, grade FROM courses'
+                ' WHERE student_id = ? ORDER BY position', (student_id,)
+            ).fetchall()
+            history = conn.execute(
+                'SELECT semester, code, old_score_10, new_score_10, old_grade, new_grade, changed_at'
+                ' FROM course_changes WHERE student_id = ? ORDER BY changed_at DESC LIMIT ?',
+                (student_id, changes)
+            ).fetchall()
+        result = dict(student)
+        result['semesters'] = [
+            {key: row[key] for key in row.keys() if key not in ('student_id', 'position')} for row in semesters
+        ]
+        result['courses'] = [dict(row) for row in courses]
+        result['changes'] = [dict(row) for row in history]
+        return result
+
+    def course_distribution(self, code: str, semester: Optional[str] = None) -> Dict:
+        """Letter grade counts and 10-point score statistics for one course"""
+        query = 'SELECT grade, score_10 FROM courses WHERE code = ?'
+        params = [code]
+        if semester:
+            query += ' AND semester = ?'
+            params.append(semester)
+        with self._lock:
+            rows = self._db().execute(query, params).fetchall()
+
+        grades: Dict[str, int] = {}
+        scores = []
+        for row in rows:
+            if row['grade']:
+                grades[row['grade']] = grades.get(row['grade'], 0) + 1
+            if row['score_10'] is not None:
+                scores.append(row['score_10'])
+        return {
+            'code': code,
+            'semester': semester,
+            'count': len(rows),
+            'grades': dict(sorted(grades.items())),
+            'score_10': {
+                'mean': round(statistics.fmean(scores), 2) if scores else None,
+                'median': round(statistics.median(scores), 2) if scores else None,
+                'min': min(scores, default=None),
+                'max': max(scores, default=None),
+                'pass_rate': round(sum(score >= 4 for score in scores) / len(scores), 3) if scores else None
+            }
+        }
+
+    def cohorts(self, group_by: str = 'intake', filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """Student count, GPA and credit aggregates and classification counts per cohort"""
+        column = COHORT_GROUPS[group_by]
+        where, params = [], []
+        for name, value in (filters or {}).items():
+            where.append(f'{COHORT_GROUPS[name]} = ?')
+            params.append(value)
+        clause = f' WHERE {" AND ".join(where)}' if where else ''
+
+        with self._lock:
+            conn = self._db()
+            aggregates = conn.execute(
+                f'SELECT {column} AS cohort, COUNT(*) AS students, AVG(cgpa_4) AS avg_cgpa_4,'
+                f' AVG(cgpa_10) AS avg_cgpa_10, AVG(credits) AS avg_credits,'
+                f' MIN(cgpa_4) AS min_cgpa_4, MAX(cgpa_4) AS max_cgpa_4'
+                f' FROM students{clause} GROUP BY {column} ORDER BY {column}', params
+            ).fetchall()
+            classifications = conn.execute(
+                f'SELECT {column} AS cohort, classification, COUNT(*) AS students'
+                f' FROM students{clause} GROUP BY {column}, classification', params
+            ).fetchall()
+
+        by_cohort: Dict = {}
+        for row in classifications:
+            by_cohort.setdefault(row['cohort'], {})[row['classification'] or 'unknown'] = row['students']
+        return [
+            {
+                group_by: row['cohort'],
+                'students': row['students'],
+                'avg_cgpa_4': round(row['avg_cgpa_4'], 2) if row['avg_cgpa_4'] is not None else None,
+                'avg_cgpa_10': round(row['avg_cgpa_10'], 2) if row['avg_cgpa_10'] is not None else None,
+                'min_cgpa_4': row['min_cgpa_4'],
+                'max_cgpa_4': row['max_cgpa_4'],
+                'avg_credits': round(row['avg_credits'], 1) if row['avg_credits'] is not None else None,
+                'classifications': by_cohort.get(row['cohort'], {})
+            }
+            for row in aggregates
+        ]
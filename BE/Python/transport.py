@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP transport for requests to the EduSoft portal
+
+Every scraper session gets its own cookie jar but mounts the same
+process-wide connection pool, so TCP+TLS connections to the portal are kept
+alive and reused across users. All requests carry connect/read timeouts and
+idempotent requests are retried with exponential backoff. Every request
+passes through the upstream guard (rate limit, adaptive concurrency limit,
+circuit breaker; see upstream_guard.py).
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from upstream_guard import UpstreamGuard, default_guard
+
+# Seconds to wait for a connection to the portal / for its response
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 30))
+# Keep-alive connections kept open to the portal per process
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 32))
+# Retries for idempotent requests (GET/HEAD) and connection failures
+RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('UPSTREAM_RETRY_BACKOFF', 0.5))
+# Bytes read at a time from streamed responses
+STREAM_CHUNK_SIZE = 8192
+# A streamed response stopped early is drained (so its keep-alive connection
+# goes back to the pool) if at most this many bytes are left, closed otherwise
+DRAIN_LIMIT = 64 * 1024
+
+_adapter: Optional['GuardedAdapter'] = None
+_adapter_lock = threading.Lock()
+
+
+def upstream_timeout() -> Tuple[float, float]:
+    """(connect, read) timeout passed to every portal request"""
+    return CONNECT_TIMEOUT, READ_TIMEOUT
+
+
+class GuardedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that sends every request through an UpstreamGuard. A 5xx
+    response or a connection error counts as a failure; the latency fed to
+    the guard is the time until the response headers arrived.
+    """
+
+    def __init__(self, guard: UpstreamGuard, **kwargs):
+        self.guard = guard
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        probe = self.guard.acquire()
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = super().send(request, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            self.guard.release(ok, time.perf_counter() - started, probe)
+
+
+def shared_adapter() -> 'GuardedAdapter':
+    """The process-wide adapter holding the portal connection pool"""
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            retry = Retry(
+                total=RETRIES,
+                connect=RETRIES,
+                read=RETRIES,
+                status=RETRIES,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({'GET', 'HEAD'}),
+                raise_on_status=False
+            )
+            _adapter = GuardedAdapter(default_guard(), pool_connections=4, pool_maxsize=POOL_SIZE,
+                                      max_retries=retry)
+        return _adapter
+
+
+def new_session() -> requests.Session:
+    """
+    A requests.Session with its own cookie jar that shares the process-wide
+    connection pool. Don't close() it: that would close the shared pool.
+    """
+    session = requests.Session()
+    adapter = shared_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def read_until(response: requests.Response, markers: Sequence[bytes],
+               release: bool = True) -> Tuple[Optional[bytes], bytes]:
+    """
+    Read a response opened with stream=True only until one of `markers`
+    appears. Returns the marker found (None if the body ended first) and the
+    body read so far. The response is released either way, unless `release`
+    is False, which leaves it open for the caller to read on and close.
+    """
+    body = bytearray()
+    overlap = max(len(marker) for marker in markers) - 1
+    found = None
+    try:
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            # Markers can straddle chunks, so rescan the tail of the previous one
+            start = max(0, len(body) - overlap)
+            body += chunk
+            hits = [(index, marker) for marker in markers
+                    if (index := body.find(marker, start)) != -1]
+            if hits:
+                found = min(hits)[1]
+                break
+        if found is not None and release:
+            drain_if_small(response)
+    finally:
+        if release:
+            response.close()
+    return found, bytes(body)
+
+
+def drain_if_small(response: requests.Response):
+    """
+    Read the rest of a partly read streamed response if little is left, so
+    its keep-alive connection goes back to the pool instead of being closed
+    """
+    length = response.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) - response.raw.tell() <= DRAIN_LIMIT:
+        for _ in response.iter_content(STREAM_CHUNK_SIZE):
+            pass
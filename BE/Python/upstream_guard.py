@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Guard for requests to the EduSoft portal
+
+When the portal slows down (typically while results are being released),
+every worker thread ends up blocked on it and the whole API stalls. The
+guard sits in front of every portal request and combines:
+
+- a global token-bucket rate limit (UPSTREAM_RATE / UPSTREAM_BURST, off by default)
+- a cap on concurrent requests that adapts to the portal (AIMD): it grows by
+  about one per round of fast, successful requests and is cut back when
+  responses are slower than UPSTREAM_LATENCY_TARGET or fail
+- a circuit breaker that opens after UPSTREAM_FAILURE_THRESHOLD consecutive
+  failures, rejects requests for UPSTREAM_OPEN_SECONDS, then lets a single
+  probe through to decide whether to close again
+
+A request that can't get a slot within UPSTREAM_ACQUIRE_TIMEOUT, or that
+arrives while the circuit is open, raises UpstreamUnavailable right away
+instead of queueing behind the slow portal. Callers then serve stale cached
+data or a 503.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from ratelimit import TokenBucket
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Multiplicative decrease of the concurrency limit on a slow or failed request
+DECREASE_FACTOR = 0.7
+
+
+class UpstreamUnavailable(Exception):
+    """The guard refused a portal request (circuit open or no capacity in time)"""
+
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamGuard:
+    """Rate limit, adaptive concurrency limit and circuit breaker for one upstream"""
+
+    def __init__(self, rate: float = 0, burst: float = 1,
+                 max_concurrency: int = 32, min_concurrency: int = 2,
+                 latency_target: float = 2.0,
+                 failure_threshold: int = 5, open_seconds: float = 30,
+                 acquire_timeout: float = 5):
+        self.limiter = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.acquire_timeout = acquire_timeout
+
+        self.limit = float(max_concurrency)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_decrease = 0.0
+        self.rejected = 0
+        self.opened = 0
+
+    def _circuit(self, now: float) -> str:
+        # Callers hold self._cond
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a request slot (and a rate-limit token), waiting at most `timeout`
+        seconds (default acquire_timeout). Returns whether this request is the
+        half-open probe; pass that on to release().
+        """
+        try:
+            return self._acquire(self.acquire_timeout if timeout is None else timeout)
+        except UpstreamUnavailable:
+            with self._cond:
+                self.rejected += 1
+            raise
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """acquire() for the event loop: polls instead of blocking the loop thread"""
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            try:
+                return self._acquire(0)
+            except UpstreamUnavailable:
+                if self.state() == OPEN or time.monotonic() >= deadline:
+                    with self._cond:
+                        self.rejected += 1
+                    raise
+            await asyncio.sleep(0.01)
+
+    def _acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        probe = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                state = self._circuit(now)
+                if state == OPEN:
+                    raise UpstreamUnavailable('The EduSoft portal is unavailable (circuit open)',
+                                              self._opened_at + self.open_seconds - now)
+                if state == HALF_OPEN:
+                    if not self._probing:
+                        self._probing = probe = True
+                        break
+                elif self._in_flight < int(self.limit):
+                    break
+                if now >= deadline:
+                    raise UpstreamUnavailable('Too many requests waiting on the EduSoft portal')
+                self._cond.wait(deadline - now)
+            self._in_flight += 1
+
+        if self.limiter is not None and not self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            with self._cond:
+                self._in_flight -= 1
+                if probe:
+                    self._probing = False
+                self._cond.notify()
+            raise UpstreamUnavailable('EduSoft portal rate limit reached', 1 / self.limiter.rate)
+        return probe
+
+    def release(self, ok: bool, seconds: float, probe: bool = False):
+        """Record the outcome of a request started with acquire()"""
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            slow = seconds > self.latency_target
+
+            if not ok or slow:
+                # Cut back at most once per latency_target, not once per straggler
+                if now - self._last_decrease >= self.latency_target:
+                    self.limit = max(self.min_concurrency, self.limit * DECREASE_FACTOR)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            if probe:
+                self._probing = False
+                if ok:
+                    self._state = CLOSED
+                    self._failures = 0
+                else:
+                    self._open(now)
+            elif self._state == CLOSED:
+                self._failures = 0 if ok else self._failures + 1
+                if self._failures >= self.failure_threshold:
+                    self._open(now)
+            self._cond.notify_all()
+
+    def _open(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self.opened += 1
+
+    def state(self) -> str:
+        with self._cond:
+            return self._circuit(time.monotonic())
+
+    def is_open(self) -> bool:
+        """Whether requests are currently rejected without trying the portal"""
+        return self.state() == OPEN
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> Dict:
+        with self._cond:
+            now = time.monotonic()
+            state = self._circuit(now)
+            stats = {
+                'circuit': state,
+                'consecutive_failures': self._failures,
+                'concurrency_limit': int(self.limit),
+                'in_flight': self._in_flight,
+                'rejected': self.rejected,
+                'opened': self.opened
+            }
+            if state == OPEN:
+                stats['retry_in'] = round(self._opened_at + self.open_seconds - now, 1)
+        if self.limiter is not None:
+            stats['rate_tokens'] = round(self.limiter.available(), 1)
+        return stats
+
+
+_default_guard: Optional[UpstreamGuard] = None
+_default_guard_lock = threading.Lock()
+
+
+def default_guard() -> UpstreamGuard:
+    """The process-wide guard for the portal, configured from UPSTREAM_* variables"""
+    global _default_guard
+    with _default_guard_lock:
+        if _default_guard is None:
+            _default_guard = UpstreamGuard(
+                rate=float(os.environ.get('UPSTREAM_RATE', 0)),
+                burst=float(os.environ.get('UPSTREAM_BURST', 10)),
+                max_concurrency=int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 32)),
+                min_concurrency=int(os.environ.get('UPSTREAM_MIN_CONCURRENCY', 2)),
+                latency_target=float(os.environ.get('UPSTREAM_LATENCY_TARGET', 2.0)),
+                failure_threshold=int(os.environ.get('UPSTREAM_FAILURE_THRESHOLD', 5)),
+                open_seconds=float(os.environ.get('UPSTREAM_OPEN_SECONDS', 30)),
+                acquire_timeout=float(os.environ.get('UPSTREAM_ACQUIRE_TIMEOUT', 5))
+            )
+        return _default_guard